@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import time
+import socket
+import shutil
+import platform
+import tempfile
+import tracemalloc
+import subprocess
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+import synthetic
+from profiling import current_rss, peak_rss, release_memory, reset_peak_rss
+
+## ============================================================================================= ##
+
+BENCHMARKPATH = os.path.dirname(os.path.abspath(__file__))
+HISTORYFILE = os.path.join(BENCHMARKPATH, 'history.jsonl')
+
+SCALE = 'small' # key of SCALES
+CASES = None # names of the cases to run, None: all
+REPEATS = 3 # timed runs per case, the fastest counts; peak memory is taken from one extra run
+PROCESSES = 1 # worker processes of the parallel stages; 1 keeps timings comparable and memory traceable
+SEED = 0
+
+RECORD = True # append the results to HISTORYFILE
+CHECK = True # compare against the recorded runs and exit with status 1 on a regression
+
+## a case regresses if it is slower / needs more memory than the median of the last BASELINE_RUNS recorded runs
+## of the same scale on the same host by more than these fractions
+BASELINE_RUNS = 5
+TIME_TOLERANCE = 0.25
+MEMORY_TOLERANCE = 0.10
+
+## round-robin passes of the lasso imputation case; p01 allows up to 100, which rarely stop early on synthetic
+## data, a fixed small number keeps the case short and its timing comparable (each pass costs the same)
+IMPUTATION_ITERATIONS = 2
+
+SCALES = {\
+	'small': {'stations': 40, 'years': (2021, 2022), 'municipalities': 2000, 'projects': 5000, 'districts': 400, 'types': 39, 'bootstrap': 200},
+	'medium': {'stations': 150, 'years': (2016, 2023), 'municipalities': 11000, 'projects': 15000, 'districts': 400, 'types': 39, 'bootstrap': 1000},
+	'full': {'stations': 500, 'years': (2008, 2023), 'municipalities': 11000, 'projects': 30000, 'districts': 400, 'types': 39, 'bootstrap': 2000},
+	}
+
+## ============================================================================================= ##
+## cases: setup(workdir, scale) builds the synthetic inputs (not measured), run(state) is the measured hot path
+## and returns the number of rows it produced
+## ============================================================================================= ##
+
+def setup_parse(workdir, scale):
+	df_stations = synthetic.make_stations(scale['stations'], seed=SEED)
+	archivedir = os.path.join(workdir, 'archives')
+	filenames = synthetic.write_archives(archivedir, df_stations, scale['years'], seed=SEED)
+	return {'archives': [os.path.join(archivedir, f) for f in filenames]}
+
+def run_parse(state):
+	from dwd_parse import parse_archive
+
+	rows = 0
+	for archivefile in state['archives']:
+		with open(archivefile, 'rb') as f:
+			df, _ = parse_archive(f.read(), variable='air_temperature')
+		rows += len(df)
+	return rows
+
+def setup_merge(workdir, scale):
+	from station_store import write_station
+
+	storedir = os.path.join(workdir, 'store')
+	stations = synthetic.make_stations(scale['stations'], seed=SEED)['station'].values
+	if not os.path.isdir(storedir):
+		for station in stations:
+			write_station(storedir, 'air_temperature', station, synthetic.make_hourly(station, scale['years'], seed=SEED))
+	return {'store': storedir, 'stations': stations, 'years': scale['years']}
+
+def run_merge(state):
+	from daily import merge_stations
+
+	df = merge_stations(state['store'], 'air_temperature', state['stations'], ['TT_TU', 'RF_TU'],
+		years=state['years'], processes=PROCESSES)
+	return len(df)
+
+def setup_imputation(workdir, scale):
+	from station_cube import StationCube
+
+	df_stations = synthetic.make_stations(scale['stations'], seed=SEED)
+	df = synthetic.make_daily_panel(df_stations['station'].values, scale['years'], seed=SEED)
+	cube = StationCube.from_long(df, ['TT_TU', 'RF_TU'])
+	return {'pivot': cube.day_matrix('TT_TU'), 'stations': df_stations, 'modeldir': os.path.join(workdir, 'models')}
+
+def run_imputation(state):
+	from neighbour_imputation import NeighbourImputer
+
+	imputer = NeighbourImputer(state['modeldir'], selection='correlation', processes=PROCESSES)
+	df_imputed = imputer.fit(state['pivot'], state['stations'], refit=True).transform(state['pivot'])
+	return df_imputed.size
+
+def run_iterative_imputation(state):
+	import warnings
+	from sklearn.linear_model import LassoCV
+	from sklearn.experimental import enable_iterative_imputer
+	from sklearn.impute import IterativeImputer
+	from sklearn.exceptions import ConvergenceWarning
+	from imputation import transform_blocked
+
+	## as p01 with IMPUTATION_LASSO: fit on a 10% sample of the days, blocked transform of all days (fewer passes)
+	pivot = state['pivot']
+	rng = np.random.RandomState(SEED)
+	sampled = pivot.values[rng.choice(len(pivot), size=int(len(pivot) * 0.1), replace=False)]
+	imputer = IterativeImputer(estimator=LassoCV(cv=10, random_state=0, tol=1.e-2), max_iter=IMPUTATION_ITERATIONS, random_state=0)
+	with warnings.catch_warnings():
+		warnings.simplefilter('ignore', category=ConvergenceWarning)
+		imputer.fit(sampled)
+	return transform_blocked(imputer, pivot.values, progress=False).size
+
+def setup_weights(workdir, scale):
+	from boundaries import load_boundaries
+
+	shapefile = os.path.join(workdir, 'shapes', 'VG250_GEM.shp')
+	if not os.path.isfile(shapefile):
+		synthetic.write_municipalities(os.path.dirname(shapefile), scale['municipalities'], seed=SEED)
+	gdf = load_boundaries(shapefile, crs='EPSG:4326')
+	df_stations = synthetic.make_stations(scale['stations'], seed=SEED)
+	return {'lat': gdf['centroid_lat'].values, 'lon': gdf['centroid_lon'].values,
+		'station_lat': df_stations['lat'].values, 'station_lon': df_stations['lon'].values}
+
+def run_weights(state):
+	from weights import weight_matrix
+
+	weights = weight_matrix(state['lat'], state['lon'], state['station_lat'], state['station_lon'],
+		scheme='idw', cutoff=100., power=2., method='geodesic')
+	return weights.nnz
+
+def setup_aggregate(workdir, scale):
+	from aggregate import station_day_array
+	from weights import weight_matrix
+
+	state = setup_weights(workdir, scale)
+	weights = weight_matrix(state['lat'], state['lon'], state['station_lat'], state['station_lon'],
+		scheme='idw', cutoff=100., power=2., method='geodesic')
+
+	stations = synthetic.make_stations(scale['stations'], seed=SEED)['station'].values
+	df = synthetic.make_daily_panel(stations, scale['years'], seed=SEED)
+	values, days = station_day_array(df, stations, 'TT_TU')
+	return {'weights': weights, 'values': values, 'days': days, 'targets': np.arange(weights.shape[0]).astype(str),
+		'outpath': os.path.join(workdir, 'aggregated.parquet')}
+
+def run_aggregate(state):
+	from aggregate import aggregate_daily, apply_weights_masked
+
+	return aggregate_daily(state['weights'], {'TT_TU': state['values']}, state['days'], state['targets'], state['outpath'],
+		aggregate=apply_weights_masked)
+
+def setup_sequences(workdir, scale):
+	df = synthetic.make_nki(scale['projects'], scale['districts'], scale['types'], years=(2008, 2023), seed=SEED)
+	return {'df': df, 'bootstrap': scale['bootstrap']}
+
+def run_sequences(state):
+	from precedence import precedence_table, bootstrap_table
+
+	df_first = state['df'].groupby(['district_code', 'project_type'], observed=True)['year_start'].min().reset_index()
+	df_prob = precedence_table(df_first)
+	df_ci, _ = bootstrap_table(df_first, n_boot=state['bootstrap'], seed=SEED, processes=PROCESSES)
+	return df_prob.size + len(df_ci)
+
+## p00 parse, p01 daily merge and imputation, p02 weights and aggregation, NKI sequence analysis
+BENCHMARKS = {\
+	'p00_parse_archives': (setup_parse, run_parse),
+	'p01_daily_merge': (setup_merge, run_merge),
+	'p01_iterative_imputation': (setup_imputation, run_iterative_imputation),
+	'p01_neighbour_imputation': (setup_imputation, run_imputation),
+	'p02_weight_matrix': (setup_weights, run_weights),
+	'p02_aggregate_daily': (setup_aggregate, run_aggregate),
+	'nki_sequences': (setup_sequences, run_sequences),
+	}
+
+## ============================================================================================= ##
+
+def measure(run, state, repeats=REPEATS):
+	"""
+	(seconds, peak_mb, rows): fastest wall time of repeats runs and the peak memory of one additional run above
+	the memory in use before it. The peak is the resident set size (VmHWM) where it can be reset, which includes
+	allocations of pandas, pyarrow and other extensions; elsewhere the allocations traced by tracemalloc.
+	"""
+	seconds = []
+	for _ in range(repeats):
+		start_time = time.perf_counter()
+		rows = run(state)
+		seconds.append(time.perf_counter() - start_time)
+
+	release_memory()
+	if reset_peak_rss():
+		rss = current_rss()
+		run(state)
+		peak = peak_rss() - rss
+	else:
+		tracemalloc.start()
+		baseline = tracemalloc.get_traced_memory()[0]
+		run(state)
+		peak = tracemalloc.get_traced_memory()[1] - baseline
+		tracemalloc.stop()
+	return min(seconds), peak / 1024. ** 2, int(rows)
+
+def git_commit():
+	try:
+		return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCHMARKPATH,
+			capture_output=True, text=True, check=True).stdout.strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+def read_history(path=HISTORYFILE):
+	if not os.path.isfile(path):
+		return []
+	with open(path, 'r') as f:
+		return [json.loads(line) for line in f if line.strip()]
+
+def regressions(results, history, scale, host, baseline_runs=BASELINE_RUNS):
+	"""
+	Cases of results that exceed the median of the last baseline_runs matching runs in history by more than
+	TIME_TOLERANCE (seconds) or MEMORY_TOLERANCE (peak_mb). Returns a list of (case, metric, value, baseline).
+	"""
+	found = []
+	runs = [r for r in history if (r['scale'] == scale) and (r['host'] == host)]
+	for case, result in results.items():
+		previous = [r['cases'][case] for r in runs if case in r['cases']][-baseline_runs:]
+		if len(previous) == 0:
+			continue
+		for metric, tolerance in [('seconds', TIME_TOLERANCE), ('peak_mb', MEMORY_TOLERANCE)]:
+			baseline = float(np.median([p[metric] for p in previous]))
+			if result[metric] > baseline * (1. + tolerance):
+				found.append((case, metric, result[metric], baseline))
+	return found
+
+## ============================================================================================= ##
+
+scale = SCALES[SCALE]
+host = socket.gethostname()
+workdir = tempfile.mkdtemp(prefix='geoclip_benchmarks_')
+
+results = {}
+try:
+	for case, (setup, run) in BENCHMARKS.items():
+		if (CASES is not None) and (case not in CASES):
+			continue
+		state = setup(workdir, scale)
+		seconds, peak_mb, rows = measure(run, state)
+		results[case] = {'seconds': seconds, 'peak_mb': peak_mb, 'rows': rows}
+		print('{0:28s} {1:9.3f} s {2:9.1f} MB {3:12d} rows'.format(case, seconds, peak_mb, rows))
+finally:
+	shutil.rmtree(workdir, ignore_errors=True)
+
+## ============================================================================================= ##
+
+history = read_history()
+found = regressions(results, history, SCALE, host) if CHECK == True else []
+
+if RECORD == True:
+	record = {\
+		'time': pd.Timestamp.now().isoformat(timespec='seconds'),
+		'commit': git_commit(),
+		'host': host,
+		'cpus': os.cpu_count(),
+		'python': platform.python_version(),
+		'numpy': np.__version__,
+		'pandas': pd.__version__,
+		'scale': SCALE,
+		'parameters': scale,
+		'repeats': REPEATS,
+		'processes': PROCESSES,
+		'cases': results,
+		}
+	with open(HISTORYFILE, 'a') as f:
+		f.write(json.dumps(record) + '\n')
+
+for case, metric, value, baseline in found:
+	print('REGRESSION {0:s} {1:s}: {2:.3f} vs. baseline {3:.3f}'.format(case, metric, value, baseline))
+if len(found) > 0:
+	sys.exit(1)
@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import io
+import os
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+## ============================================================================================= ##
+
+## extent of the synthetic municipalities and stations in EPSG:25832 (roughly Germany)
+EXTENT = (280000., 5235000., 920000., 6100000.)
+
+## share of missing (-999) hourly values and of station-days missing from the daily panel
+MISSING_FRACTION = 0.02
+
+## ============================================================================================= ##
+
+def hourly_times(years):
+	"""
+	All hours of the years (first, last) as int32 YYYYMMDDHH.
+	"""
+	t = np.arange('{0:d}-01-01T00'.format(years[0]), '{0:d}-01-01T00'.format(years[-1] + 1), dtype='datetime64[h]')
+	return pd.DatetimeIndex(t).strftime('%Y%m%d%H').astype(np.int32).values
+
+def daily_times(years):
+	"""
+	All days of the years (first, last) as int32 YYYYMMDD.
+	"""
+	t = np.arange('{0:d}-01-01'.format(years[0]), '{0:d}-01-01'.format(years[-1] + 1), dtype='datetime64[D]')
+	return pd.DatetimeIndex(t).strftime('%Y%m%d').astype(np.int32).values
+
+def _seasonal(times, rng, daily=False):
+	"""
+	Temperature with an annual and (for hourly data) a diurnal cycle plus noise.
+	"""
+	doy = (times // (1 if daily else 100)) % 10000
+	phase = 2. * np.pi * ((doy // 100 - 1) * 30.5 + doy % 100) / 365.25
+	temperature = 9. - 9. * np.cos(phase) + rng.normal(0., 2.5, times.size)
+	if not daily:
+		temperature += -3. * np.cos(2. * np.pi * (times % 100) / 24.)
+	return temperature
+
+## ============================================================================================= ##
+
+def make_stations(n_stations, seed=0):
+	"""
+	stations.csv layout (station, lon, lat, elevation, name) with stations spread uniformly over EXTENT.
+	"""
+	from pyproj import Transformer
+
+	rng = np.random.default_rng(seed)
+	x = rng.uniform(EXTENT[0], EXTENT[2], n_stations)
+	y = rng.uniform(EXTENT[1], EXTENT[3], n_stations)
+	lon, lat = Transformer.from_crs('EPSG:25832', 'EPSG:4326', always_xy=True).transform(x, y)
+	return pd.DataFrame({\
+		'station': np.arange(1, n_stations + 1) * 7,
+		'lon': np.round(lon, 4),
+		'lat': np.round(lat, 4),
+		'elevation': rng.integers(0, 1500, n_stations),
+		'name': ['Station {0:d}'.format(s) for s in np.arange(1, n_stations + 1) * 7],
+		})
+
+def make_archive(station, years, lat=50., lon=10., seed=0):
+	"""
+	Bytes of a DWD-style hourly air temperature archive (stundenwerte_TU_<id>_*.zip) of one station with
+	a produkt_ and a Metadaten_Geographie_ member, as parse_archive reads them.
+	"""
+	rng = np.random.default_rng(seed + int(station))
+	times = hourly_times(years)
+	temperature = np.round(_seasonal(times, rng), 1)
+	humidity = np.round(np.clip(rng.normal(75., 12., times.size), 5., 100.), 0)
+	temperature[rng.random(times.size) < MISSING_FRACTION] = -999.
+	humidity[rng.random(times.size) < MISSING_FRACTION] = -999.
+
+	product = pd.DataFrame({\
+		'STATIONS_ID': np.full(times.size, station),
+		'MESS_DATUM': times,
+		'QN_9': np.full(times.size, 3),
+		'TT_TU': temperature,
+		'RF_TU': humidity,
+		'eor': 'eor',
+		})
+	geography = pd.DataFrame({\
+		'Stations_id': [station],
+		'Stationshoehe': [100],
+		'Geogr.Breite': [lat],
+		'Geogr.Laenge': [lon],
+		'von_datum': [times[0] // 100],
+		'bis_datum': [''],
+		'Stationsname': ['Station {0:d}'.format(int(station))],
+		})
+
+	period = '{0:d}_{1:d}_{2:05d}'.format(times[0] // 100, times[-1] // 100, int(station))
+	buffer = io.BytesIO()
+	with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+		archive.writestr('produkt_tu_stunde_{0:s}.txt'.format(period), product.to_csv(sep=';', index=False))
+		archive.writestr('Metadaten_Geographie_{0:05d}.txt'.format(int(station)), geography.to_csv(sep=';', index=False).encode('latin-1'))
+	return buffer.getvalue()
+
+def write_archives(outdir, df_stations, years, seed=0):
+	"""
+	One archive per station in outdir, named as on opendata.dwd.de. Returns the file names.
+	"""
+	os.makedirs(outdir, exist_ok=True)
+	filenames = []
+	for station, lat, lon in df_stations.loc[:, ['station', 'lat', 'lon']].itertuples(index=False):
+		filename = 'stundenwerte_TU_{0:05d}_hist.zip'.format(int(station))
+		with open(os.path.join(outdir, filename), 'wb') as f:
+			f.write(make_archive(int(station), years, lat=lat, lon=lon, seed=seed))
+		filenames.append(filename)
+	return filenames
+
+def make_hourly(station, years, seed=0):
+	"""
+	Hourly table of one station in the station store layout (datetime YYYYMMDDHH, QN_9, TT_TU, RF_TU).
+	"""
+	rng = np.random.default_rng(seed + int(station))
+	times = hourly_times(years)
+	df = pd.DataFrame({\
+		'datetime': times,
+		'QN_9': np.full(times.size, 3, dtype=np.int8),
+		'TT_TU': _seasonal(times, rng).astype(np.float32),
+		'RF_TU': np.clip(rng.normal(75., 12., times.size), 5., 100.).astype(np.float32),
+		})
+	for column in ['TT_TU', 'RF_TU']:
+		df.loc[rng.random(times.size) < MISSING_FRACTION, column] = -999.
+	return df
+
+def make_daily_panel(stations, years, seed=0):
+	"""
+	Daily means in the layout of dwd_cdc_hourly_<years>_<variable>_daymean.csv (station, datetime YYYYMMDD,
+	TT_TU, RF_TU). Neighbouring stations share a common regional signal, so they are correlated as in the
+	real network; MISSING_FRACTION of all station-days are dropped.
+	"""
+	rng = np.random.default_rng(seed)
+	stations = np.asarray(stations)
+	days = daily_times(years)
+	common = _seasonal(days, rng, daily=True)
+
+	station_index = np.repeat(np.arange(stations.size), days.size)
+	temperature = np.tile(common, stations.size) + rng.normal(0., 1., stations.size)[station_index] + rng.normal(0., 1., station_index.size)
+	df = pd.DataFrame({\
+		'station': stations[station_index],
+		'datetime': np.tile(days, stations.size),
+		'TT_TU': temperature,
+		'RF_TU': np.clip(rng.normal(75., 8., station_index.size), 5., 100.),
+		})
+	return df.loc[rng.random(len(df)) >= MISSING_FRACTION, :].reset_index(drop=True)
+
+## ============================================================================================= ##
+
+def make_municipalities(n_municipalities, seed=0):
+	"""
+	VG250_GEM-like GeoDataFrame in EPSG:25832: a gap-free tiling of EXTENT into about n_municipalities
+	quadrilaterals from a jittered lattice, with hierarchical AGS codes (LAN 2, RBZ 1, KRS 2, GEM 3 digits),
+	ARS, GEN and GF columns.
+	"""
+	import geopandas as gpd
+	import shapely
+
+	rng = np.random.default_rng(seed)
+	nx = max(1, int(round(np.sqrt(n_municipalities * (EXTENT[2] - EXTENT[0]) / (EXTENT[3] - EXTENT[1])))))
+	ny = max(1, int(round(n_municipalities / nx)))
+	x = np.linspace(EXTENT[0], EXTENT[2], nx + 1)
+	y = np.linspace(EXTENT[1], EXTENT[3], ny + 1)
+	X, Y = np.meshgrid(x, y, indexing='ij')
+
+	## interior lattice points are moved by up to a quarter cell, outer edges stay straight
+	dx, dy = x[1] - x[0], y[1] - y[0]
+	X[1:-1, :] += rng.uniform(-0.25, 0.25, (nx - 1, ny + 1)) * dx
+	Y[:, 1:-1] += rng.uniform(-0.25, 0.25, (nx + 1, ny - 1)) * dy
+
+	i, j = np.meshgrid(np.arange(nx), np.arange(ny), indexing='ij')
+	i, j = i.ravel(), j.ravel()
+	corners = np.stack([\
+		np.stack([X[i, j], Y[i, j]], axis=1),
+		np.stack([X[i + 1, j], Y[i + 1, j]], axis=1),
+		np.stack([X[i + 1, j + 1], Y[i + 1, j + 1]], axis=1),
+		np.stack([X[i, j + 1], Y[i, j + 1]], axis=1),
+		np.stack([X[i, j], Y[i, j]], axis=1),
+		], axis=1)
+	geometry = shapely.polygons(corners)
+
+	## blocks of neighbouring cells form the levels: 16 states, 2 districts per state, 8 counties per district
+	lan = (i * 4 // nx) * 4 + (j * 4 // ny) + 1
+	rbz = ((j * 8 // ny) % 2) + 1
+	krs = ((i * 32 // nx) % 8) + 1
+	codes = pd.DataFrame({'lan': lan, 'rbz': rbz, 'krs': krs})
+	gem = codes.groupby(['lan', 'rbz', 'krs']).cumcount().values + 1
+	ags = np.char.add(np.char.add(np.char.add(
+		np.char.zfill(lan.astype(str), 2), rbz.astype(str)), np.char.zfill(krs.astype(str), 2)), np.char.zfill(gem.astype(str), 3))
+	## ARS: county, four-digit municipal association (groups of four municipalities), municipality
+	vwg = (gem - 1) // 4 + 1
+	ars = np.array([a[:5] + '{0:04d}'.format(v) + a[5:] for a, v in zip(ags, vwg)])
+
+	return gpd.GeoDataFrame({\
+		'AGS': ags,
+		'ARS': ars,
+		'AGS_0': ags,
+		'GEN': ['Gemeinde {0:s}'.format(a) for a in ags],
+		'GF': np.full(ags.size, 4),
+		}, geometry=geometry, crs='EPSG:25832')
+
+def write_municipalities(outdir, n_municipalities, seed=0, filename='VG250_GEM.shp'):
+	"""
+	make_municipalities written as shapefile to outdir, the form load_boundaries reads. Returns the path.
+	"""
+	os.makedirs(outdir, exist_ok=True)
+	path = os.path.join(outdir, filename)
+	make_municipalities(n_municipalities, seed=seed).to_file(path)
+	return path
+
+## ============================================================================================= ##
+
+def make_nki(n_projects, n_districts, n_types, years=(2008, 2023), seed=0):
+	"""
+	Typed NKI funding list as returned by load_nki (district_code, project_type, year_start, project_size).
+	Project types have skewed popularities and a type-specific typical start year, so precedence relations
+	are not pure noise.
+	"""
+	rng = np.random.default_rng(seed)
+	popularity = rng.dirichlet(np.full(n_types, 0.5))
+	onset = rng.uniform(years[0], years[-1], n_types)
+	types = rng.choice(n_types, size=n_projects, p=popularity)
+	year = np.clip(np.round(onset[types] + rng.normal(0., 3., n_projects)), years[0], years[-1]).astype(np.int16)
+	return pd.DataFrame({\
+		'district_code': pd.Categorical(np.char.zfill(rng.integers(1, n_districts + 1, n_projects).astype(str), 8)),
+		'project_type': pd.Categorical(['Type {0:02d}'.format(t) for t in types]),
+		'year_start': year,
+		'project_size': rng.lognormal(4., 1., n_projects),
+		})
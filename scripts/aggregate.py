@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from weights import apply_weights
+from matrix_cache import content_hash
+
+## ============================================================================================= ##
+
+## number of days multiplied with the weight matrix at once (chunks never span more than one year)
+CHUNK_DAYS = 366
+
+## ============================================================================================= ##
+
+def station_day_array(df, stations, value_column, days=None, dims=('station', 'datetime'), dtype=np.float32):
+	"""
+	Pivot a long table (one row per station and day) into an array of shape (len(stations), len(days)).
+	Rows are placed by integer position, stations or days not present in df stay NaN.
+	"""
+	station_col, day_col = dims
+	stations = np.asarray(stations)
+	if days is None:
+		days = np.sort(df[day_col].unique())
+	days = np.asarray(days)
+
+	i = pd.Index(stations).get_indexer(df[station_col].values)
+	j = pd.Index(days).get_indexer(df[day_col].values)
+	valid = (i >= 0) & (j >= 0)
+
+	values = np.full((stations.size, days.size), np.nan, dtype=dtype)
+	values[i[valid], j[valid]] = df[value_column].values[valid]
+	return values, days
+
+def day_chunks(days, chunk_days=CHUNK_DAYS):
+	"""
+	Slices over a sorted YYYYMMDD day axis that stay within one year and hold at most chunk_days days.
+	"""
+	years = np.asarray(days) // 10000
+	bounds = np.flatnonzero(np.diff(years)) + 1
+	starts, stops = np.r_[0, bounds], np.r_[bounds, len(years)]
+	for start, stop in zip(starts, stops):
+		for s in range(start, stop, chunk_days):
+			yield int(years[start]), slice(s, min(s + chunk_days, stop))
+
+def apply_weights_masked(weights, values):
+	"""
+	Weighted averages renormalized over the stations that reported: (W @ (X * mask)) / (W @ mask) for every
+	column of values (n_stations, n_timesteps), with mask marking non-NaN values. Targets without any
+	reporting station in reach are NaN.
+	"""
+	values = np.asarray(values)
+	mask = ~np.isnan(values)
+	numerator = weights @ np.where(mask, values, 0.)
+	denominator = weights @ mask.astype(values.dtype)
+	with np.errstate(invalid='ignore', divide='ignore'):
+		return np.where(denominator > 0., numerator / denominator, np.nan)
+
+## ============================================================================================= ##
+
+def write_chunk(outpath, year, n, targets, days, results, target_column='AGS'):
+	"""
+	Write one aggregated time chunk ({value_column: array (n_targets, n_days)}) as long table (target, datetime,
+	values...) to outpath/year=YYYY/part-NNNN.parquet. Returns the number of rows written.
+	"""
+	import pyarrow as pa
+	import pyarrow.parquet as pq
+
+	targets = np.asarray(targets)
+	days = np.asarray(days, dtype=np.int32)
+	columns = {\
+		target_column: pa.array(np.repeat(targets, days.size)),
+		'datetime': pa.array(np.tile(days, targets.size)),
+		}
+	for value_column, result in results.items():
+		columns[value_column] = pa.array(np.asarray(result, dtype=np.float32).ravel())
+
+	partition = os.path.join(outpath, 'year={0:d}'.format(int(year)))
+	os.makedirs(partition, exist_ok=True)
+	pq.write_table(pa.table(columns), os.path.join(partition, 'part-{0:04d}.parquet'.format(n)))
+	return targets.size * days.size
+
+def clear_partitions(outpath, years=None):
+	"""
+	Remove the whole panel at outpath, or only the given year partitions.
+	"""
+	if years is None:
+		shutil.rmtree(outpath, ignore_errors=True)
+	else:
+		for year in years:
+			shutil.rmtree(os.path.join(outpath, 'year={0:d}'.format(int(year))), ignore_errors=True)
+
+def aggregate_daily(weights, arrays, days, targets, outpath, target_column='AGS', chunk_days=CHUNK_DAYS, aggregate=apply_weights, years=None):
+	"""
+	Aggregate station-by-day arrays ({value_column: array (n_stations, n_days)}) to targets-by-day with the
+	weight matrix (n_targets, n_stations), one time chunk at a time. Every chunk is written as long table
+	(target, datetime, values...) to a Parquet dataset partitioned by year (outpath/year=YYYY/part-NNNN.parquet),
+	so the full panel is never held in memory. With years given, only these partitions are rewritten and all
+	others are kept. Returns the number of rows written.
+	"""
+	targets = np.asarray(targets)
+	days = np.asarray(days, dtype=np.int32)
+	nrows = 0
+
+	clear_partitions(outpath, years)
+
+	for n, (year, chunk) in enumerate(day_chunks(days, chunk_days)):
+
+		if (years is not None) and (year not in years):
+			continue
+
+		results = {value_column: aggregate(weights, values[:, chunk]) for value_column, values in arrays.items()}
+		nrows += write_chunk(outpath, year, n, targets, days[chunk], results, target_column=target_column)
+
+	return nrows
+
+def read_daily(outpath, columns=None, years=None, targets=None, target_column='AGS'):
+	"""
+	Read (parts of) an aggregated panel written by aggregate_daily, filters are pushed down to the year
+	partitions and row groups.
+	"""
+	import pyarrow.dataset as ds
+
+	dataset = ds.dataset(outpath, format='parquet', partitioning='hive')
+	expression = None
+	if years is not None:
+		expression = ds.field('year').isin(list(years))
+	if targets is not None:
+		e = ds.field(target_column).isin(list(targets))
+		expression = e if expression is None else expression & e
+	return dataset.to_table(columns=columns, filter=expression).to_pandas()
+
+## ============================================================================================= ##
+
+def input_keys(arrays, days, setup=None):
+	"""
+	Content keys of the input of a panel: {'setup': key of setup (anything else the panel depends on, e.g.
+	imputation and weights), 'years': {year: key of the station x day arrays of that year}}. Compared with the
+	keys stored by the last run (see stale_years), they tell which year partitions are out of date.
+	"""
+	days = np.asarray(days)
+	years = days // 10000
+	keys = {}
+	for year in np.unique(years):
+		first, last = np.searchsorted(years, year), np.searchsorted(years, year, side='right')
+		keys[str(year)] = content_hash(days[first:last], [np.asarray(arrays[v][:, first:last]) for v in sorted(arrays)])
+	return {'setup': content_hash(setup), 'years': keys}
+
+def _keyfile(outpath):
+	return outpath.rstrip('/').rstrip(os.sep) + '.inputs.json'
+
+def read_input_keys(outpath):
+	try:
+		with open(_keyfile(outpath), 'r') as f:
+			return json.load(f)
+	except (OSError, ValueError):
+		return None
+
+def write_input_keys(outpath, keys):
+	with open(_keyfile(outpath) + '.tmp', 'w') as f:
+		json.dump(keys, f, indent=1, sort_keys=True)
+	os.replace(_keyfile(outpath) + '.tmp', _keyfile(outpath))
+
+def stale_years(outpath, keys):
+	"""
+	Years of the panel at outpath whose input changed since the keys stored with it, None (everything) if the
+	panel or its keys are missing or the setup changed.
+	"""
+	previous = read_input_keys(outpath)
+	if (previous is None) or (not os.path.isdir(outpath)) or (previous.get('setup') != keys['setup']):
+		return None
+	return [int(y) for y, key in sorted(keys['years'].items()) if previous['years'].get(y) != key]
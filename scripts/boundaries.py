@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+
+from matrix_cache import content_hash, KEY_LENGTH
+
+## ============================================================================================= ##
+
+## VG250/VG5000 are distributed in ETRS89 / UTM zone 32N; centroids and areas are always taken in this CRS
+BOUNDARY_CRS = 'EPSG:25832'
+
+## attribute columns kept if none are requested
+DEFAULT_COLUMNS = ['AGS', 'ARS', 'AGS_0', 'GEN', 'GF']
+
+## added by load_boundaries: centroids (projected and geographic) and bounding box in the output CRS
+CENTROID_COLUMNS = ['centroid_x', 'centroid_y', 'centroid_lon', 'centroid_lat']
+BBOX_COLUMNS = ['minx', 'miny', 'maxx', 'maxy']
+
+## ============================================================================================= ##
+
+def _source_signature(path):
+	"""
+	Size and modification time of all files of a shapefile; a changed layer changes the cache key without the
+	files being read.
+	"""
+	stem = os.path.splitext(path)[0]
+	directory = os.path.dirname(path) or '.'
+	signature = []
+	for f in sorted(os.listdir(directory)):
+		if os.path.splitext(os.path.join(directory, f))[0] == stem:
+			stat = os.stat(os.path.join(directory, f))
+			signature.append((f, stat.st_size, stat.st_mtime_ns))
+	return signature
+
+def cache_path(path, crs=BOUNDARY_CRS, columns=None, cachedir=None):
+	columns = DEFAULT_COLUMNS if columns is None else list(columns)
+	cachedir = os.path.join(os.path.dirname(path) or '.', 'cache') if cachedir is None else cachedir
+	key = content_hash(_source_signature(path), crs, columns)
+	name = os.path.splitext(os.path.basename(path))[0]
+	return os.path.join(cachedir, '{0:s}-{1:s}.parquet'.format(name, key[:KEY_LENGTH]))
+
+def build_boundaries(path, crs=BOUNDARY_CRS, columns=None):
+	"""
+	Read a boundary layer with the requested attribute columns and add centroids computed in BOUNDARY_CRS (as
+	x/y there and as lon/lat) and the bounding box of every geometry in crs.
+	"""
+	import geopandas as gpd
+
+	columns = DEFAULT_COLUMNS if columns is None else list(columns)
+	gdf = gpd.read_file(path)
+	gdf = gdf.loc[:, [c for c in columns if c in gdf.columns] + ['geometry']].to_crs(BOUNDARY_CRS)
+
+	centroids = gdf.geometry.centroid
+	gdf['centroid_x'] = centroids.x.values
+	gdf['centroid_y'] = centroids.y.values
+	centroids = centroids.to_crs('EPSG:4326')
+	gdf['centroid_lon'] = centroids.x.values
+	gdf['centroid_lat'] = centroids.y.values
+
+	gdf = gdf.to_crs(crs)
+	gdf[BBOX_COLUMNS] = gdf.geometry.bounds.values
+	return gdf
+
+def load_boundaries(path, crs=BOUNDARY_CRS, columns=None, cachedir=None, bbox=None):
+	"""
+	Boundary layer (e.g. VG250_GEM.shp) in crs with the requested attribute columns, centroid and bbox columns.
+	The first call converts the shapefile into GeoParquet (with a covering bbox column for spatial filtering) in
+	cachedir, later calls only read that file. bbox (minx, miny, maxx, maxy in crs) reads only the intersecting
+	geometries. The spatial index (gdf.sindex) is built on first use.
+	"""
+	import geopandas as gpd
+
+	cachefile = cache_path(path, crs=crs, columns=columns, cachedir=cachedir)
+	if not os.path.isfile(cachefile):
+		gdf = build_boundaries(path, crs=crs, columns=columns)
+		os.makedirs(os.path.dirname(cachefile), exist_ok=True)
+		gdf.to_parquet(cachefile + '.tmp', write_covering_bbox=True)
+		os.replace(cachefile + '.tmp', cachefile)
+
+	gdf = gpd.read_parquet(cachefile, bbox=bbox)
+	return gdf.drop(columns=['bbox'], errors='ignore')
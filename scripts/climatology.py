@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from linking import WindowPanel
+
+## ============================================================================================= ##
+
+## days on either side of a day of year that enter its climatology
+DOY_WINDOW = 7
+QUANTILES = [0.1, 0.5, 0.9]
+
+## first day of every month in a leap year, so 29 February keeps its own day of year
+_MONTH_OFFSETS = np.cumsum([0, 31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30])
+NDOY = 366
+
+## ============================================================================================= ##
+
+def day_of_year(days):
+	"""
+	Day of year (0 ... 365) on a leap-year calendar for datetime64[D] days, 1 March is 60 in every year.
+	"""
+	days = pd.DatetimeIndex(np.asarray(days, dtype='datetime64[D]'))
+	return _MONTH_OFFSETS[days.month.values - 1] + days.day.values - 1
+
+class Climatology:
+	"""
+	Day-of-year means and quantiles per unit (e.g. AGS) over a reference period, each day of year pooling the
+	reference years' days within +-window days. Computed once from the unit x day panel and stored memory-mapped
+	(mean.npy, quantiles.npy, meta.json), anomalies and exceedances of any panel are then plain comparisons
+	against the stored arrays.
+	"""
+
+	def __init__(self, units, mean, quantiles, probs, reference_years, window, path=None):
+		self.units = pd.Index(np.asarray(units))
+		self.mean = mean
+		self.quantiles = quantiles
+		self.probs = [float(p) for p in probs]
+		self.reference_years = [int(y) for y in reference_years]
+		self.window = int(window)
+		self.path = path
+
+	@classmethod
+	def compute(cls, units, first_day, values, reference_years, window=DOY_WINDOW, probs=QUANTILES):
+		"""
+		Climatology from a panel array (n_units, n_days) over consecutive days from first_day (see panel_array),
+		reference_years as (first, last) inclusive.
+		"""
+		days = np.datetime64(first_day, 'D') + np.arange(values.shape[1])
+		years = days.astype('datetime64[Y]').astype(np.int64) + 1970
+		reference = np.flatnonzero((years >= reference_years[0]) & (years <= reference_years[1]))
+		doy = day_of_year(days[reference])
+
+		mean = np.full((len(units), NDOY), np.nan, dtype=np.float32)
+		quantiles = np.full((len(probs), len(units), NDOY), np.nan, dtype=np.float32)
+		with warnings.catch_warnings():
+			warnings.simplefilter('ignore', category=RuntimeWarning)
+			for d in range(NDOY):
+				distance = np.abs(doy - d)
+				cols = reference[np.minimum(distance, NDOY - distance) <= window]
+				if cols.size == 0:
+					continue
+				sample = values[:, cols]
+				mean[:, d] = np.nanmean(sample, axis=1)
+				quantiles[:, :, d] = np.nanquantile(sample, probs, axis=1)
+
+		return cls(units, mean, quantiles, probs, range(reference_years[0], reference_years[1] + 1), window)
+
+	## =============================== ##
+
+	def save(self, path):
+		"""
+		Arrays and units (with their dtype, object strings as fixed-width unicode) as .npy, the rest in meta.json.
+		"""
+		os.makedirs(path, exist_ok=True)
+		units = np.asarray(self.units)
+		np.save(os.path.join(path, 'units.npy'), units.astype(str) if units.dtype == object else units)
+		np.save(os.path.join(path, 'mean.npy'), self.mean)
+		np.save(os.path.join(path, 'quantiles.npy'), self.quantiles)
+		with open(os.path.join(path, 'meta.json'), 'w') as f:
+			json.dump({'probs': self.probs, 'reference_years': self.reference_years, 'window': self.window}, f)
+		self.path = path
+
+	@classmethod
+	def open(cls, path):
+		with open(os.path.join(path, 'meta.json'), 'r') as f:
+			meta = json.load(f)
+		units = np.load(os.path.join(path, 'units.npy')) if os.path.isfile(os.path.join(path, 'units.npy')) else meta['units']
+		mean = np.load(os.path.join(path, 'mean.npy'), mmap_mode='r')
+		quantiles = np.load(os.path.join(path, 'quantiles.npy'), mmap_mode='r')
+		return cls(units, mean, quantiles, meta['probs'], meta['reference_years'], meta['window'], path=path)
+
+	## =============================== ##
+
+	def _align(self, units, first_day, ndays):
+		i = self.units.get_indexer(np.asarray(units))
+		if (i < 0).any():
+			raise KeyError('Units without climatology: {0:d}'.format(int((i < 0).sum())))
+		doy = day_of_year(np.datetime64(first_day, 'D') + np.arange(ndays))
+		return i, doy
+
+	def anomalies(self, units, first_day, values):
+		"""
+		Deviation of a panel array (n_units, n_days) from the day-of-year mean.
+		"""
+		i, doy = self._align(units, first_day, values.shape[1])
+		return values - self.mean[i][:, doy]
+
+	def exceedances(self, units, first_day, values, prob=0.9):
+		"""
+		1 where a panel value exceeds the day-of-year quantile prob, 0 where not, NaN where the value or the
+		quantile (no reference data for the unit and day of year) is missing.
+		"""
+		i, doy = self._align(units, first_day, values.shape[1])
+		threshold = self.quantiles[self.probs.index(float(prob))][i][:, doy]
+		return np.where(np.isnan(values) | np.isnan(threshold), np.nan, (values > threshold).astype(np.float64))
+
+	def anomaly_panel(self, units, first_day, values):
+		"""
+		WindowPanel of anomalies: mean anomaly over any date window as one lookup.
+		"""
+		return WindowPanel(units, first_day, self.anomalies(units, first_day, values))
+
+	def exceedance_panel(self, units, first_day, values, prob=0.9):
+		"""
+		WindowPanel of exceedances: number ('sum') or share ('mean') of days above the quantile in any window.
+		"""
+		return WindowPanel(units, first_day, self.exceedances(units, first_day, values, prob=prob))
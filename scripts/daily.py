@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import station_store
+
+## ============================================================================================= ##
+
+MISSING_VALUE = -999.
+
+## the pipeline scripts run at module level, so workers are forked instead of re-importing __main__
+MP_CONTEXT = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else None
+
+## ============================================================================================= ##
+
+def daily_means(df, value_columns, complete_column='TT_TU', nobs=24, years=None):
+	"""
+	Daily means of hourly values (datetime as integer YYYYMMDDHH) for one station. Only days with exactly nobs
+	valid hourly values of complete_column are kept; all date handling is integer arithmetic on whole arrays.
+	Returns columns datetime (YYYYMMDD) and value_columns.
+	"""
+	date = df['datetime'].values.astype(np.int64) // 100
+	if years is not None:
+		year = date // 10000
+		keep = (year >= years[0]) & (year <= years[-1])
+		df, date = df.loc[keep, :], date[keep]
+
+	days, inverse = np.unique(date, return_inverse=True)
+
+	def valid_values(column):
+		values = df[column].values.astype(np.float64)
+		values[values == MISSING_VALUE] = np.nan
+		return values, ~np.isnan(values)
+
+	_, valid = valid_values(complete_column)
+	complete = np.bincount(inverse, weights=valid, minlength=days.size) == nobs
+
+	result = {'datetime': days.astype(np.int32)}
+	for column in value_columns:
+		values, valid = valid_values(column)
+		sums = np.bincount(inverse, weights=np.where(valid, values, 0.), minlength=days.size)
+		counts = np.bincount(inverse, weights=valid, minlength=days.size)
+		with np.errstate(invalid='ignore', divide='ignore'):
+			result[column] = sums / counts
+
+	return pd.DataFrame(result).loc[complete, :].reset_index(drop=True)
+
+def _station_daily_means(args):
+	root, variable, station, value_columns, complete_column, years, start = args
+	start_time = time.perf_counter()
+	columns = list(dict.fromkeys(list(value_columns) + [complete_column]))
+	first_year = years[0] if start is None else max(years[0], start // 10000)
+	df = station_store.read(root, variable, stations=[station], years=range(first_year, years[-1] + 1), columns=columns)
+	nhours = len(df)
+	if start is not None:
+		df = df.loc[df['datetime'].values // 100 >= start, :]
+	df = daily_means(df, value_columns, complete_column=complete_column, years=years)
+	df.insert(0, 'station', np.int32(station))
+	return df, {'seconds': time.perf_counter() - start_time, 'rows': nhours}
+
+def merge_stations(root, variable, stations, value_columns, years, complete_column='TT_TU', start=None, processes=None, timings=None):
+	"""
+	Daily means for all stations from the station store, computed in parallel worker processes and gathered
+	with one concatenation. start ({station: YYYYMMDD}) limits stations to the days from that date onwards.
+	A dict passed as timings receives {station: {'seconds', 'rows'}} (time and hourly rows read per station).
+	"""
+	processes = processes or os.cpu_count()
+	start = start or {}
+	tasks = [(root, variable, int(s), list(value_columns), complete_column, tuple(years), start.get(s)) for s in stations]
+	if len(tasks) == 0:
+		return pd.DataFrame(columns=['station', 'datetime'] + list(value_columns))
+	if processes == 1:
+		results = list(map(_station_daily_means, tasks))
+	else:
+		with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context(MP_CONTEXT)) as executor:
+			results = list(executor.map(_station_daily_means, tasks, chunksize=max(1, len(tasks) // (4 * processes))))
+	if timings is not None:
+		timings.update({task[2]: timing for task, (_, timing) in zip(tasks, results)})
+	return pd.concat([df for df, _ in results], axis=0, ignore_index=True)
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+## ============================================================================================= ##
+
+## WGS84 ellipsoid (same as geopy's default for geodesic)
+WGS84_A = 6378137.0
+WGS84_F = 1. / 298.257223563
+WGS84_B = WGS84_A * (1. - WGS84_F)
+
+## mean earth radius (IUGG) used by the haversine mode
+EARTH_RADIUS_KM = 6371.0088
+
+## rows of the first point set processed at once, bounds the size of temporary arrays
+CHUNK_SIZE = 2048
+
+## ============================================================================================= ##
+
+def haversine(lat1, lon1, lat2, lon2):
+	"""
+	Great-circle distance in km on a sphere of radius EARTH_RADIUS_KM. All inputs in degrees, broadcastable.
+	Deviates from the ellipsoidal distance by up to ~0.5 %.
+	"""
+	lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+	a = np.sin((lat2 - lat1) / 2.) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2.) ** 2
+	return 2. * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0., 1.)))
+
+def vincenty(lat1, lon1, lat2, lon2, tol=1.e-12, max_iter=200):
+	"""
+	Ellipsoidal (WGS84) distance in km after Vincenty's inverse formula, evaluated on whole arrays. All inputs
+	in degrees, broadcastable. For non-antipodal points (anything within Germany and its surroundings) the result
+	agrees with geopy.distance.geodesic (Karney) to better than 1 mm; pairs that do not converge are returned as NaN.
+	"""
+	lat1, lon1, lat2, lon2 = np.broadcast_arrays(*map(np.radians, (lat1, lon1, lat2, lon2)))
+
+	L = lon2 - lon1
+	U1 = np.arctan((1. - WGS84_F) * np.tan(lat1))
+	U2 = np.arctan((1. - WGS84_F) * np.tan(lat2))
+	sinU1, cosU1 = np.sin(U1), np.cos(U1)
+	sinU2, cosU2 = np.sin(U2), np.cos(U2)
+
+	lam = L.copy()
+	converged = np.zeros(L.shape, dtype=bool)
+
+	for _ in range(max_iter):
+		sin_lam, cos_lam = np.sin(lam), np.cos(lam)
+		sin_sigma = np.sqrt((cosU2 * sin_lam) ** 2 + (cosU1 * sinU2 - sinU1 * cosU2 * cos_lam) ** 2)
+		cos_sigma = sinU1 * sinU2 + cosU1 * cosU2 * cos_lam
+		sigma = np.arctan2(sin_sigma, cos_sigma)
+		with np.errstate(invalid='ignore', divide='ignore'):
+			sin_alpha = np.where(sin_sigma > 0., cosU1 * cosU2 * sin_lam / sin_sigma, 0.)
+			cos2_alpha = 1. - sin_alpha ** 2
+			## equatorial lines have cos2_alpha == 0
+			cos_2sigma_m = np.where(cos2_alpha > 0., cos_sigma - 2. * sinU1 * sinU2 / cos2_alpha, 0.)
+		C = WGS84_F / 16. * cos2_alpha * (4. + WGS84_F * (4. - 3. * cos2_alpha))
+		lam_prev = lam
+		lam = L + (1. - C) * WGS84_F * sin_alpha * (sigma + C * sin_sigma * (cos_2sigma_m + C * cos_sigma * (-1. + 2. * cos_2sigma_m ** 2)))
+		converged = np.abs(lam - lam_prev) <= tol
+		if converged.all():
+			break
+
+	u2 = cos2_alpha * (WGS84_A ** 2 - WGS84_B ** 2) / WGS84_B ** 2
+	A = 1. + u2 / 16384. * (4096. + u2 * (-768. + u2 * (320. - 175. * u2)))
+	B = u2 / 1024. * (256. + u2 * (-128. + u2 * (74. - 47. * u2)))
+	delta_sigma = B * sin_sigma * (cos_2sigma_m + B / 4. * (cos_sigma * (-1. + 2. * cos_2sigma_m ** 2) - \
+			B / 6. * cos_2sigma_m * (-3. + 4. * sin_sigma ** 2) * (-3. + 4. * cos_2sigma_m ** 2)))
+
+	distance = WGS84_B * A * (sigma - delta_sigma) / 1000.
+	distance = np.where(sin_sigma == 0., 0., distance)
+	return np.where(converged, distance, np.nan)
+
+METHODS = {\
+	'haversine': haversine,
+	'geodesic': vincenty,
+	}
+
+## ============================================================================================= ##
+
+def distance_matrix(lat_a, lon_a, lat_b, lon_b, method='geodesic', chunk_size=CHUNK_SIZE, dtype=np.float64):
+	"""
+	Distance matrix in km of shape (len(lat_a), len(lat_b)) between two point sets given in degrees (EPSG:4326),
+	e.g. municipality centroids (a) and DWD stations (b). method is 'haversine' (fast, spherical) or 'geodesic'
+	(WGS84 ellipsoid, within 1 mm of geopy.distance.geodesic).
+	"""
+	lat_a, lon_a = np.asarray(lat_a, dtype=np.float64), np.asarray(lon_a, dtype=np.float64)
+	lat_b, lon_b = np.asarray(lat_b, dtype=np.float64), np.asarray(lon_b, dtype=np.float64)
+	func = METHODS[method]
+
+	matrix = np.empty((lat_a.size, lat_b.size), dtype=dtype)
+	for start in range(0, lat_a.size, chunk_size):
+		stop = start + chunk_size
+		matrix[start:stop] = func(lat_a[start:stop, None], lon_a[start:stop, None], lat_b[None, :], lon_b[None, :])
+	return matrix
+
+def gdf_distance_matrix(gdf_a, gdf_b, method='geodesic', **kwargs):
+	"""
+	Distance matrix in km between the point geometries of two GeoDataFrames in EPSG:4326 (rows: gdf_a, columns: gdf_b).
+	"""
+	return distance_matrix(gdf_a.geometry.y.values, gdf_a.geometry.x.values,
+		gdf_b.geometry.y.values, gdf_b.geometry.x.values, method=method, **kwargs)
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+
+## ============================================================================================= ##
+
+MAX_WORKERS = 8
+RETRIES = 5
+BACKOFF = 1. # seconds, doubled after every failed attempt
+TIMEOUT = 60. # seconds
+CHUNK_SIZE = 1 << 20
+
+## HTTP status codes worth another attempt besides 5xx, other 4xx (e.g. a missing archive) fail at once
+RETRY_STATUS = [408, 429]
+
+## ============================================================================================= ##
+
+_local = threading.local()
+
+def get_session(max_connections=MAX_WORKERS):
+	"""
+	One persistent HTTP session per thread, connections to the host are kept alive and reused.
+	"""
+	session = getattr(_local, 'session', None)
+	if session is None:
+		session = requests.Session()
+		adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_connections)
+		session.mount('http://', adapter)
+		session.mount('https://', adapter)
+		_local.session = session
+	return session
+
+def list_archives(base_url, pattern='stundenwerte_', suffix='.zip'):
+	"""
+	File names of all archives linked from a DWD directory listing.
+	"""
+	response = get_session().get(base_url, timeout=TIMEOUT)
+	response.raise_for_status()
+	names = re.findall(r'href="([^"]+)"', response.text)
+	return sorted(set(n for n in names if (pattern in n) and n.endswith(suffix)))
+
+## ============================================================================================= ##
+
+def read_meta(path):
+	try:
+		with open(path + '.meta', 'r') as f:
+			return json.load(f)
+	except (OSError, ValueError):
+		return {}
+
+def _write_meta(path, meta):
+	with open(path + '.meta', 'w') as f:
+		json.dump(meta, f)
+
+def remote_meta(url):
+	"""
+	Size, ETag and Last-Modified of a remote file from a HEAD request.
+	"""
+	response = get_session().head(url, timeout=TIMEOUT, allow_redirects=True)
+	response.raise_for_status()
+	size = response.headers.get('Content-Length')
+	return {\
+		'size': int(size) if size is not None else None,
+		'etag': response.headers.get('ETag'),
+		'last_modified': response.headers.get('Last-Modified'),
+		}
+
+def is_current(path, meta):
+	"""
+	True if the local file exists with the remote size and (if the server sends one) the remote ETag.
+	"""
+	if not os.path.isfile(path):
+		return False
+	if (meta['size'] is not None) and (os.path.getsize(path) != meta['size']):
+		return False
+	if meta['etag'] is not None:
+		return read_meta(path).get('etag') == meta['etag']
+	return meta['size'] is not None
+
+def retryable(error):
+	"""
+	True for transient failures: connection errors, timeouts, truncated transfers, 5xx, 408 and 429.
+	"""
+	if isinstance(error, requests.HTTPError):
+		status = error.response.status_code if error.response is not None else None
+		return (status is None) or (status >= 500) or (status in RETRY_STATUS)
+	if isinstance(error, requests.RequestException):
+		return isinstance(error, (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError))
+	return isinstance(error, IOError)
+
+def download_file(url, path, retries=RETRIES, backoff=BACKOFF):
+	"""
+	Download url to path unless an identical copy is already present. Interrupted downloads are kept as
+	path + '.part' and resumed with a Range request; transient failures (see retryable) are retried with
+	exponential backoff. Returns (path, downloaded) where downloaded is False for skipped files.
+	"""
+	partpath = path + '.part'
+
+	for attempt in range(retries + 1):
+		try:
+			meta = remote_meta(url)
+			if is_current(path, meta):
+				return path, False
+
+			## a partial file is only resumed if it belongs to the same remote version
+			offset = os.path.getsize(partpath) if os.path.isfile(partpath) else 0
+			if (offset > 0) and (read_meta(partpath).get('etag') != meta['etag']):
+				offset = 0
+			if (meta['size'] is not None) and (offset >= meta['size']):
+				offset = 0
+			_write_meta(partpath, meta)
+
+			headers = {'Range': 'bytes={0:d}-'.format(offset)} if offset > 0 else {}
+			with get_session().get(url, headers=headers, stream=True, timeout=TIMEOUT) as response:
+				response.raise_for_status()
+				mode = 'ab' if (offset > 0) and (response.status_code == 206) else 'wb'
+				with open(partpath, mode) as f:
+					for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+						f.write(chunk)
+
+			if (meta['size'] is not None) and (os.path.getsize(partpath) != meta['size']):
+				raise IOError('Incomplete download of {0:s}'.format(url))
+
+			os.replace(partpath, path)
+			os.replace(partpath + '.meta', path + '.meta')
+			return path, True
+
+		except (requests.RequestException, IOError) as e:
+			if (attempt == retries) or not retryable(e):
+				raise
+			time.sleep(backoff * 2 ** attempt)
+
+def download_all(base_url, filenames, outdir, max_workers=MAX_WORKERS, retries=RETRIES, backoff=BACKOFF):
+	"""
+	Download files from base_url into outdir with a bounded thread pool. Returns {filename: (path, downloaded)}.
+	Files that failed after all retries are reported and left out.
+	"""
+	os.makedirs(outdir, exist_ok=True)
+	results = {}
+	with ThreadPoolExecutor(max_workers=max_workers) as executor:
+		futures = {executor.submit(download_file, base_url + f, os.path.join(outdir, f), retries, backoff): f for f in filenames}
+		for future in as_completed(futures):
+			filename = futures[future]
+			try:
+				results[filename] = future.result()
+			except Exception as e:
+				print('Download failed: ', filename, e)
+	return results
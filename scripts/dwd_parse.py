@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import io
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+## ============================================================================================= ##
+
+## product columns per variable, renamed to the column names used throughout the pipeline
+PRODUCT_COLUMNS = {\
+	'air_temperature': {'MESS_DATUM': 'datetime', 'QN_9': 'QN_9', 'TT_TU': 'TT_TU', 'RF_TU': 'RF_TU'},
+	}
+
+PRODUCT_DTYPES = {\
+	'datetime': np.int32, # YYYYMMDDHH
+	'QN_9': np.int8,
+	'TT_TU': np.float32,
+	'RF_TU': np.float32,
+	}
+
+GEOGRAPHY_COLUMNS = {\
+	'Stations_id': 'station',
+	'Stationshoehe': 'elevation',
+	'Geogr.Breite': 'lat',
+	'Geogr.Laenge': 'lon',
+	'Stationsname': 'name',
+	}
+
+## ============================================================================================= ##
+
+def _read_member(archive, key, encoding='latin-1', **kwargs):
+	members = [s for s in archive.namelist() if key in s and s.endswith('.txt')]
+	return pd.read_csv(io.BytesIO(archive.read(members[0])), sep=';', skipinitialspace=True,
+		encoding=encoding, engine='c', **kwargs)
+
+def parse_archive(source, variable='air_temperature'):
+	"""
+	Parse a DWD station archive (path, bytes or file object) without extracting it. Returns the product table
+	with typed columns (see PRODUCT_DTYPES) and a one-row table with the latest station location.
+	"""
+	if isinstance(source, (bytes, bytearray)):
+		source = io.BytesIO(source)
+
+	columns = PRODUCT_COLUMNS[variable]
+	with zipfile.ZipFile(source, 'r') as archive:
+
+		df = _read_member(archive, 'produkt_', usecols=lambda c: c.strip() in columns)
+		df.columns = [columns[c.strip()] for c in df.columns]
+		df = df.loc[:, list(columns.values())].astype({c: PRODUCT_DTYPES[c] for c in columns.values()})
+
+		df_geo = _read_member(archive, 'Metadaten_Geographie', usecols=lambda c: c.strip() in GEOGRAPHY_COLUMNS)
+		df_geo.columns = [GEOGRAPHY_COLUMNS[c.strip()] for c in df_geo.columns]
+		df_geo = df_geo.iloc[[-1], :].loc[:, list(GEOGRAPHY_COLUMNS.values())].reset_index(drop=True)
+		df_geo['name'] = df_geo['name'].astype(str).str.strip()
+
+	return df, df_geo
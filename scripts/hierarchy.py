@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sparse
+
+from weights import normalize_rows
+from aggregate import apply_weights_masked, write_chunk, clear_partitions
+
+## ============================================================================================= ##
+
+## administrative levels of VG250: (key column, prefix length of the municipality key); GEM merges the land and
+## water parts that share one AGS
+LEVELS = {\
+	'GEM': ('AGS', 8),
+	'VWG': ('ARS', 9),
+	'KRS': ('AGS', 5),
+	'RBZ': ('AGS', 3),
+	'LAN': ('AGS', 2),
+	}
+
+LEVEL_NAMES = {\
+	'GEM': 'gemeinde',
+	'VWG': 'verwaltungsgemeinschaft',
+	'KRS': 'kreis',
+	'RBZ': 'regierungsbezirk',
+	'LAN': 'land',
+	}
+
+## ============================================================================================= ##
+
+def membership_matrix(codes, prefix_length, parents=None, weights=None):
+	"""
+	Row-normalized sparse matrix (n_parents, n_municipalities) assigning every municipality to the unit whose
+	key is the prefix of its own key (e.g. the first 5 digits of the AGS for the Kreis). Entries are the
+	municipality weights (area or population, equal if None). With parents given (e.g. the keys of the level's
+	own VG250 layer), municipalities whose prefix is not among them are left out. Returns (parents, matrix).
+	"""
+	prefixes = pd.Series(np.asarray(codes)).astype(str).str[:prefix_length].values
+	if parents is None:
+		parents = np.unique(prefixes)
+	parents = np.asarray(parents).astype(str)
+
+	rows = pd.Index(parents).get_indexer(prefixes)
+	cols = np.flatnonzero(rows >= 0)
+	data = np.ones(cols.size) if weights is None else np.asarray(weights, dtype=np.float64)[cols]
+	matrix = sparse.csr_matrix((data, (rows[cols], cols)), shape=(parents.size, len(prefixes)))
+	return parents, normalize_rows(matrix)
+
+def hierarchy_matrices(df_municipalities, levels=None, weights=None, parents=None):
+	"""
+	{level: (parents, membership matrix)} for a municipality table with columns AGS and ARS, in its row order.
+	weights: area or population per row; parents: optional {level: keys of the level layer}.
+	"""
+	levels = list(LEVELS) if levels is None else levels
+	parents = {} if parents is None else parents
+	matrices = {}
+	for level in levels:
+		column, prefix_length = LEVELS[level]
+		matrices[level] = membership_matrix(df_municipalities[column].values, prefix_length, parents=parents.get(level), weights=weights)
+	return matrices
+
+def level_parents(datapath, levels=None):
+	"""
+	{level: keys} from the VG250 layers of the levels (VG250_KRS.shp, ...), so units missing in a Land (e.g.
+	Regierungsbezirke) do not appear as prefixes.
+	"""
+	import geopandas as gpd
+
+	levels = list(LEVELS) if levels is None else levels
+	parents = {}
+	for level in levels:
+		if level == 'GEM':
+			continue
+		column = LEVELS[level][0]
+		df = gpd.read_file(os.path.join(datapath, 'VG250_{0:s}.shp'.format(level)), ignore_geometry=True)
+		parents[level] = np.unique(df[column].astype(str).values)
+	return parents
+
+def municipality_weights(gdf, weighting='area', population=None):
+	"""
+	Roll-up weight of every municipality row: its area ('area', in EPSG:25832) or its population ('population',
+	a Series indexed by AGS), split by area between rows sharing one AGS.
+	"""
+	area = gdf.geometry.to_crs('EPSG:25832').area.values
+	if weighting == 'area':
+		return area
+	share = area / pd.Series(area).groupby(gdf['AGS'].values).transform('sum').values
+	return population.reindex(gdf['AGS'].values).fillna(0.).values * share
+
+## ============================================================================================= ##
+
+def rollup_daily(inpath, matrices, outpaths, targets, target_column='AGS', years=None):
+	"""
+	Roll a municipality panel written by aggregate_daily (or aggregate_grid) up to every level of matrices. Each
+	part file holds the targets in panel order times its days, so it is reshaped to (n_municipalities, n_days)
+	without pivoting and reduced with one sparse product per level; missing municipality values are left out
+	and the weights renormalized. Outputs keep the year partitions and part numbers of the input, with years
+	given only these partitions are rewritten. Returns {level: number of rows written}.
+	"""
+	import pyarrow.parquet as pq
+
+	targets = np.asarray(targets).astype(str)
+	nrows = {level: 0 for level in matrices}
+	for level in matrices:
+		clear_partitions(outpaths[level], years)
+
+	for partition in sorted(os.listdir(inpath)):
+		if not partition.startswith('year='):
+			continue
+		year = int(partition.split('=')[1])
+		if (years is not None) and (year not in years):
+			continue
+
+		for partfile in sorted(os.listdir(os.path.join(inpath, partition))):
+			n = int(os.path.splitext(partfile)[0].split('-')[1])
+			table = pq.read_table(os.path.join(inpath, partition, partfile))
+			days = table.column('datetime').to_numpy()[:table.num_rows // targets.size]
+			if not np.array_equal(table.column(target_column).to_numpy(zero_copy_only=False)[::days.size].astype(str), targets):
+				raise ValueError('{0:s} does not hold the targets in panel order'.format(partfile))
+
+			value_columns = [c for c in table.column_names if c not in [target_column, 'datetime', 'year']]
+			values = {c: table.column(c).to_numpy().reshape(targets.size, days.size) for c in value_columns}
+
+			for level, (parents, matrix) in matrices.items():
+				column = LEVELS[level][0]
+				results = {c: apply_weights_masked(matrix, v) for c, v in values.items()}
+				nrows[level] += write_chunk(outpaths[level], year, n, parents, days, results, target_column=column)
+
+	return nrows
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import scipy.sparse as sparse
+
+from aggregate import apply_weights_masked, day_chunks, write_chunk, clear_partitions
+
+## ============================================================================================= ##
+
+HYRAS_URL = 'https://opendata.dwd.de/climate_environment/CDC/grids_germany/daily/hyras_de/'
+
+## product directory: (NetCDF variable, file prefix), as in link_dwd_modules.R
+PRODUCTS = {\
+	'air_temperature_mean': ('tas', 'tas_hyras_5'),
+	'air_temperature_max': ('tasmax', 'tasmax_hyras_5'),
+	'precipitation': ('pr', 'pr_hyras_1'),
+	}
+
+## HYRAS grids are given in ETRS89 / LCC Europe, used if a file carries no grid mapping
+HYRAS_CRS = 'EPSG:3034'
+
+## days read from a NetCDF file at once, bounds memory on the 1 km grids
+GRID_CHUNK_DAYS = 31
+
+## ============================================================================================= ##
+
+def hyras_filename(product, year, version='v5-0'):
+	return '{0:s}_{1:d}_{2:s}_de.nc'.format(PRODUCTS[product][1], int(year), version)
+
+def hyras_url(product):
+	return HYRAS_URL + product + '/'
+
+## ============================================================================================= ##
+
+def read_grid(path):
+	"""
+	Cell centre coordinates (x, y) and CRS of a gridded NetCDF file, without reading any data.
+	"""
+	import netCDF4
+
+	with netCDF4.Dataset(path, 'r') as nc:
+		x = np.asarray(nc.variables['x'][:], dtype=np.float64)
+		y = np.asarray(nc.variables['y'][:], dtype=np.float64)
+		crs = HYRAS_CRS
+		for v in nc.variables.values():
+			if 'grid_mapping_name' in v.ncattrs():
+				for attr in ['crs_wkt', 'spatial_ref']:
+					if attr in v.ncattrs():
+						crs = v.getncattr(attr)
+						break
+	return x, y, crs
+
+def _edges(centres):
+	"""
+	Ascending cell edges of a regular axis and whether the axis itself is descending.
+	"""
+	centres = np.asarray(centres, dtype=np.float64)
+	descending = (centres.size > 1) and (centres[0] > centres[-1])
+	c = centres[::-1] if descending else centres
+	step = np.diff(c)
+	mid = c[:-1] + step / 2.
+	first = c[0] - (step[0] / 2. if step.size > 0 else .5)
+	last = c[-1] + (step[-1] / 2. if step.size > 0 else .5)
+	return np.r_[first, mid, last], descending
+
+def coverage_fractions(geometries, x, y):
+	"""
+	Sparse matrix (n_geometries, ny * nx) of the fraction of every grid cell covered by every geometry, as in
+	exactextractr. Columns follow the row-major (y, x) cell order of the NetCDF variable. geometries have to be
+	in the CRS of the grid. Only the cells in the bounding box of a geometry are tested; cells lying entirely
+	inside it get fraction 1 without an intersection.
+	"""
+	import shapely
+
+	xe, xdesc = _edges(x)
+	ye, ydesc = _edges(y)
+	nx, ny = xe.size - 1, ye.size - 1
+
+	rows, cols, data = [], [], []
+	for n, geometry in enumerate(np.asarray(geometries)):
+		if (geometry is None) or geometry.is_empty:
+			continue
+		minx, miny, maxx, maxy = geometry.bounds
+		ix = np.arange(max(np.searchsorted(xe, minx, side='right') - 1, 0), min(np.searchsorted(xe, maxx, side='left'), nx))
+		iy = np.arange(max(np.searchsorted(ye, miny, side='right') - 1, 0), min(np.searchsorted(ye, maxy, side='left'), ny))
+		if (ix.size == 0) or (iy.size == 0):
+			continue
+		ix, iy = [a.ravel() for a in np.meshgrid(ix, iy)]
+
+		boxes = shapely.box(xe[ix], ye[iy], xe[ix + 1], ye[iy + 1])
+		shapely.prepare(geometry)
+		fraction = np.where(shapely.contains_properly(geometry, boxes), 1., 0.)
+		edge = np.flatnonzero((fraction == 0.) & shapely.intersects(geometry, boxes))
+		if edge.size > 0:
+			fraction[edge] = shapely.area(shapely.intersection(boxes[edge], geometry)) / shapely.area(boxes[edge])
+
+		keep = fraction > 0.
+		ix, iy = ix[keep], iy[keep]
+		if xdesc:
+			ix = nx - 1 - ix
+		if ydesc:
+			iy = ny - 1 - iy
+		rows.append(np.full(ix.size, n, dtype=np.int64))
+		cols.append(iy * nx + ix)
+		data.append(fraction[keep])
+
+	if len(rows) == 0:
+		return sparse.csr_matrix((len(geometries), nx * ny))
+	return sparse.csr_matrix((np.concatenate(data), (np.concatenate(rows), np.concatenate(cols))), shape=(len(geometries), nx * ny))
+
+## ============================================================================================= ##
+
+def iter_days(path, variable, chunk_days=GRID_CHUNK_DAYS, cells=None):
+	"""
+	Yield (days, values) from a daily NetCDF file, chunk_days time steps at a time: days as YYYYMMDD and values
+	as float32 array (n_cells, n_days) with NaN outside the grid mask. Only the requested slice is read from the
+	file; with cells given, only these (row-major) cells are returned.
+	"""
+	import netCDF4
+
+	with netCDF4.Dataset(path, 'r') as nc:
+		time = nc.variables['time']
+		dates = netCDF4.num2date(time[:], time.units, getattr(time, 'calendar', 'standard'))
+		days = np.array([d.year * 10000 + d.month * 100 + d.day for d in dates], dtype=np.int32)
+		data = nc.variables[variable]
+		data.set_auto_mask(True)
+
+		for start in range(0, days.size, chunk_days):
+			stop = min(start + chunk_days, days.size)
+			values = np.ma.filled(data[start:stop].astype(np.float32), np.nan).reshape(stop - start, -1)
+			if cells is not None:
+				values = values[:, cells]
+			yield days[start:stop], values.T
+
+def aggregate_grid(coverage, files, variable, targets, outpath, value_column=None, target_column='AGS',
+	chunk_days=GRID_CHUNK_DAYS, years=None):
+	"""
+	Area-weighted daily means of gridded NetCDF files for all targets, written to a Parquet dataset partitioned
+	by year as with aggregate_daily. Each chunk of days reduces to one sparse product with the coverage matrix;
+	cells without data on a day (NaN) are left out and the coverage fractions renormalized. With years given,
+	only these partitions are rewritten. Returns the number of rows written.
+	"""
+	value_column = variable if value_column is None else value_column
+	coverage = sparse.csr_matrix(coverage)
+
+	## only the cells covered by any target are kept from each slice
+	cells = np.unique(coverage.indices)
+	weights = coverage[:, cells]
+
+	clear_partitions(outpath, years)
+
+	nrows, n = 0, 0
+	for path in files:
+		for days, values in iter_days(path, variable, chunk_days=chunk_days, cells=cells):
+			for year, chunk in day_chunks(days, chunk_days):
+				if (years is not None) and (year not in years):
+					continue
+				results = {value_column: apply_weights_masked(weights, values[:, chunk])}
+				nrows += write_chunk(outpath, year, n, targets, days[chunk], results, target_column=target_column)
+				n += 1
+	return nrows
@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+
+import numpy as np
+
+## ============================================================================================= ##
+
+## days transformed at once, bounds the temporary arrays of IterativeImputer.transform
+BLOCK_SIZE = 366
+
+## ============================================================================================= ##
+
+def transform_blocked(imputer, values, block_size=BLOCK_SIZE, progress=True):
+	"""
+	Apply a fitted imputer to a (days, stations) array in blocks of rows. The transform of a fitted
+	IterativeImputer treats every row independently, so the result equals the row-by-row transform while each
+	round-robin pass over the station models runs once per block instead of once per day. Days without any
+	value only get the initial imputation (imputer.initial_imputer_), as in a transform of that day alone.
+	"""
+	values = np.asarray(values, dtype=np.float64)
+	result = np.empty_like(values)
+	empty = np.isnan(values).all(axis=1)
+	start_time = time.time()
+
+	for start in range(0, values.shape[0], block_size):
+		stop = min(start + block_size, values.shape[0])
+		rows = np.arange(start, stop)[~empty[start:stop]]
+		if rows.size > 0:
+			result[rows] = imputer.transform(values[rows])
+		rows = np.arange(start, stop)[empty[start:stop]]
+		if rows.size > 0:
+			result[rows] = imputer.initial_imputer_.transform(values[rows])
+		if progress:
+			print('Imputed {0:d} / {1:d} days ({2:.1f} s)'.format(stop, values.shape[0], time.time() - start_time))
+
+	return result
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import re
+
+import numpy as np
+import pandas as pd
+
+## ============================================================================================= ##
+
+STATISTICS = ['mean', 'sum', 'count']
+
+## ============================================================================================= ##
+
+def to_days(dates):
+	"""
+	Dates (YYYYMMDD integers, strings or datetime-like) as datetime64[D].
+	"""
+	dates = np.asarray(dates)
+	if np.issubdtype(dates.dtype, np.integer):
+		dates = pd.to_datetime(dates.astype(str), format='%Y%m%d')
+	return np.asarray(pd.to_datetime(dates), dtype='datetime64[D]')
+
+def days_back_window(dates, days_back=None):
+	"""
+	First and last day (inclusive) of the window date - days_back ... date, as specify_days in
+	link_dwd_modules.R; without days_back only the date itself.
+	"""
+	dates = to_days(dates)
+	return dates - np.timedelta64(days_back or 0, 'D'), dates
+
+def _month(month):
+	"""
+	(month number, years before the interview year) of a month specification, 3 or 'P11' (November of the
+	previous year).
+	"""
+	month = str(month)
+	return int(re.search('[0-9]+', month).group()), 1 if 'P' in month else 0
+
+def months_window(dates, months):
+	"""
+	First and last day (inclusive) of the month window from the first to the last month of months, as
+	specify_days in link_dwd_modules.R: months prefixed with 'P' lie in the year before the interview.
+	"""
+	dates = to_days(dates)
+	years = dates.astype('datetime64[Y]').astype(np.int64)
+	first_month, first_back = _month(months[0])
+	last_month, last_back = _month(months[-1])
+	start = ((years - first_back) * 12 + first_month - 1).astype('datetime64[M]').astype('datetime64[D]')
+	stop = ((years - last_back) * 12 + last_month).astype('datetime64[M]').astype('datetime64[D]') - np.timedelta64(1, 'D')
+	return start, stop
+
+def panel_array(df, value_column, target_column='AGS', units=None, dtype=np.float64, weights=None):
+	"""
+	(units, first_day, values) from a long table (target, datetime as YYYYMMDD, value): values is an array
+	(n_units, n_days) over consecutive calendar days starting at first_day, days missing in the table are NaN.
+	With units given, only these rows are kept. Rows sharing target and day (e.g. the land and water parts of
+	one municipality) are combined into their mean weighted by weights (one per row, see part_weights), missing
+	values left out; without weights they raise ValueError.
+	"""
+	if units is not None:
+		keep = df[target_column].isin(units).values
+		df = df.loc[keep, :]
+		if weights is not None:
+			weights = np.asarray(weights)[keep]
+	units = np.sort(df[target_column].unique())
+	days = to_days(df['datetime'].values)
+	first_day = days.min()
+	ndays = int((days.max() - first_day).astype(np.int64)) + 1
+
+	i = np.searchsorted(units, df[target_column].values)
+	j = (days - first_day).astype(np.int64)
+	cell = i * ndays + j
+	if np.unique(cell).size == cell.size:
+		values = np.full((units.size, ndays), np.nan, dtype=dtype)
+		values[i, j] = df[value_column].values
+		return units, first_day, values
+
+	if weights is None:
+		duplicated = pd.unique(df[target_column].values[pd.Series(cell).duplicated().values])
+		raise ValueError('Several rows per target and day for {0:d} targets (e.g. {1:s}), weights needed to combine them'.format(\
+			duplicated.size, ', '.join(str(u) for u in duplicated[:5])))
+	observed = ~np.isnan(df[value_column].values)
+	w = np.where(observed, np.asarray(weights, dtype=np.float64), 0.)
+	sums = np.bincount(cell, weights=w * np.where(observed, df[value_column].values, 0.), minlength=units.size * ndays)
+	norm = np.bincount(cell, weights=w, minlength=units.size * ndays)
+	with np.errstate(invalid='ignore', divide='ignore'):
+		values = np.where(norm > 0, sums / norm, np.nan).reshape(units.size, ndays).astype(dtype)
+	return units, first_day, values
+
+def part_weights(df, gdf, target_column='AGS', weights=None):
+	"""
+	Weight of every row of a panel table df for panel_array: rows sharing target and day come in the order of
+	the shapes in gdf (the order aggregate_daily writes them), each gets the weight of its shape (default: its
+	area in EPSG:25832).
+	"""
+	if weights is None:
+		weights = gdf.geometry.to_crs('EPSG:25832').area.values
+	shapes = pd.Series(np.asarray(weights, dtype=np.float64), index=pd.MultiIndex.from_arrays(\
+		[gdf[target_column].values, gdf.groupby(target_column).cumcount().values]))
+	rows = pd.MultiIndex.from_arrays([df[target_column].values, df.groupby([target_column, 'datetime']).cumcount().values])
+	return shapes.reindex(rows).values
+
+## ============================================================================================= ##
+
+class WindowPanel:
+	"""
+	Unit x day panel (e.g. AGS x day) with cumulative sums and counts of the observed values along time. The sum,
+	count or mean over any window of days is the difference of two columns, so every respondent is linked in
+	O(1) regardless of the window length and a whole survey wave is linked with a few vectorized lookups.
+	"""
+
+	def __init__(self, units, first_day, values):
+		"""
+		values: array (n_units, n_days) on consecutive calendar days starting at first_day, missing values NaN.
+		"""
+		values = np.asarray(values, dtype=np.float64)
+		observed = ~np.isnan(values)
+		self.units = pd.Index(np.asarray(units))
+		self.first_day = np.datetime64(first_day, 'D')
+		self.ndays = values.shape[1]
+
+		self.sums = np.zeros((values.shape[0], self.ndays + 1), dtype=np.float64)
+		np.cumsum(np.where(observed, values, 0.), axis=1, out=self.sums[:, 1:])
+		self.counts = np.zeros((values.shape[0], self.ndays + 1), dtype=np.int32)
+		np.cumsum(observed, axis=1, dtype=np.int32, out=self.counts[:, 1:])
+
+	@classmethod
+	def from_long(cls, df, value_column, target_column='AGS', units=None, weights=None):
+		"""
+		Panel from a long table (target, datetime as YYYYMMDD, value) as written by aggregate_daily. With units
+		given, only these rows are kept; days missing in the table stay NaN. Rows sharing target and day are
+		combined with weights, see panel_array.
+		"""
+		return cls(*panel_array(df, value_column, target_column=target_column, units=units, weights=weights))
+
+	## =============================== ##
+
+	def link(self, units, start, stop, statistic='mean'):
+		"""
+		Statistic over the days start ... stop (inclusive, datetime64[D] arrays) for every respondent's unit.
+		Windows are clipped to the panel; respondents whose unit is unknown or whose window holds no observed
+		day get NaN (mean) or 0 (sum, count).
+		"""
+		i = self.units.get_indexer(np.asarray(units))
+		known = i >= 0
+		i = np.where(known, i, 0)
+		lo = np.clip((start - self.first_day).astype(np.int64), 0, self.ndays)
+		hi = np.clip((stop - self.first_day).astype(np.int64) + 1, 0, self.ndays)
+		hi = np.maximum(hi, lo)
+
+		counts = np.where(known, self.counts[i, hi] - self.counts[i, lo], 0)
+		if statistic == 'count':
+			return counts
+		sums = np.where(known, self.sums[i, hi] - self.sums[i, lo], 0.)
+		if statistic == 'sum':
+			return sums
+		with np.errstate(invalid='ignore', divide='ignore'):
+			return np.where(counts > 0, sums / counts, np.nan)
+
+	def link_window(self, units, dates, days_back=None, months=None, statistic='mean'):
+		"""
+		Link with the window definition of gxc_link_dwd: days_back days before the date, or a month window.
+		"""
+		if months is not None:
+			start, stop = months_window(dates, months)
+		else:
+			start, stop = days_back_window(dates, days_back)
+		return self.link(units, start, stop, statistic=statistic)
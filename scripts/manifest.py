@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import hashlib
+import datetime
+
+## ============================================================================================= ##
+
+## stages downstream of the station store that track which station data changed since their last run
+STAGES = ['daily', 'impute', 'aggregate']
+
+## ============================================================================================= ##
+
+def file_hash(path, chunk_size=1 << 20):
+	h = hashlib.sha256()
+	with open(path, 'rb') as f:
+		for chunk in iter(lambda: f.read(chunk_size), b''):
+			h.update(chunk)
+	return h.hexdigest()
+
+class Manifest:
+	"""
+	Record of processed DWD archives (URL, size, last-modified, ETag, content hash), of the time range stored
+	per station, and of the station data that changed since each downstream stage last ran. A change marks the
+	station as dirty from its first changed timestamp onwards for every stage in STAGES; a stage reads its
+	dirty set, recomputes only what lies within it and then clears it.
+	"""
+
+	def __init__(self, path):
+		self.path = path
+		self.data = {'archives': {}, 'stations': {}, 'dirty': {}}
+		if os.path.isfile(path):
+			with open(path, 'r') as f:
+				self.data.update(json.load(f))
+
+	def save(self):
+		tmppath = self.path + '.tmp'
+		with open(tmppath, 'w') as f:
+			json.dump(self.data, f, indent=1, sort_keys=True)
+		os.replace(tmppath, self.path)
+
+	## =============================== ##
+
+	def archive_changed(self, filename, sha256):
+		return self.data['archives'].get(filename, {}).get('sha256') != sha256
+
+	def record_archive(self, filename, url, meta, sha256):
+		self.data['archives'][filename] = {\
+			'url': url,
+			'size': meta.get('size'),
+			'etag': meta.get('etag'),
+			'last_modified': meta.get('last_modified'),
+			'sha256': sha256,
+			'processed': datetime.datetime.now().isoformat(timespec='seconds'),
+			}
+
+	## =============================== ##
+
+	def station_range(self, variable, station):
+		"""
+		(first, last) timestamp stored for a station, or None for an unknown station.
+		"""
+		r = self.data['stations'].get(variable, {}).get(str(int(station)))
+		return tuple(r) if r is not None else None
+
+	def record_station(self, variable, station, first, last, changed_from):
+		"""
+		Update the stored range of a station and mark it dirty from changed_from onwards (None: unchanged).
+		"""
+		self.data['stations'].setdefault(variable, {})[str(int(station))] = [int(first), int(last)]
+		if changed_from is None:
+			return
+		for stage in STAGES:
+			dirty = self.data['dirty'].setdefault(stage, {}).setdefault(variable, {})
+			key = str(int(station))
+			dirty[key] = min(int(changed_from), dirty.get(key, int(changed_from)))
+
+	def dirty(self, stage, variable):
+		"""
+		{station: first changed timestamp} for a stage.
+		"""
+		return {int(s): t for s, t in self.data['dirty'].get(stage, {}).get(variable, {}).items()}
+
+	def clear(self, stage, variable):
+		self.data['dirty'].get(stage, {}).pop(variable, None)
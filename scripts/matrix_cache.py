@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import shutil
+import hashlib
+
+import numpy as np
+import scipy.sparse as sparse
+
+## ============================================================================================= ##
+
+## cache entries are stored as <name>-<key>.npy (dense) or as directory <name>-<key>/ (sparse CSR)
+KEY_LENGTH = 16
+
+## ============================================================================================= ##
+
+def _update(h, part):
+	if isinstance(part, np.ndarray):
+		part = np.ascontiguousarray(part)
+		h.update('{0:s}{1:s}'.format(part.dtype.str, str(part.shape)).encode())
+		h.update(part.tobytes() if part.dtype != object else repr(part.tolist()).encode())
+	elif isinstance(part, (bytes, bytearray)):
+		h.update(part)
+	elif isinstance(part, (list, tuple)):
+		for p in part:
+			_update(h, p)
+	elif isinstance(part, dict):
+		for k in sorted(part):
+			_update(h, str(k))
+			_update(h, part[k])
+	else:
+		h.update(repr(part).encode())
+	h.update(b'|')
+
+def content_hash(*parts):
+	"""
+	sha256 over arrays (dtype, shape and bytes), bytes, strings/numbers (repr) and nested lists/tuples/dicts.
+	"""
+	h = hashlib.sha256()
+	for part in parts:
+		_update(h, part)
+	return h.hexdigest()
+
+def geometry_hash(geoseries):
+	"""
+	Content hash of a GeoSeries/GeoDataFrame geometry column (WKB) including its CRS.
+	"""
+	import shapely
+	geometry = getattr(geoseries, 'geometry', geoseries)
+	crs = geometry.crs.to_string() if geometry.crs is not None else None
+	return content_hash(crs, b''.join(shapely.to_wkb(geometry.values)))
+
+def points_hash(ids, lat, lon):
+	return content_hash(np.asarray(ids).astype(str), np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64))
+
+## ============================================================================================= ##
+
+class MatrixCache:
+	"""
+	Binary cache for dense and sparse (CSR) matrices. Entries are addressed by a name and a content key that has
+	to cover every input the matrix depends on, so a changed input never hits a stale entry. Entries are opened
+	memory-mapped and read-only; older entries of the same name are removed when a new one is stored.
+	"""
+
+	def __init__(self, cachedir):
+		self.cachedir = cachedir
+		os.makedirs(cachedir, exist_ok=True)
+
+	def _path(self, name, key):
+		return os.path.join(self.cachedir, '{0:s}-{1:s}'.format(name, key[:KEY_LENGTH]))
+
+	def _entries(self, name):
+		prefix = name + '-'
+		return [f for f in os.listdir(self.cachedir) if f.startswith(prefix) and (len(f.split('.')[0]) == len(prefix) + KEY_LENGTH)]
+
+	def _prune(self, name, keep):
+		for f in self._entries(name):
+			path = os.path.join(self.cachedir, f)
+			if os.path.splitext(path)[0] == keep:
+				continue
+			if os.path.isdir(path):
+				shutil.rmtree(path, ignore_errors=True)
+			else:
+				os.remove(path)
+
+	## =============================== ##
+
+	def contains(self, name, key):
+		path = self._path(name, key)
+		return os.path.isfile(path + '.npy') or os.path.isfile(os.path.join(path, 'meta.json'))
+
+	def load(self, name, key):
+		"""
+		Memory-mapped matrix for (name, key), or None if there is no such entry.
+		"""
+		path = self._path(name, key)
+		if os.path.isfile(path + '.npy'):
+			return np.load(path + '.npy', mmap_mode='r')
+		if os.path.isfile(os.path.join(path, 'meta.json')):
+			with open(os.path.join(path, 'meta.json'), 'r') as f:
+				meta = json.load(f)
+			arrays = {a: np.load(os.path.join(path, a + '.npy'), mmap_mode='r') for a in ['data', 'indices', 'indptr']}
+			## the constructor copies (and checks) the arrays even with copy=False, the memory maps are set directly
+			matrix = sparse.csr_matrix(tuple(meta['shape']), dtype=arrays['data'].dtype)
+			for a, array in arrays.items():
+				setattr(matrix, a, array)
+			matrix.has_sorted_indices = True
+			return matrix
+		return None
+
+	def save(self, name, key, matrix):
+		path = self._path(name, key)
+		tmppath = path + '.tmp'
+		if sparse.issparse(matrix):
+			matrix = sparse.csr_matrix(matrix)
+			matrix.sort_indices()
+			os.makedirs(tmppath, exist_ok=True)
+			for a in ['data', 'indices', 'indptr']:
+				np.save(os.path.join(tmppath, a + '.npy'), getattr(matrix, a))
+			with open(os.path.join(tmppath, 'meta.json'), 'w') as f:
+				json.dump({'shape': list(matrix.shape), 'nnz': int(matrix.nnz), 'key': key}, f)
+			shutil.rmtree(path, ignore_errors=True)
+			os.replace(tmppath, path)
+		else:
+			with open(tmppath, 'wb') as f:
+				np.save(f, np.asarray(matrix))
+			os.replace(tmppath, path + '.npy')
+		self._prune(name, keep=path)
+
+	def get(self, name, key, build, rebuild=False):
+		"""
+		Cached matrix for (name, key); calls build() and stores its result if the entry is missing or stale.
+		"""
+		if not rebuild:
+			matrix = self.load(name, key)
+			if matrix is not None:
+				return matrix
+		self.save(name, key, build())
+		return self.load(name, key)
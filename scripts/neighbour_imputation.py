@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import pickle
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from weights import StationIndex
+
+## ============================================================================================= ##
+
+N_NEIGHBOURS = 8
+## candidate pool (multiple of N_NEIGHBOURS nearest stations) for correlation-based selection
+N_CANDIDATES = 3
+## minimum number of days observed at a station and a candidate for their correlation to count
+MIN_OVERLAP = 365
+## fraction of days used for training, as for the global lasso imputation
+TRAINING_FRACTION = 0.1
+MIN_TRAINING_DAYS = 50
+
+MP_CONTEXT = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else None
+
+## ============================================================================================= ##
+
+def select_neighbours(values, stations, lat, lon, k=N_NEIGHBOURS, selection='nearest'):
+	"""
+	{station: array of neighbour stations}. values is the (days, stations) array in the order of stations.
+	selection 'nearest' takes the k closest stations, 'correlation' the k stations best correlated with the
+	target among its N_CANDIDATES * k closest ones.
+	"""
+	stations = np.asarray(stations)
+	ncandidates = k if selection == 'nearest' else N_CANDIDATES * k
+	index = StationIndex(lat, lon)
+	rows, cols, _ = index.query(lat, lon, k=min(ncandidates + 1, len(stations)))
+
+	neighbours = {}
+	for i, station in enumerate(stations):
+		candidates = cols[(rows == i) & (cols != i)]
+		if selection == 'correlation':
+			y = values[:, i]
+			corr = np.full(candidates.size, -np.inf)
+			for n, j in enumerate(candidates):
+				valid = ~np.isnan(y) & ~np.isnan(values[:, j])
+				if valid.sum() >= MIN_OVERLAP:
+					corr[n] = np.corrcoef(y[valid], values[valid, j])[0, 1]
+			candidates = candidates[np.argsort(-corr, kind='stable')]
+		neighbours[station] = stations[candidates[:k]]
+	return neighbours
+
+## ============================================================================================= ##
+
+def _fit_station(args):
+	from sklearn.linear_model import LassoCV
+
+	station, y, X, seed = args
+	start_time = time.perf_counter()
+	with np.errstate(invalid='ignore'):
+		means = np.nanmean(X, axis=0) if X.shape[0] > 0 else np.zeros(X.shape[1])
+	means = np.where(np.isfinite(means), means, 0.)
+	train = np.flatnonzero(~np.isnan(y))
+
+	## stations with too few observations for cross-validation are filled with their mean
+	if train.size < MIN_TRAINING_DAYS:
+		return station, {'model': None, 'means': means, 'fallback': np.nanmean(y) if train.size > 0 else np.nan,
+			'fit_seconds': time.perf_counter() - start_time}
+
+	rng = np.random.RandomState(seed)
+	train = rng.choice(train, size=max(MIN_TRAINING_DAYS, int(train.size * TRAINING_FRACTION)), replace=False)
+	Xtrain = np.where(np.isnan(X[train]), means, X[train])
+	model = LassoCV(cv=10, random_state=0, tol=1.e-2).fit(Xtrain, y[train])
+	return station, {'model': model, 'means': means, 'fallback': None, 'fit_seconds': time.perf_counter() - start_time}
+
+class NeighbourImputer:
+	"""
+	Imputation in which each station is regressed (LassoCV) only on its neighbouring stations. Station models
+	are fitted in parallel and stored one file per station in modeldir; a stored model is reused as long as its
+	neighbour set is unchanged, so new stations or years only fit the models they affect.
+	"""
+
+	def __init__(self, modeldir, k=N_NEIGHBOURS, selection='nearest', processes=None):
+		self.modeldir = modeldir
+		self.k = k
+		self.selection = selection
+		self.processes = processes or os.cpu_count()
+		self.neighbours = {}
+		self.models = {}
+		self.fitted = []
+		os.makedirs(modeldir, exist_ok=True)
+
+	def _modelfile(self, station):
+		return os.path.join(self.modeldir, 'station_{0:d}.pkl'.format(int(station)))
+
+	def _load(self, station, neighbours):
+		try:
+			with open(self._modelfile(station), 'rb') as f:
+				stored = pickle.load(f)
+		except (OSError, pickle.UnpicklingError, EOFError):
+			return None
+		return stored if list(stored['neighbours']) == list(neighbours) else None
+
+	def fit(self, df_pivot, df_stations, refit=False):
+		"""
+		df_pivot: days x stations table, df_stations: table with columns station, lat, lon.
+		"""
+		stations = df_pivot.columns.values
+		coords = df_stations.set_index('station').loc[stations, ['lat', 'lon']]
+		values = df_pivot.values.astype(np.float64)
+		self.neighbours = select_neighbours(values, stations, coords['lat'].values, coords['lon'].values,
+			k=self.k, selection=self.selection)
+
+		position = {s: i for i, s in enumerate(stations)}
+		tasks = []
+		for i, station in enumerate(stations):
+			stored = None if refit else self._load(station, self.neighbours[station])
+			if stored is not None:
+				self.models[station] = stored
+				continue
+			cols = [position[s] for s in self.neighbours[station]]
+			tasks.append((station, values[:, i], values[:, cols], int(station)))
+
+		print('Fitting station models: ', len(tasks), 'of', len(stations))
+		if (self.processes == 1) or (len(tasks) <= 1):
+			results = list(map(_fit_station, tasks))
+		else:
+			with ProcessPoolExecutor(max_workers=self.processes, mp_context=multiprocessing.get_context(MP_CONTEXT)) as executor:
+				results = list(executor.map(_fit_station, tasks))
+
+		## stations fitted in this call (the others reuse stored models), e.g. for per-station fit times
+		self.fitted = [station for station, _ in results]
+		for station, stored in results:
+			stored['neighbours'] = list(self.neighbours[station])
+			with open(self._modelfile(station), 'wb') as f:
+				pickle.dump(stored, f)
+			self.models[station] = stored
+
+		return self
+
+	def transform(self, df_pivot):
+		"""
+		Fill the missing days of every station from its neighbours' observed values on the same days (missing
+		neighbour values are replaced by the neighbour's mean). Observed values are left unchanged.
+		"""
+		stations = df_pivot.columns.values
+		position = {s: i for i, s in enumerate(stations)}
+		values = df_pivot.values.astype(np.float64)
+		result = values.copy()
+
+		for i, station in enumerate(stations):
+			missing = np.isnan(values[:, i])
+			if not missing.any():
+				continue
+			stored = self.models[station]
+			if stored['model'] is None:
+				result[missing, i] = stored['fallback']
+				continue
+			cols = [position[s] for s in stored['neighbours']]
+			X = values[np.ix_(missing, cols)]
+			X = np.where(np.isnan(X), stored['means'], X)
+			result[missing, i] = stored['model'].predict(X)
+
+		return pd.DataFrame(result, index=df_pivot.index, columns=df_pivot.columns)
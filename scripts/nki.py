@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+
+import pandas as pd
+
+from manifest import file_hash
+from matrix_cache import KEY_LENGTH
+
+## ============================================================================================= ##
+
+NKI_ENCODING = 'latin-1'
+
+## source columns (after unquoting) of the typed columns
+DATE_COLUMN = 'Laufzeit von'
+TYPE_COLUMN = 'Klartext Leistungsplansystematik'
+AMOUNT_COLUMN = 'Fördersumme in EUR'
+DISTRICT_COLUMN = 'Gemeindekennziffer'
+
+## ============================================================================================= ##
+
+def unquote(values):
+	"""
+	Strip the Excel text wrappers ="..." from a string column, as whole-column string operations.
+	"""
+	return values.astype(str).str.strip().str.removeprefix('=').str.removeprefix('"').str.removesuffix('"').str.strip()
+
+def parse_nki(path):
+	"""
+	Read the NKI funding list (semicolon separated, latin-1) and add typed columns: date_start (datetime),
+	year_start, project_type and district_code (categoricals) and project_size (funding in k EUR).
+	"""
+	df = pd.read_csv(path, sep=';', encoding=NKI_ENCODING, dtype=str, keep_default_na=False)
+	df.columns = unquote(pd.Series(df.columns)).values
+	for column in df.columns:
+		df[column] = unquote(df[column])
+
+	df['date_start'] = pd.to_datetime(df[DATE_COLUMN], format='%d.%m.%Y')
+	df['year_start'] = df['date_start'].dt.year.astype('int16')
+	df['project_type'] = df[TYPE_COLUMN].str.replace('KSI -', '', regex=False).str.strip().astype('category')
+	df['project_size'] = df[AMOUNT_COLUMN].str.replace('.', '', regex=False).str.replace(',', '.', regex=False).astype(float) / 1000.
+	df['district_code'] = df[DISTRICT_COLUMN].astype('category')
+	return df
+
+def load_nki(path, cachedir=None):
+	"""
+	Typed NKI funding list, cached as Parquet in cachedir (default: cache/ next to the source) under the source
+	file's content hash. A changed source is parsed again, otherwise parsing is skipped entirely.
+	"""
+	cachedir = os.path.join(os.path.dirname(path) or '.', 'cache') if cachedir is None else cachedir
+	name = os.path.splitext(os.path.basename(path))[0]
+	cachefile = os.path.join(cachedir, '{0:s}-{1:s}.parquet'.format(name, file_hash(path)[:KEY_LENGTH]))
+	if os.path.isfile(cachefile):
+		return pd.read_parquet(cachefile)
+
+	df = parse_nki(path)
+	os.makedirs(cachedir, exist_ok=True)
+	for f in os.listdir(cachedir):
+		if f.startswith(name + '-') and f.endswith('.parquet') and (len(f) == len(name) + KEY_LENGTH + 9):
+			os.remove(os.path.join(cachedir, f))
+	df.to_parquet(cachefile + '.tmp', index=False)
+	os.replace(cachefile + '.tmp', cachefile)
+	return df
@@ -3,54 +3,97 @@
 
 import os
 import pandas as pd
-import zipfile
-import urllib.request
+
+from dwd_download import list_archives, download_all, read_meta
+from dwd_parse import parse_archive
+from station_store import write_station, append_station
+from manifest import Manifest, file_hash
+from profiling import RunReport
+from settings import setting
 
 ## ============================================================================================= ##
 
-DATAPATH_DWD_STATIONS = './'
+DATAPATH_DWD_STATIONS = setting('DATAPATH_DWD_STATIONS', './')
+DATAPATH_DWD_ARCHIVES = setting('DATAPATH_DWD_ARCHIVES', './archives/')
+DATAPATH_DWD_STORE = setting('DATAPATH_DWD_STORE', './dwd_cdc_hourly/')
+
+MAX_DOWNLOADS = setting('MAX_DOWNLOADS', 8) # concurrent connections to opendata.dwd.de
+
+INCREMENTAL = setting('INCREMENTAL', True) # only parse new or changed archives and append new hours to the station store
+
+REPORT = setting('REPORT', True) # JSON run report with time, CPU, peak memory, rows and bytes per stage and slow stations
+PROFILE_SAMPLING = setting('PROFILE_SAMPLING', False) # also sample the Python stack and write folded stacks (flame graph input)
 
 ## ============================================================================================= ##
 
-base_url = 'https://opendata.dwd.de/climate_environment/CDC/observations_germany/climate/hourly/air_temperature/historical/'
-
-filelist = pd.read_csv(base_url)
-filelist = [c.split("href=")[1].split('>')[0][1:-1] for c in filelist.iloc[:, 0].values if 'stundenwerte' in c]
-
-df_stations = pd.DataFrame()
-
-for filename in filelist:
-
-	print(filename)
-
-	archivefile = os.path.join(DATAPATH_DWD_STATIONS, filename)
-	urllib.request.urlretrieve(base_url + filename, archivefile)
-	archive = zipfile.ZipFile(archivefile, 'r')
-	ifiles = [s for s in archive.namelist() if 'produkt_' in s]
-	ifp = archive.open(ifiles[0], "r") 
-	lines = ifp.readlines()
-	dfl = pd.DataFrame({'datetime': [str(l).split(';')[1].strip() for l in lines[1:]]})
-	dfl['TT_TU'] = [str(l).split(';')[3].strip() for l in lines[1:]]
-	dfl['RF_TU'] = [str(l).split(';')[4].strip() for l in lines[1:]]
-	dfl['QN_9'] = [str(l).split(';')[2].strip() for l in lines[1:]]
-	station_id = filename.split('_')[2]
-	ofilename = 'dwd_cdc_hourly_air_temperature_TU_{0:s}_{1:s}-{2:s}.csv'.format(\
-			station_id,
-			dfl['datetime'].values[0], dfl['datetime'].values[-1])
-	dfl.to_csv(os.path.join(DATAPATH_DWD_STATIONS, ofilename), index=False)
-
-	ifiles = [s for s in archive.namelist() if (('Geographie' in s) and ('txt' in s))]
-	ifp = archive.open(ifiles[0], "r") 
-	lines = ifp.readlines()
-	newrow = pd.DataFrame({\
-			'station': station_id,
-			'lon': str(lines[-1]).split(';')[3].strip(),
-			'lat': str(lines[-1]).split(';')[2].strip(),
-			'elevation': str(lines[-1]).split(';')[1].strip(),
-			'name': str(lines[-1]).split(';')[-1].strip()[:-3]}, index=[0])
-	df_stations = pd.concat([df_stations, newrow], axis=0, ignore_index=True)
-
-	archive.close()
-	os.remove(archivefile)
-
-df_stations.to_csv(os.path.join(DATAPATH_DWD_STATIONS, 'stations.csv'), index=False)
+variable = 'air_temperature'
+
+report = RunReport(__file__, outdir=DATAPATH_DWD_STATIONS, sampling=PROFILE_SAMPLING, enabled=REPORT)
+
+base_urls = [\
+	'https://opendata.dwd.de/climate_environment/CDC/observations_germany/climate/hourly/air_temperature/historical/',
+	'https://opendata.dwd.de/climate_environment/CDC/observations_germany/climate/hourly/air_temperature/recent/',
+	]
+
+## without INCREMENTAL every archive is parsed again and all stations are rewritten
+manifestfile = os.path.join(DATAPATH_DWD_STATIONS, 'manifest_{0:s}.json'.format(variable))
+if (INCREMENTAL == False) and os.path.isfile(manifestfile):
+	os.remove(manifestfile)
+manifest = Manifest(manifestfile)
+
+stationsfile = os.path.join(DATAPATH_DWD_STATIONS, 'stations.csv')
+stations = [pd.read_csv(stationsfile)] if (INCREMENTAL == True) and os.path.isfile(stationsfile) else []
+
+for base_url in base_urls:
+
+	with report.stage('download') as stage:
+		filelist = list_archives(base_url, pattern='stundenwerte')
+
+		## archives already present with matching size/ETag are skipped, interrupted downloads are resumed
+		downloads = download_all(base_url, filelist, DATAPATH_DWD_ARCHIVES, max_workers=MAX_DOWNLOADS)
+		print('Downloaded: ', sum(d for _, d in downloads.values()), 'of', len(filelist))
+		filelist = [f for f in filelist if f in downloads]
+		stage.add(bytes=sum(os.path.getsize(p) for p, d in downloads.values() if d))
+		stage.info.update({'base_url': base_url, 'archives': len(filelist), 'downloaded': sum(d for _, d in downloads.values())})
+
+	## per archive: parse and write are timed per station, slow stations are listed in the run report
+	with report.stage('parse_write') as stage:
+
+		for filename in filelist:
+
+			archivefile = os.path.join(DATAPATH_DWD_ARCHIVES, filename)
+			sha256 = file_hash(archivefile)
+			if not manifest.archive_changed(filename, sha256):
+				continue
+
+			print(filename)
+			station_id = int(filename.split('_')[2])
+
+			## the archive is parsed from memory, product and geography members are read as typed columns
+			with stage.timed(station_id, step='parse'):
+				with open(archivefile, 'rb') as f:
+					dfl, df_geo = parse_archive(f.read(), variable=variable)
+			stage.add(rows=len(dfl), bytes=os.path.getsize(archivefile))
+
+			## new stations are written completely, known stations only get the hours after their stored range
+			with stage.timed(station_id, step='write'):
+				known = manifest.station_range(variable, station_id)
+				if known is None:
+					write_station(DATAPATH_DWD_STORE, variable, station_id, dfl)
+					changed_from, first, last = int(dfl['datetime'].min()), int(dfl['datetime'].min()), int(dfl['datetime'].max())
+				else:
+					changed_from = append_station(DATAPATH_DWD_STORE, variable, station_id, dfl, after=known[1])
+					first, last = known[0], max(known[1], int(dfl['datetime'].max()))
+
+				manifest.record_station(variable, station_id, first, last, changed_from)
+				manifest.record_archive(filename, base_url + filename, read_meta(archivefile), sha256)
+				manifest.save()
+
+			df_geo['station'] = station_id
+			stations.append(df_geo)
+
+df_stations = pd.concat(stations, axis=0, ignore_index=True).loc[:, ['station', 'lon', 'lat', 'elevation', 'name']]
+df_stations = df_stations.drop_duplicates(subset='station', keep='last').sort_values('station')
+df_stations.to_csv(stationsfile, index=False)
+
+report.save()
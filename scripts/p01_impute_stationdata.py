@@ -2,21 +2,46 @@
 # -*- coding: utf-8 -*-
 
 import os
+import pickle
 import datetime
 import numpy as np
 import pandas as pd
 import geopandas as gpd
 
+from station_store import station_years
+from daily import merge_stations
+from manifest import Manifest
+from imputation import transform_blocked
+from neighbour_imputation import NeighbourImputer
+from station_cube import StationCube
+from profiling import RunReport
+from settings import setting
+
+## ============================================================================================= ##
+
+DATAPATH_DWD_STATIONS = setting('DATAPATH_DWD_STATIONS', './')
+DATAPATH_DWD_STORE = setting('DATAPATH_DWD_STORE', './dwd_cdc_hourly/')
+DATAPATH_MODELS = setting('DATAPATH_MODELS', './models/')
+
 ## ============================================================================================= ##
 
-DATAPATH_DWD_STATIONS = './'
+MERGE = setting('MERGE', False)
+IMPUTATION_LASSO = setting('IMPUTATION_LASSO', False)
+IMPUTATION_NEIGHBOURS = setting('IMPUTATION_NEIGHBOURS', False) # per-station lasso on the N_NEIGHBOURS nearest (or best correlated) stations
+FIXED_NETWORK = setting('FIXED_NETWORK', True) # only stations reporting from 2005 or earlier until 2023; False keeps every station with
+                     # data in 2008-2023, for masked aggregation without imputation in p02
+INCREMENTAL = setting('INCREMENTAL', True) # only recompute stations and days that changed in the station store since the last run
+
+REPORT = setting('REPORT', True) # JSON run report with time, CPU, peak memory, rows and bytes per stage and slow stations
+PROFILE_SAMPLING = setting('PROFILE_SAMPLING', False) # also sample the Python stack and write folded stacks (flame graph input)
+
+VARIABLES = setting('VARIABLES', ['air_temperature'])
 
 ## ============================================================================================= ##
 
-MERGE = False
-IMPUTATION_LASSO = False
+report = RunReport(__file__, outdir=DATAPATH_DWD_STATIONS, sampling=PROFILE_SAMPLING, enabled=REPORT, label='_'.join(VARIABLES))
 
-for variable in ['air_temperature']:
+for variable in VARIABLES:
 
 	## ============================================================================================= ##
 
@@ -29,57 +54,64 @@ for variable in ['air_temperature']:
 
 	## ============================================================================================= ##
 
-	def expand_df(df, dims, values):
-		df = df.set_index(dims)
-		multi_index = (pd.MultiIndex.from_product(
-				iterables=values,
-				names=dims))
-		df = df.reindex(multi_index, fill_value=np.nan).reset_index()
-		df = df.sort_values(by=dims, ascending=True).reset_index(drop=True)
-		return df
+	manifest = Manifest(os.path.join(DATAPATH_DWD_STATIONS, 'manifest_{0:s}.json'.format(variable)))
 
 	## ============================================================================================= ##
 
 	if MERGE == True:
 
-		datapath = os.path.join(DATAPATH_DWD_STATIONS)
-		df_files = pd.DataFrame({'filename': [f for f in os.listdir(datapath) if (('dwd_cdc_' in f) and (variable_filelabel[variable] in f) and ('imputed' not in f))]})
-		df_files['date_range'] = df_files['filename'].apply(lambda x: x.split('_')[-1].split('.csv')[0])
-		df_files['year_last'] = df_files['date_range'].apply(lambda x: int(x.split('-')[1][:4]))
-		df_files['year_first'] = df_files['date_range'].apply(lambda x: int(x.split('-')[0][:4]))
-		df_files = df_files.loc[df_files['year_last'] == 2023, :]
-		df_files = df_files.loc[df_files['year_first'] <= 2005, :]
-		df_files['station'] = df_files['filename'].apply(lambda x: x.split(variable)[-1].split('_')[2])
+		## station selection from the partition layout of the store, no data file is opened
+		df_files = station_years(DATAPATH_DWD_STORE, variable)
+		if FIXED_NETWORK == True:
+			df_files = df_files.loc[df_files['year_last'] == 2023, :]
+			df_files = df_files.loc[df_files['year_first'] <= 2005, :]
+		else:
+			df_files = df_files.loc[(df_files['year_last'] >= 2008) & (df_files['year_first'] <= 2023), :]
 		df_files = df_files.reset_index()
 
 		## ============================================================================================= ##
 
-		df_all = pd.DataFrame()
-
-		for i, row in df_files.iterrows():
-
-			print(i)
-			df = pd.read_csv(os.path.join(datapath, row['filename']))
-			df['station'] = row['station']
-			df = df.replace(-999., np.nan)
-			df['hour'] = df['datetime'].astype(str).apply(lambda x: int(x[-2:]))
-			df['date'] = df['datetime'].astype(int).astype(str).apply(lambda x: datetime.datetime.strptime(x[:-2], "%Y%m%d"))
-			df['date'] = df['date'].apply(lambda x: datetime.datetime.strftime(x, "%Y%m%d"))
-
-			df['nobs'] = df.groupby(['station', 'date'])['TT_TU'].transform(lambda x: x.count())
-			df = df.loc[df['nobs'] == 24, :].drop(columns='nobs')
-
-			df = df.groupby(['station', 'date']).mean().reset_index()
-			df['year'] = df['date'].astype(str).apply(lambda x: int(x[:4]))
-			df = df.loc[df['year'] >= 2008, :]
-			df = df.loc[df['year'] < 2024, :]
-
-			print(row['station'], df.groupby(['year'])['TT_TU'].count())
-
-			df = df.drop(columns=['year', 'hour', 'datetime']).rename(columns={'date': 'datetime'})
-			df_all = pd.concat([df_all, df], axis=0, ignore_index=True)
-
-		df_all.to_csv(os.path.join(datapath, 'dwd_cdc_hourly_2008-2023_{0:s}_daymean.csv'.format(variable)), index=False)
+		datapath = os.path.join(DATAPATH_DWD_STATIONS)
+		datafile = 'dwd_cdc_hourly_2008-2023_{0:s}_daymean.csv'.format(variable)
+
+		if (INCREMENTAL == True) and os.path.isfile(os.path.join(datapath, datafile)):
+
+			df_all = pd.read_csv(os.path.join(datapath, datafile))
+			df_all = df_all.loc[df_all['station'].isin(df_files['station'].values), :]
+
+			## only stations with new hourly data are recomputed, from their first changed day onwards, and stations
+			## of the selection missing in the file (e.g. after changing FIXED_NETWORK) over the full range
+			dirty = manifest.dirty('daily', variable)
+			start = {s: dirty[s] // 100 for s in df_files['station'].values if s in dirty}
+			missing = np.setdiff1d(df_files['station'].values, df_all['station'].unique())
+			start.update({s: 20080101 for s in missing})
+			df_all = df_all.loc[df_all['datetime'].values < df_all['station'].map(start).fillna(np.inf).values, :]
+			timings = {}
+			with report.stage('merge/daily_means') as stage:
+				df_new = merge_stations(DATAPATH_DWD_STORE, variable, list(start.keys()), value_columns, years=(2008, 2023), start=start, timings=timings)
+				stage.add(rows=len(df_new))
+				stage.add_items(timings, step='station')
+			df_all = pd.concat([df_all, df_new], axis=0, ignore_index=True)
+			print('Stations updated: ', len(start))
+
+		else:
+
+			## daily means of complete days (24 hourly values), one worker process per station, gathered at once
+			timings = {}
+			with report.stage('merge/daily_means') as stage:
+				df_all = merge_stations(DATAPATH_DWD_STORE, variable, df_files['station'].values, value_columns, years=(2008, 2023), timings=timings)
+				stage.add(rows=len(df_all))
+				stage.add_items(timings, step='station')
+
+		df_all = df_all.sort_values(by=['station', 'datetime']).reset_index(drop=True)
+		print(df_all.groupby(df_all['datetime'] // 10000)['station'].nunique())
+
+		with report.stage('merge/write') as stage:
+			df_all.to_csv(os.path.join(datapath, datafile), index=False)
+			stage.add(rows=len(df_all), bytes=os.path.getsize(os.path.join(datapath, datafile)))
+
+		manifest.clear('daily', variable)
+		manifest.save()
 
 	## ============================================================================================= ##
 
@@ -89,24 +121,22 @@ for variable in ['air_temperature']:
 	## identify missing values
 	df = df.replace(-999., np.nan)
 
-	## expand data frame
-	datetimes = df['datetime'].unique()
-	datetimes.sort()
-	stations = df['station'].unique()
-	stations.sort()
-	df = expand_df(df, ['station', 'datetime'], [stations, datetimes])
-
 	## account for quality flags
 
 	## nothing to do, see data description from DWD. all values seem to have been checked and if needed corrected
 
+	## expand to a dense, memory-mapped station x day cube
 	datapath = os.path.join(DATAPATH_DWD_STATIONS)
-	datafile = 'dwd_cdc_hourly_2008-2023_{0:s}_daymean_expanded.csv'.format(variable)
-	df.to_csv(os.path.join(datapath, datafile), index=False)
+	datafile = 'dwd_cdc_hourly_2008-2023_{0:s}_daymean_cube'.format(variable)
+	with report.stage('cube') as stage:
+		cube = StationCube.from_long(df, value_columns, path=os.path.join(datapath, datafile))
+		stage.add(rows=len(df), bytes=cube.data.nbytes)
 
 	## ============================================================================================= ##
 
 	from sklearn.linear_model import LassoCV
+	from sklearn.experimental import enable_iterative_imputer
+	from sklearn.impute import IterativeImputer
 
 	if IMPUTATION_LASSO == True:
 
@@ -114,44 +144,71 @@ for variable in ['air_temperature']:
 
 			print(value_column)
 
-			# Step 1: Pivot the dataframe such that rows correspond to time steps and columns to units
-			df_pivot = df.pivot(index='datetime', columns='station', values=value_column)
+			# Step 1: View of the cube with time steps as rows and units as columns (no copy)
+			df_pivot = cube.day_matrix(value_column)
 
-			# Step 2: Randomly sample a subset of time steps for training (e.g., 50% of the time steps)
-			np.random.seed(0)
-			sampled_times = np.random.choice(df_pivot.index, size=int(len(df_pivot) * 0.1), replace=False)
+			datapath = os.path.join(DATAPATH_DWD_STATIONS)
+			datafile = 'dwd_cdc_hourly_2008-2023_{0:s}_daymean_imputed_lasso_{1:s}.csv'.format(variable, value_column)
+			imputerfile = 'imputer_lasso_{0:s}_{1:s}.pkl'.format(variable, value_column)
+
+			# In incremental mode the stored imputer is reused as long as the station set is unchanged,
+			# and only days from the first changed day onwards are imputed again
+			refit = True
+			if (INCREMENTAL == True) and os.path.isfile(os.path.join(datapath, imputerfile)) and os.path.isfile(os.path.join(datapath, datafile)):
+				with open(os.path.join(datapath, imputerfile), 'rb') as f:
+					stored = pickle.load(f)
+				refit = stored['stations'] != list(df_pivot.columns)
+
+			if refit == False:
+				imputer = stored['imputer']
+				dirty = manifest.dirty('impute', variable)
+				from_day = min(dirty.values()) // 100 if len(dirty) > 0 else df_pivot.index.max() + 1
+				print('Imputing days from: ', from_day)
 
-			# Extract the sampled time steps (all units for those time steps)
-			df_sampled = df_pivot.loc[sampled_times]
+			else:
+
+				# Step 2: Randomly sample a subset of time steps for training (e.g., 50% of the time steps)
+				np.random.seed(0)
+				sampled_times = np.random.choice(df_pivot.index, size=int(len(df_pivot) * 0.1), replace=False)
+
+				# Extract the sampled time steps (all units for those time steps)
+				df_sampled = df_pivot.loc[sampled_times]
 
-			# Step 3: Use LassoCV as the estimator for sparse imputation
-			lasso_estimator = LassoCV(cv=10, random_state=0, tol=1.e-2)  # Cross-validated Lasso for optimal regularization
+				# Step 3: Use LassoCV as the estimator for sparse imputation
+				lasso_estimator = LassoCV(cv=10, random_state=0, tol=1.e-2)  # Cross-validated Lasso for optimal regularization
 
-			# Step 4: Initialize IterativeImputer with LassoCV for sparse imputation
-			imputer = IterativeImputer(estimator=lasso_estimator, max_iter=100, random_state=0)
+				# Step 4: Initialize IterativeImputer with LassoCV for sparse imputation
+				imputer = IterativeImputer(estimator=lasso_estimator, max_iter=100, random_state=0)
 
-			# Train the imputer on the sampled data
-			imputer.fit(df_sampled)
+				# Train the imputer on the sampled data
+				with report.stage('impute/lasso_fit') as stage:
+					imputer.fit(df_sampled)
+					stage.add(rows=len(df_sampled))
+					stage.info['value_column'] = value_column
 
-			# Step 5: Apply imputation to the full dataset, time step by time step
-			def impute_time_step(df_group, imputer):
-			    """
-			    Impute missing values for a specific time step using the trained LassoCV-based imputer.
-			    """
-			    data = df_group.values.reshape(1, -1)  # Reshape for single-row transformation
-			    imputed_values = imputer.transform(data)
-			    df_group[:] = imputed_values.reshape(-1)  # Replace the missing values in the group
-			    return df_group
+				with open(os.path.join(datapath, imputerfile), 'wb') as f:
+					pickle.dump({'stations': list(df_pivot.columns), 'imputer': imputer}, f)
 
-			# Impute the missing values time step by time step on the full dataset
-			df_imputed = df_pivot.apply(lambda row: impute_time_step(row, imputer), axis=1)
+				from_day = df_pivot.index.min()
+
+			# Step 5: Apply imputation to the (changed part of the) dataset in blocks of days
+			df_pivot = df_pivot.loc[df_pivot.index >= from_day, :]
+			with report.stage('impute/lasso_transform') as stage:
+				df_imputed = pd.DataFrame(transform_blocked(imputer, df_pivot.values),
+					index=df_pivot.index, columns=df_pivot.columns)
+				stage.add(rows=len(df_pivot))
+				stage.info['value_column'] = value_column
 
 			# Step 6: Convert back to the original long format
 			df_imputed_long = df_imputed.stack().reset_index(name=value_column)
 
-			datapath = os.path.join(DATAPATH_DWD_STATIONS)
-			datafile = 'dwd_cdc_hourly_2008-2023_{0:s}_daymean_imputed_lasso_{1:s}.csv'.format(variable, value_column)
-			df_imputed_long.to_csv(os.path.join(datapath, datafile), index=False)
+			if refit == False:
+				df_old = pd.read_csv(os.path.join(datapath, datafile))
+				df_imputed_long = pd.concat([df_old.loc[df_old['datetime'] < from_day, :], df_imputed_long], axis=0, ignore_index=True)
+
+			with report.stage('impute/write') as stage:
+				df_imputed_long.to_csv(os.path.join(datapath, datafile), index=False)
+				stage.add(rows=len(df_imputed_long), bytes=os.path.getsize(os.path.join(datapath, datafile)))
 
 		for i, value_column in enumerate(value_columns):
 
@@ -166,4 +223,45 @@ for variable in ['air_temperature']:
 
 		datapath = os.path.join(DATAPATH_DWD_STATIONS)
 		datafile = 'dwd_cdc_hourly_2008-2023_{0:s}_daymean_imputed_lasso.csv'.format(variable)
-		df_imputed_allvars.to_csv(os.path.join(datapath, datafile), index=False)
+		with report.stage('impute/write') as stage:
+			df_imputed_allvars.to_csv(os.path.join(datapath, datafile), index=False)
+			stage.add(rows=len(df_imputed_allvars), bytes=os.path.getsize(os.path.join(datapath, datafile)))
+
+		manifest.clear('impute', variable)
+		manifest.save()
+
+	## ============================================================================================= ##
+
+	if IMPUTATION_NEIGHBOURS == True:
+
+		datapath = os.path.join(DATAPATH_DWD_STATIONS)
+		df_stations = pd.read_csv(os.path.join(datapath, 'stations.csv')).rename(columns={'station_id': 'station'})
+
+		for i, value_column in enumerate(value_columns):
+
+			print(value_column)
+
+			df_pivot = cube.day_matrix(value_column)
+
+			# Station models are stored per station and only refitted if their neighbour set changed
+			modeldir = os.path.join(DATAPATH_MODELS, 'neighbours_{0:s}_{1:s}'.format(variable, value_column))
+			with report.stage('impute/neighbours_fit') as stage:
+				imputer = NeighbourImputer(modeldir, selection='correlation').fit(df_pivot, df_stations)
+				stage.add_items({s: {'seconds': imputer.models[s]['fit_seconds']} for s in imputer.fitted}, step='station')
+				stage.info.update({'value_column': value_column, 'fitted': len(imputer.fitted)})
+			with report.stage('impute/neighbours_transform') as stage:
+				df_imputed_long = imputer.transform(df_pivot).stack().reset_index(name=value_column)
+				stage.add(rows=len(df_imputed_long))
+
+			if i == 0:
+				df_imputed_allvars = df_imputed_long.copy()
+			else:
+				df_imputed_allvars = df_imputed_allvars.merge(df_imputed_long, on=['datetime', 'station'], how='outer')
+
+		datapath = os.path.join(DATAPATH_DWD_STATIONS)
+		datafile = 'dwd_cdc_hourly_2008-2023_{0:s}_daymean_imputed_neighbours.csv'.format(variable)
+		with report.stage('impute/write') as stage:
+			df_imputed_allvars.to_csv(os.path.join(datapath, datafile), index=False)
+			stage.add(rows=len(df_imputed_allvars), bytes=os.path.getsize(os.path.join(datapath, datafile)))
+
+report.save()
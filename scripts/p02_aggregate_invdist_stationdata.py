@@ -10,31 +10,62 @@ import numpy as np
 import pandas as pd
 
 import geopandas as gpd
-from geopy.distance import geodesic
+
+from weights import weight_matrix as build_weight_matrix, apply_weights, VERSION as WEIGHTS_VERSION
+from aggregate import station_day_array, aggregate_daily, apply_weights_masked, input_keys, stale_years, write_input_keys
+from hierarchy import LEVEL_NAMES, hierarchy_matrices, level_parents, municipality_weights, rollup_daily
+from boundaries import load_boundaries
+from matrix_cache import MatrixCache, content_hash, geometry_hash, points_hash
+from manifest import Manifest
+from station_cube import StationCube
+from profiling import RunReport
+from settings import setting
 
 ## ============================================================================================= ##
 
-DATAPATH_DWD_STATIONS = './'
-DATAPATH_AGGREGATED_MUNICIPALITY = './'
+DATAPATH_DWD_STATIONS = setting('DATAPATH_DWD_STATIONS', './')
+DATAPATH_AGGREGATED_MUNICIPALITY = setting('DATAPATH_AGGREGATED_MUNICIPALITY', './')
 
 ## ============================================================================================= ##
 
-DISTANCE_CUTOFF = 100 # in km
+DISTANCE_CUTOFF = setting('DISTANCE_CUTOFF', 100) # in km
+DISTANCE_METHOD = setting('DISTANCE_METHOD', 'geodesic') # 'geodesic' (WGS84 ellipsoid) or 'haversine' (sphere, faster)
+WEIGHTING = setting('WEIGHTING', 'idw') # 'idw', 'nearest' (N_NEAREST stations) or 'cutoff' (equal weights)
+IDW_POWER = setting('IDW_POWER', 2.)
+N_NEAREST = setting('N_NEAREST', None)
+
+IMPUTATION = setting('IMPUTATION', 'lasso') # imputed station data from p01: 'lasso', 'neighbours' or None (masked aggregation of the
+                     # non-imputed daily means, weights renormalized over the stations reporting each day)
+
+AGGREGATE = setting('AGGREGATE', True)
+INCREMENTAL = setting('INCREMENTAL', True) # only aggregate the years that contain changed station data
+CALCULATE_DISTANCES = setting('CALCULATE_DISTANCES', False) # force a rebuild of the cached weight matrix even if its inputs are unchanged
+
+ROLLUP = setting('ROLLUP', True) # roll the municipality panel up to coarser administrative levels
+ROLLUP_LEVELS = setting('ROLLUP_LEVELS', ['VWG', 'KRS', 'RBZ', 'LAN'])
+ROLLUP_WEIGHTING = setting('ROLLUP_WEIGHTING', 'area') # 'area' or 'population' (POPULATION_FILE with columns AGS and EWZ)
+POPULATION_FILE = setting('POPULATION_FILE', './population_gemeinde.csv')
+
+REPORT = setting('REPORT', True) # JSON run report with time, CPU, peak memory, rows and bytes per stage
+PROFILE_SAMPLING = setting('PROFILE_SAMPLING', False) # also sample the Python stack and write folded stacks (flame graph input)
 
-AGGREGATE = True
-CALCULATE_DISTANCES = True
+STATIONS_FILE = setting('STATIONS_FILE', 'stations.shp') # stations used in the aggregation, for the validation maps
 
 ## =============================== ##
 
-variable = 'air_temperature'
+variable = setting('VARIABLE', 'air_temperature')
+
+report = RunReport(__file__, outdir=DATAPATH_AGGREGATED_MUNICIPALITY, sampling=PROFILE_SAMPLING, enabled=REPORT, label=variable)
 
 ## ============================================================================================= ##
 
-DATAPATH_SHAPES = './'
+DATAPATH_SHAPES = setting('DATAPATH_SHAPES', './')
 
 datafile = "VG250_GEM.shp"
-gdf_shapes = gpd.read_file(os.path.join(DATAPATH_SHAPES, datafile)).to_crs('EPSG:4326')
-gdf_shapes['centroid'] = gdf_shapes.centroid
+# municipalities from the GeoParquet boundary cache, centroids computed in UTM32 and given as lon/lat
+with report.stage('boundaries') as stage:
+	gdf_shapes = load_boundaries(os.path.join(DATAPATH_SHAPES, datafile), crs='EPSG:4326')
+	stage.add(rows=len(gdf_shapes))
 
 ## ============================================================================================= ##
 
@@ -42,21 +73,33 @@ datapath = os.path.join(DATAPATH_DWD_STATIONS)
 datafile = 'stations.csv'
 df_stations = pd.read_csv(os.path.join(datapath, datafile)).rename(columns={'station_id': 'station'})
 
+manifest = Manifest(os.path.join(DATAPATH_DWD_STATIONS, 'manifest_{0:s}.json'.format(variable)))
+
 ## ============================================================================================= ##
 
 if AGGREGATE == True:
 
 	datapath = os.path.join(DATAPATH_DWD_STATIONS)
-	datafile = 'dwd_cdc_hourly_2008-2023_{0:s}_daymean_imputed_lasso.csv'.format(variable)
-
-	df_daily = pd.read_csv(os.path.join(datapath, datafile))
-	df_mean = df_daily.groupby('station').mean().reset_index()
+	with report.stage('load') as stage:
+		if IMPUTATION is None:
+			# non-imputed daily means as views of the memory-mapped station cube written by p01
+			datafile = 'dwd_cdc_hourly_2008-2023_{0:s}_daymean_cube'.format(variable)
+			cube = StationCube.open(os.path.join(datapath, datafile))
+			with np.errstate(invalid='ignore'):
+				df_mean = pd.DataFrame(dict([('station', cube.stations)] + [(v, np.nanmean(cube.variable(v), axis=1)) for v in cube.variables]))
+			aggregate = apply_weights_masked
+		else:
+			datafile = 'dwd_cdc_hourly_2008-2023_{0:s}_daymean_imputed_{1:s}.csv'.format(variable, IMPUTATION)
+			df_daily = pd.read_csv(os.path.join(datapath, datafile))
+			df_mean = df_daily.groupby('station').mean().reset_index()
+			aggregate = apply_weights
+		stage.add(rows=cube.data[0].size if IMPUTATION is None else len(df_daily))
 
 	value_columns = ['TT_TU']
 
 	## =============================== ##
 
-	dfs = df_stations.loc[df_stations['station'].isin(df_mean['station'].unique()), :].reset_index(drop=True)
+	dfs = df_stations.loc[df_stations['station'].isin(df_mean['station'].unique()), :].sort_values('station').reset_index(drop=True)
 	df_mean = df_mean.loc[df_mean['station'].isin(dfs['station'].unique()), :].reset_index(drop=True)
 	print('Number of stations: ', dfs['station'].nunique())
 
@@ -71,46 +114,30 @@ if AGGREGATE == True:
 	## =============================== ##
 
 	gdf_stations = gpd.GeoDataFrame(dfs, geometry=gpd.points_from_xy(dfs.lon, dfs.lat)).set_crs('EPSG:4326')
-	gdf_stations.to_file(os.path.join(DATAPATH_OUT, 'stations.shp'))
+	gdf_stations.to_file(os.path.join(DATAPATH_AGGREGATED_MUNICIPALITY, STATIONS_FILE))
 
-	# Step 3: Create a weight matrix (n_shapes x n_points)
+	# Step 3: Create a sparse weight matrix (n_shapes x n_points), only station pairs within the cutoff are stored
 	n_shapes = len(gdf_shapes)
 	n_points = len(gdf_stations)
 
-	## =============================== ##
-
-	if CALCULATE_DISTANCES == True:
-
-		print('Calculating distance matrix...')
-
-		distance_matrix = np.zeros((n_shapes, n_points))
-		minimum_distances = []
-
-		# Calculate geodesic distances and inverse distance weights
-		for i, shape in gdf_shapes.iterrows():
-
-			print(i)
-
-			centroid = (shape['centroid'].y, shape['centroid'].x)
-			distances = []
-
-			for j, point in gdf_stations.iterrows():
-				point_coords = (point.geometry.y, point.geometry.x)
-				distance = geodesic(centroid, point_coords).meters / 1000.
-				distance_matrix[i, j] = distance
+	# The cache key covers everything the weights depend on: municipality geometry, station coordinates and weighting
+	weights_key = content_hash(geometry_hash(gdf_shapes), points_hash(dfs['station'], dfs['lat'], dfs['lon']),
+		{'scheme': WEIGHTING, 'cutoff': DISTANCE_CUTOFF, 'k': N_NEAREST, 'power': IDW_POWER, 'method': DISTANCE_METHOD, 'version': WEIGHTS_VERSION})
 
-		np.savetxt(os.path.join(DATAPATH_OUT, 'distance_matrix_gemeinde.txt'), distance_matrix, delimiter=',')
+	def calculate_weights():
+		print('Calculating weight matrix...')
+		return build_weight_matrix(gdf_shapes['centroid_lat'].values, gdf_shapes['centroid_lon'].values,
+			gdf_stations.geometry.y.values, gdf_stations.geometry.x.values,
+			scheme=WEIGHTING, cutoff=DISTANCE_CUTOFF, k=N_NEAREST, power=IDW_POWER, method=DISTANCE_METHOD)
 
-		CALCULATE_DISTANCES = False
+	cache = MatrixCache(os.path.join(DATAPATH_AGGREGATED_MUNICIPALITY, 'cache'))
+	weights_changed = CALCULATE_DISTANCES or not cache.contains('weight_matrix_gemeinde_' + variable, weights_key)
+	with report.stage('distances') as stage:
+		weight_matrix = cache.get('weight_matrix_gemeinde_' + variable, weights_key, calculate_weights, rebuild=CALCULATE_DISTANCES)
+		stage.add(rows=weight_matrix.nnz, bytes=weight_matrix.data.nbytes + weight_matrix.indices.nbytes + weight_matrix.indptr.nbytes)
+		stage.info.update({'cached': not weights_changed, 'municipalities': n_shapes, 'stations': n_points})
 
-	else:
-		distance_matrix = np.loadtxt(os.path.join(DATAPATH_OUT, 'distance_matrix_gemeinde.txt'), delimiter=',')
-
-	## =============================== ##
-
-	distance_matrix[distance_matrix > DISTANCE_CUTOFF] = 0.
-
-	weight_matrix = distance_matrix / distance_matrix.sum(axis=1, keepdims=True)
+	print('Municipalities without station within {0:g} km: '.format(DISTANCE_CUTOFF), (np.diff(weight_matrix.indptr) == 0).sum())
 
 	## =============================== ##
 
@@ -123,7 +150,7 @@ if AGGREGATE == True:
 		value_matrix = df_mean[value_column].values
 
 		# Perform matrix multiplication to get the weighted averages for each shape and time step
-		weighted_avg_matrix = np.dot(weight_matrix, value_matrix.T)  # Multiply weight matrix with value matrix
+		weighted_avg_matrix = aggregate(weight_matrix, value_matrix)  # Multiply weight matrix with value matrix
 		df_agg = pd.DataFrame(weighted_avg_matrix, columns=[value_column], index=gdf_shapes['AGS'].values).reset_index().rename(columns={'index': 'AGS'})
 
 		if i == 0:
@@ -131,6 +158,71 @@ if AGGREGATE == True:
 		else:
 			df_new = df_new.merge(df_agg, on=['AGS'], how='outer')
 
-	datapath = os.path.join(DATAPATH_OUT)
-	datafile = 'data_gemeinde_2008-2023_air_temperature_daymean_invdistances_{0:d}km.csv'.format(DISTANCE_CUTOFF)
-	df_new.to_csv(os.path.join(datapath, datafile), index=False)
+	datapath = os.path.join(DATAPATH_AGGREGATED_MUNICIPALITY)
+	datafile = 'data_gemeinde_2008-2023_{0:s}_daymean_invdistances_{1:g}km.csv'.format(variable, DISTANCE_CUTOFF)
+	with report.stage('write') as stage:
+		df_new.to_csv(os.path.join(datapath, datafile), index=False)
+		stage.add(rows=len(df_new), bytes=os.path.getsize(os.path.join(datapath, datafile)))
+
+	## =============================== ##
+
+	print('Aggregating daily values from stations to districts...')
+
+	# station x day arrays in the station order of the weight matrix, multiplied chunk by chunk and streamed to disk
+	arrays = {}
+	for value_column in value_columns:
+		if IMPUTATION is None:
+			# the cube is used in place if it holds exactly the stations of the weight matrix
+			days = cube.days
+			if np.array_equal(cube.stations, dfs['station'].values):
+				arrays[value_column] = cube.variable(value_column)
+			else:
+				arrays[value_column] = cube.variable(value_column)[cube.select(stations=dfs['station'].values)[0]]
+		else:
+			arrays[value_column], days = station_day_array(df_daily, dfs['station'].values, value_column)
+
+	datapath = os.path.join(DATAPATH_AGGREGATED_MUNICIPALITY)
+	datafile = 'data_gemeinde_2008-2023_{0:s}_daymean_invdistances_{1:g}km.parquet'.format(variable, DISTANCE_CUTOFF)
+
+	# In incremental mode only the years from the first changed station day onwards and the years whose input
+	# differs from the keys stored with the panel (e.g. after a refit or another IMPUTATION) are aggregated again;
+	# changed weights or a different setup rebuild everything
+	keys = input_keys(arrays, days, setup=[IMPUTATION, weights_key, value_columns])
+	years = None
+	dirty = manifest.dirty('aggregate', variable)
+	if (INCREMENTAL == True) and (not weights_changed):
+		years = stale_years(os.path.join(datapath, datafile), keys)
+	if years is not None:
+		from_year = min(dirty.values()) // 1000000 if len(dirty) > 0 else np.inf
+		years = sorted(set(years) | {int(y) for y in np.unique(days // 10000) if y >= from_year})
+		print('Years updated: ', years)
+
+	with report.stage('aggregate/daily') as stage:
+		nrows = aggregate_daily(weight_matrix, arrays, days, gdf_shapes['AGS'].values, os.path.join(datapath, datafile), aggregate=aggregate, years=years)
+		stage.add(rows=nrows, bytes=sum(a.nbytes for a in arrays.values()))
+		stage.info['years'] = 'all' if years is None else ','.join(str(y) for y in years)
+	print('Municipality-days written: ', nrows)
+
+	## =============================== ##
+
+	if ROLLUP == True:
+
+		print('Rolling municipalities up to {0:s}...'.format(', '.join(ROLLUP_LEVELS)))
+
+		# membership matrices from the AGS/ARS prefixes, one sparse product per level and part file
+		population = pd.read_csv(POPULATION_FILE, dtype={'AGS': str}).set_index('AGS')['EWZ'] if ROLLUP_WEIGHTING == 'population' else None
+		rollup_weights = municipality_weights(gdf_shapes, weighting=ROLLUP_WEIGHTING, population=population)
+		matrices = hierarchy_matrices(gdf_shapes, levels=ROLLUP_LEVELS, weights=rollup_weights, parents=level_parents(DATAPATH_SHAPES, ROLLUP_LEVELS))
+
+		outpaths = {level: os.path.join(datapath, datafile.replace('gemeinde', LEVEL_NAMES[level])) for level in ROLLUP_LEVELS}
+		with report.stage('rollup') as stage:
+			nrows = rollup_daily(os.path.join(datapath, datafile), matrices, outpaths, gdf_shapes['AGS'].values, years=years)
+			stage.add(rows=sum(nrows.values()))
+			stage.info.update(nrows)
+		print('Unit-days written: ', nrows)
+
+	write_input_keys(os.path.join(datapath, datafile), keys)
+	manifest.clear('aggregate', variable)
+	manifest.save()
+
+report.save()
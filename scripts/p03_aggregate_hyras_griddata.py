@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from dwd_download import download_all
+from hyras import PRODUCTS, hyras_url, hyras_filename, read_grid, coverage_fractions, aggregate_grid
+from hierarchy import LEVEL_NAMES, hierarchy_matrices, level_parents, municipality_weights, rollup_daily
+from boundaries import load_boundaries
+from matrix_cache import MatrixCache, content_hash, geometry_hash
+
+## ============================================================================================= ##
+
+DATAPATH_HYRAS = './hyras/'
+DATAPATH_SHAPES = './'
+DATAPATH_AGGREGATED_MUNICIPALITY = './'
+
+MAX_DOWNLOADS = 4 # concurrent connections to opendata.dwd.de
+
+## ============================================================================================= ##
+
+DOWNLOAD = True
+AGGREGATE = True
+CALCULATE_COVERAGE = False # force a rebuild of the cached coverage matrix even if grid and polygons are unchanged
+
+ROLLUP = True # roll the municipality panel up to coarser administrative levels
+ROLLUP_LEVELS = ['VWG', 'KRS', 'RBZ', 'LAN']
+ROLLUP_WEIGHTING = 'area' # 'area' or 'population' (POPULATION_FILE with columns AGS and EWZ)
+POPULATION_FILE = './population_gemeinde.csv'
+
+## =============================== ##
+
+product = 'air_temperature_mean' # 'air_temperature_mean', 'air_temperature_max' or 'precipitation'
+years = range(2008, 2024)
+
+variable = PRODUCTS[product][0]
+filelist = [hyras_filename(product, year) for year in years]
+
+## ============================================================================================= ##
+
+if DOWNLOAD == True:
+
+	downloads = download_all(hyras_url(product), filelist, DATAPATH_HYRAS, max_workers=MAX_DOWNLOADS)
+	print('Downloaded: ', sum(d for _, d in downloads.values()), 'of', len(filelist))
+
+files = [os.path.join(DATAPATH_HYRAS, f) for f in filelist if os.path.isfile(os.path.join(DATAPATH_HYRAS, f))]
+
+## ============================================================================================= ##
+
+if AGGREGATE == True:
+
+	datafile = "VG250_GEM.shp"
+	gdf_shapes = load_boundaries(os.path.join(DATAPATH_SHAPES, datafile))
+
+	if len(files) == 0:
+		raise FileNotFoundError('No HYRAS files of {0:s} {1:d}-{2:d} in DATAPATH_HYRAS ({3:s}), set DOWNLOAD = True or check the download'.format(\
+			product, years[0], years[-1], os.path.abspath(DATAPATH_HYRAS)))
+
+	## all yearly files of a product share one grid, the coverage matrix is computed once per grid and polygon layer
+	x, y, crs = read_grid(files[0])
+	gdf_shapes = gdf_shapes.to_crs(crs)
+
+	coverage_key = content_hash(geometry_hash(gdf_shapes), x, y, crs)
+
+	def calculate_coverage():
+		print('Calculating cell coverage fractions...')
+		return coverage_fractions(gdf_shapes.geometry.values, x, y)
+
+	cache = MatrixCache(os.path.join(DATAPATH_AGGREGATED_MUNICIPALITY, 'cache'))
+	coverage = cache.get('coverage_gemeinde_{0:s}'.format(PRODUCTS[product][1]), coverage_key, calculate_coverage, rebuild=CALCULATE_COVERAGE)
+
+	print('Municipalities without grid cell: ', (np.diff(coverage.indptr) == 0).sum())
+
+	## =============================== ##
+
+	print('Aggregating daily grids to municipalities...')
+
+	datapath = os.path.join(DATAPATH_AGGREGATED_MUNICIPALITY)
+	datafile = 'data_gemeinde_{0:d}-{1:d}_{2:s}_hyras_areaweighted.parquet'.format(min(years), max(years), variable)
+
+	nrows = aggregate_grid(coverage, files, variable, gdf_shapes['AGS'].values, os.path.join(datapath, datafile))
+	print('Municipality-days written: ', nrows)
+
+	## =============================== ##
+
+	if ROLLUP == True:
+
+		print('Rolling municipalities up to {0:s}...'.format(', '.join(ROLLUP_LEVELS)))
+
+		# membership matrices from the AGS/ARS prefixes, one sparse product per level and part file
+		population = pd.read_csv(POPULATION_FILE, dtype={'AGS': str}).set_index('AGS')['EWZ'] if ROLLUP_WEIGHTING == 'population' else None
+		rollup_weights = municipality_weights(gdf_shapes, weighting=ROLLUP_WEIGHTING, population=population)
+		matrices = hierarchy_matrices(gdf_shapes, levels=ROLLUP_LEVELS, weights=rollup_weights, parents=level_parents(DATAPATH_SHAPES, ROLLUP_LEVELS))
+
+		outpaths = {level: os.path.join(datapath, datafile.replace('gemeinde', LEVEL_NAMES[level])) for level in ROLLUP_LEVELS}
+		nrows = rollup_daily(os.path.join(datapath, datafile), matrices, outpaths, gdf_shapes['AGS'].values)
+		print('Unit-days written: ', nrows)
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+
+import numpy as np
+import pandas as pd
+
+import geopandas as gpd
+
+from aggregate import read_daily
+from boundaries import load_boundaries
+from linking import WindowPanel, panel_array, part_weights, days_back_window, months_window
+from climatology import Climatology
+
+## ============================================================================================= ##
+
+DATAPATH_SURVEY = './'
+DATAPATH_SHAPES = './'
+DATAPATH_AGGREGATED_MUNICIPALITY = './'
+
+## ============================================================================================= ##
+
+SURVEY_FILE = 'survey.csv' # one row per respondent with DATE_COLUMN and either an AGS column or coordinates x, y
+SURVEY_CRS = 'EPSG:3035' # CRS of the x, y coordinates (INSPIRE grid cells of the GESIS Panel)
+DATE_COLUMN = 'date'
+
+PANEL_FILE = 'data_gemeinde_2008-2023_air_temperature_daymean_invdistances_100km.parquet'
+value_column = 'TT_TU'
+
+## window definitions as in gxc_link_dwd: days_back days before the interview, or a month window ('P' months lie in
+## the year before the interview)
+LINKS = [\
+	{'name': 'temperature_mean_0d', 'days_back': None},
+	{'name': 'temperature_mean_7d', 'days_back': 7},
+	{'name': 'temperature_mean_30d', 'days_back': 30},
+	{'name': 'temperature_mean_mam', 'months': [3, 4, 5]},
+	{'name': 'temperature_mean_winter', 'months': ['P12', 1, 2]},
+	{'name': 'temperature_anomaly_30d', 'days_back': 30, 'statistic': 'anomaly', 'reference_years': (2008, 2017)},
+	{'name': 'temperature_hotdays_mam', 'months': [3, 4, 5], 'statistic': 'exceedance', 'quantile': 0.9, 'reference_years': (2008, 2017)},
+	]
+
+## anomalies and exceedances are taken against day-of-year climatologies of the reference years, computed once for
+## all municipalities and stored next to the panel
+CLIMATOLOGY_WINDOW = 7 # days on either side of a day of year
+QUANTILES = [0.1, 0.5, 0.9]
+CALCULATE_CLIMATOLOGY = False # force a rebuild of stored climatologies
+
+## ============================================================================================= ##
+
+datapath = os.path.join(DATAPATH_SURVEY)
+if SURVEY_FILE.endswith('.dta'):
+	df_survey = pd.read_stata(os.path.join(datapath, SURVEY_FILE))
+else:
+	df_survey = pd.read_csv(os.path.join(datapath, SURVEY_FILE), dtype={'AGS': str})
+
+## the panel has one row per shape; municipalities with several shapes (land and water parts share one AGS)
+## are combined area-weighted
+gdf_shapes = load_boundaries(os.path.join(DATAPATH_SHAPES, 'VG250_GEM.shp'), columns=['AGS']).loc[:, ['AGS', 'geometry']]
+
+## respondents without AGS are placed in their municipality by their coordinates
+if 'AGS' not in df_survey.columns:
+	gdf_survey = gpd.GeoDataFrame(df_survey, geometry=gpd.points_from_xy(df_survey['x'], df_survey['y']), crs=SURVEY_CRS)
+	gdf_survey = gpd.sjoin(gdf_survey.to_crs(gdf_shapes.crs), gdf_shapes, how='left', predicate='within')
+	df_survey = pd.DataFrame(gdf_survey[~gdf_survey.index.duplicated()].drop(columns=['geometry', 'index_right']))
+
+print('Respondents: ', len(df_survey), ' without municipality: ', df_survey['AGS'].isna().sum())
+
+## ============================================================================================= ##
+
+## one window per respondent and link, the panel is only read for the years and municipalities they touch
+windows = {}
+for link in LINKS:
+	if link.get('months') is not None:
+		windows[link['name']] = months_window(df_survey[DATE_COLUMN].values, link['months'])
+	else:
+		windows[link['name']] = days_back_window(df_survey[DATE_COLUMN].values, link.get('days_back'))
+
+first_year = min(start.min() for start, _ in windows.values()).astype('datetime64[Y]').astype(int) + 1970
+last_year = max(stop.max() for _, stop in windows.values()).astype('datetime64[Y]').astype(int) + 1970
+
+datapath = os.path.join(DATAPATH_AGGREGATED_MUNICIPALITY)
+df_panel = read_daily(os.path.join(datapath, PANEL_FILE), columns=['AGS', 'datetime', value_column],
+	years=range(first_year, last_year + 1), targets=df_survey['AGS'].dropna().unique())
+
+units, first_day, values = panel_array(df_panel, value_column, weights=part_weights(df_panel, gdf_shapes))
+panels = {'mean': WindowPanel(units, first_day, values)}
+
+## =============================== ##
+
+def climatology(reference_years):
+	path = os.path.join(datapath, 'climatology', '{0:s}_{1:s}_reference={2:d}_to_{3:d}_window={4:d}'.format(\
+		os.path.splitext(PANEL_FILE)[0], value_column, reference_years[0], reference_years[1], CLIMATOLOGY_WINDOW))
+	if os.path.isfile(os.path.join(path, 'meta.json')) and (CALCULATE_CLIMATOLOGY == False):
+		return Climatology.open(path)
+
+	print('Calculating climatology {0:d}-{1:d}...'.format(*reference_years))
+	df_reference = read_daily(os.path.join(datapath, PANEL_FILE), columns=['AGS', 'datetime', value_column],
+		years=range(reference_years[0], reference_years[1] + 1))
+	clim = Climatology.compute(*panel_array(df_reference, value_column, dtype=np.float32, weights=part_weights(df_reference, gdf_shapes)), reference_years,
+		window=CLIMATOLOGY_WINDOW, probs=QUANTILES)
+	clim.save(path)
+	return clim
+
+## the derived anomaly and exceedance panels are built once per reference period and shared by all links
+for link in LINKS:
+	statistic = link.get('statistic', 'mean')
+	start, stop = windows[link['name']]
+
+	if statistic in ['anomaly', 'exceedance']:
+		key = (statistic, tuple(link['reference_years']), link.get('quantile'))
+		if key not in panels:
+			clim = climatology(link['reference_years'])
+			if statistic == 'anomaly':
+				panels[key] = clim.anomaly_panel(units, first_day, values)
+			else:
+				panels[key] = clim.exceedance_panel(units, first_day, values, prob=link['quantile'])
+		df_survey[link['name']] = panels[key].link(df_survey['AGS'].values, start, stop, statistic='mean')
+	else:
+		df_survey[link['name']] = panels['mean'].link(df_survey['AGS'].values, start, stop, statistic=statistic)
+
+datafile = os.path.splitext(SURVEY_FILE)[0] + '_linked.csv'
+df_survey.to_csv(os.path.join(DATAPATH_SURVEY, datafile), index=False)
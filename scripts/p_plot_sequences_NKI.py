@@ -6,46 +6,25 @@ import os
 import numpy as np
 import pandas as pd
 
-import datetime
-
 import matplotlib.pyplot as plt
 import matplotlib as mpl
 import seaborn as sns
 
 import geopandas as gpd
 
+from nki import load_nki
+from precedence import precedence_table, bootstrap_table
+
 ## ============================================================= ##
 
 DATAPATH = './'
 FIGUREPATH = './'
 
-## ============================================================= ##
+BOOTSTRAP = True # confidence intervals and ordering stability from resampled districts
+N_BOOTSTRAP = 2000
+SEED = 0
 
-def expand_df(df, dims, values):
-	df = df.set_index(dims)
-	multi_index = (pd.MultiIndex.from_product(
-			iterables=values,
-			names=dims))
-	df = df.reindex(multi_index, fill_value=np.nan).reset_index()
-	df = df.sort_values(by=dims, ascending=True).reset_index(drop=True)
-	return df
-
-def sequence(df_prob):
-	cols = list(df_prob.columns)
-	rows = list(df_prob.index)
-	order = []
-	for n in range(df_prob.shape[0]):
-		counters = [0] * len(rows)
-		for i, dim1 in enumerate(rows):
-			for j, dim2 in enumerate([c for c in cols if c != dim1]):
-				if ((dim1 in df_prob.index) and (dim2 in df_prob.columns) and 
-					(dim1 in df_prob.columns) and (dim2 in df_prob.index)):
-					if df_prob.loc[dim1, dim2] > df_prob.loc[dim2, dim1]:
-						counters[i] += 1
-		first = list(reversed([x for _, x in sorted(zip(counters, rows))]))[0]
-		order.append(first)
-		rows.remove(first)
-	return order
+## ============================================================= ##
 
 policy2policy = {\
 	'Erstellung von Klimaschutzkonzepten': "Climate strategy", 
@@ -59,49 +38,25 @@ policy2policy = {\
 
 ## ============================================================= ##
 
-df = pd.read_csv(os.path.join(DATAPATH, 'NKI_full_list_06122023.csv'), sep=';', encoding='latin-1')
-
-## ============================================================= ##
-
-df['date_start'] = df['="Laufzeit von"'].apply(lambda x: datetime.datetime.strptime(x[2:-1].strip(), '%d.%m.%Y'))
-df['year_start'] = df['date_start'].apply(lambda x: int(x.year))
-df['project_type'] = df['="Klartext Leistungsplansystematik"'].apply(lambda x: x[2:-1].strip().replace('KSI -', '').strip())
-df['project_size'] = df['="Fördersumme in EUR"'].apply(lambda x: float(x.replace('.', '').replace(',', '.').strip())) / 1000.
-df['district_code'] = df['="Gemeindekennziffer"'].apply(lambda x: x[2:-1].strip())
+# typed columns (date_start, year_start, project_type, project_size, district_code), cached after the first run
+df = load_nki(os.path.join(DATAPATH, 'NKI_full_list_06122023.csv'))
 
 ## ============================================================= ##
 
-df_first = df.groupby(['district_code', 'project_type'])['year_start'].min().reset_index()
+df_first = df.groupby(['district_code', 'project_type'], observed=True)['year_start'].min().reset_index()
 policies = df_first['project_type'].unique()
 
 ## ============================================================= ##
 ## all policies
 ## ============================================================= ##
 
-df_results = pd.DataFrame(columns=['policy_first', 'policy_second'])
-
-for policy in policies:
-	df1 = df_first.loc[df_first['project_type'] == policy, :]
-	for other_policy in [p for p in policies if p != policy]:
-		df2 = df_first.loc[df_first['project_type'] == other_policy, :]
-		df_both = df1.merge(df2, on='district_code', how='outer')
-		df_both['sequence'] = df_both['year_start_x'] < df_both['year_start_y']
-
-		df_results = pd.concat([df_results,
-			pd.DataFrame({'policy_first': policy, 'policy_second': other_policy,
-							'freq': df_both['sequence'].sum() / df1.shape[0]}, index=[0])], axis=0)
-
-## ============================================================= ##
-
-df_prob = df_results.pivot_table(index=['policy_second'], columns=['policy_first'], values=['freq'])
-df_prob = df_prob.T
-df_prob.index = [s[1] for s in df_prob.index.values]
-df_prob = df_prob * 100.
-seq = sequence(df_prob)
-
-## ============================================================= ##
+# first adoption years as district x policy matrix, all pairwise frequencies at once, rows/columns in precedence order
+df_prob = precedence_table(df_first)
 
-df_prob = df_prob.loc[seq, seq]
+if BOOTSTRAP == True:
+	df_ci, df_stability = bootstrap_table(df_first, n_boot=N_BOOTSTRAP, seed=SEED)
+	df_ci.to_csv(os.path.join(DATAPATH, 'probabilities_sequences_all_bootstrap.csv'), index=False)
+	df_stability.to_csv(os.path.join(DATAPATH, 'order_sequences_all_bootstrap.csv'), index=False)
 
 xticklabels = df_prob.index.values
 yticklabels = df_prob.columns.values
@@ -132,30 +87,13 @@ fig.savefig(os.path.join(FIGUREPATH, 'heatmap_probabilities_sequences_all.png'),
 policies_frequent = df['project_type'].value_counts()
 policies = policies_frequent[policies_frequent > 100.].index
 
-df_results = pd.DataFrame(columns=['policy_first', 'policy_second'])
+# first adoption years as district x policy matrix, all pairwise frequencies at once, rows/columns in precedence order
+df_prob = precedence_table(df_first, items=policies)
 
-for policy in policies:
-	df1 = df_first.loc[df_first['project_type'] == policy, :]
-	for other_policy in [p for p in policies if p != policy]:
-		df2 = df_first.loc[df_first['project_type'] == other_policy, :]
-		df_both = df1.merge(df2, on='district_code', how='outer')
-		df_both['sequence'] = df_both['year_start_x'] < df_both['year_start_y']
-
-		df_results = pd.concat([df_results,
-			pd.DataFrame({'policy_first': policy, 'policy_second': other_policy,
-							'freq': df_both['sequence'].sum() / df1.shape[0]}, index=[0])], axis=0)
-
-## ============================================================= ##
-
-df_prob = df_results.pivot_table(index=['policy_second'], columns=['policy_first'], values=['freq'])
-df_prob = df_prob.T
-df_prob.index = [s[1] for s in df_prob.index.values]
-df_prob = df_prob * 100.
-seq = sequence(df_prob)
-
-## ============================================================= ##
-
-df_prob = df_prob.loc[seq, seq]
+if BOOTSTRAP == True:
+	df_ci, df_stability = bootstrap_table(df_first, items=policies, n_boot=N_BOOTSTRAP, seed=SEED)
+	df_ci.to_csv(os.path.join(DATAPATH, 'probabilities_sequences_frequent_bootstrap.csv'), index=False)
+	df_stability.to_csv(os.path.join(DATAPATH, 'order_sequences_frequent_bootstrap.csv'), index=False)
 
 xticklabels = df_prob.index.values
 yticklabels = df_prob.columns.values
@@ -186,30 +124,13 @@ fig.savefig(os.path.join(FIGUREPATH, 'heatmap_probabilities_sequences_frequent.p
 policies_frequent = df['project_type'].value_counts()
 policies = list(policy2policy.keys())
 
-df_results = pd.DataFrame(columns=['policy_first', 'policy_second'])
-
-for policy in policies:
-	df1 = df_first.loc[df_first['project_type'] == policy, :]
-	for other_policy in [p for p in policies if p != policy]:
-		df2 = df_first.loc[df_first['project_type'] == other_policy, :]
-		df_both = df1.merge(df2, on='district_code', how='outer')
-		df_both['sequence'] = df_both['year_start_x'] < df_both['year_start_y']
-
-		df_results = pd.concat([df_results,
-			pd.DataFrame({'policy_first': policy, 'policy_second': other_policy,
-							'freq': df_both['sequence'].sum() / df1.shape[0]}, index=[0])], axis=0)
-
-## ============================================================= ##
-
-df_prob = df_results.pivot_table(index=['policy_second'], columns=['policy_first'], values=['freq'])
-df_prob = df_prob.T
-df_prob.index = [s[1] for s in df_prob.index.values]
-df_prob = df_prob * 100.
-seq = sequence(df_prob)
-
-## ============================================================= ##
+# first adoption years as district x policy matrix, all pairwise frequencies at once, rows/columns in precedence order
+df_prob = precedence_table(df_first, items=policies)
 
-df_prob = df_prob.loc[seq, seq]
+if BOOTSTRAP == True:
+	df_ci, df_stability = bootstrap_table(df_first, items=policies, n_boot=N_BOOTSTRAP, seed=SEED)
+	df_ci.to_csv(os.path.join(DATAPATH, 'probabilities_sequences_selected_bootstrap.csv'), index=False)
+	df_stability.to_csv(os.path.join(DATAPATH, 'order_sequences_selected_bootstrap.csv'), index=False)
 
 xticklabels = df_prob.index.values
 yticklabels = df_prob.columns.values
@@ -11,15 +11,20 @@ import matplotlib.pyplot as plt
 import matplotlib as mpl
 import seaborn as sns
 
+from settings import setting
+
 ## ============================ ##
 
-DATAPATH = './'
-FIGUREPATH = './'
+DATAPATH = setting('DATAPATH', './')
+FIGUREPATH = setting('FIGUREPATH', './')
+
+DISTANCE_CUTOFF = setting('DISTANCE_CUTOFF', 100) # in km, station aggregation of p02 to validate
+STATIONS_FILE = setting('STATIONS_FILE', 'stations.shp') # station locations written by p02
 
 ## ============================ ##
 
 df = pd.read_csv(os.path.join(DATAPATH, 'municipality_shape_era5_dwd.csv'))
-df2 = pd.read_csv(os.path.join(DATAPATH, 'data_gemeinde_2008-2023_air_temperature_daymean_invdistances_100km.csv'))
+df2 = pd.read_csv(os.path.join(DATAPATH, 'data_gemeinde_2008-2023_air_temperature_daymean_invdistances_{0:g}km.csv'.format(DISTANCE_CUTOFF)))
 df = df.merge(df2, on='AGS', how='outer')
 
 #df['era5_total_precipitation'] = df['era5_total_precipitation'] * (365.25 / 12.) * 1000
@@ -55,16 +60,18 @@ fig.savefig(os.path.join(FIGUREPATH, 'histogram_difference_precipitation.pdf'),
 """
 ## ============================ ##
 
-fig, ax = plt.subplots(figsize=(5, 4))
-ax.hist(df['diff_temperature_dwd'], bins=np.arange(-4.5, 4.5+0.1, 0.1))
-ylims = ax.get_ylim()
-ax.plot([0., 0.], ylims, 'k-')
-ax.set_ylim(ylims)
-ax.set_ylabel('Municipalities')
-ax.set_xlabel('Temperature at 2 metres (degree C)\nDWD grid minus DWD stations')
-sns.despine(ax=ax, offset=1., right=True, top=True)
-#plt.xticks(rotation=10)
-fig.savefig(os.path.join(FIGUREPATH, 'histogram_difference_temperature_dwd.pdf'), dpi=300, bbox_inches='tight', transparent=True)
+def plot_histogram_difference_dwd(df):
+	fig, ax = plt.subplots(figsize=(5, 4))
+	ax.hist(df['diff_temperature_dwd'], bins=np.arange(-4.5, 4.5+0.1, 0.1))
+	ylims = ax.get_ylim()
+	ax.plot([0., 0.], ylims, 'k-')
+	ax.set_ylim(ylims)
+	ax.set_ylabel('Municipalities')
+	ax.set_xlabel('Temperature at 2 metres (degree C)\nDWD grid minus DWD stations')
+	sns.despine(ax=ax, offset=1., right=True, top=True)
+	#plt.xticks(rotation=10)
+	fig.savefig(os.path.join(FIGUREPATH, 'histogram_difference_temperature_dwd.pdf'), dpi=300, bbox_inches='tight', transparent=True)
+	return 'histogram_difference_temperature_dwd.pdf'
 
 ## ============================ ##
 """
@@ -74,7 +81,7 @@ datafile = "VG250_GEM.shp"
 gdf_muni = gpd.read_file(os.path.join(DATAPATH, datafile)).to_crs('epsg:4326')
 gdf_muni['AGS'] = gdf_muni['AGS'].astype(int)
 
-datafile = "stations.shp"
+datafile = STATIONS_FILE
 gdf_stations = gpd.read_file(os.path.join(DATAPATH, datafile))
 
 gdf = gdf_muni.merge(df, on='AGS', how='outer')
@@ -106,34 +113,47 @@ fig.savefig(os.path.join(FIGUREPATH, 'map_difference.png'), bbox_inches='tight',
 
 import geopandas as gpd
 
+from rendering import load_for_figure, render_figures
+
+def plot_map_difference_dwd(gdf_muni, gdf, gdf_stations):
+	cmap = plt.cm.seismic
+	bounds = np.arange(-3., 3.5, 0.5)
+	norm = mpl.colors.BoundaryNorm(bounds, cmap.N)
+	formatcode = '%.1f'
+
+	fig, ax = plt.subplots(figsize=(4,6))
+	ax2 = fig.add_axes([0.94, 0.16, 0.03, 0.68])
+	cb = mpl.colorbar.ColorbarBase(ax2, cmap=cmap, norm=norm,
+					spacing='uniform', ticks=bounds, boundaries=bounds, format=formatcode,
+					extend='both', orientation='vertical')
+	cb.ax.tick_params(labelsize='medium')
+	cb.set_label(label="Temperature at 2 metres (degree C)\nDWD grid minus DWD stations", size='medium')
+	gdf_muni.plot(ax=ax, alpha=1., facecolor='none', lw=0.5, edgecolor='k')
+	gdf.plot(ax=ax, alpha=1., column='diff_temperature_dwd', lw=0.2, cmap=cmap, norm=norm, edgecolor='none', markersize=1.)
+	gdf_stations.plot(ax=ax, markersize=1., marker='o', color='m')
+	#ax.set_xlim(-130., 180.)
+	#ax.set_ylim(-60., 75.)
+	ax.set_xlabel(None)
+	ax.set_ylabel(None)
+	ax.set_xticks([])
+	ax.set_yticks([])
+	fig.savefig(os.path.join(FIGUREPATH, 'map_difference_DWD.png'), bbox_inches='tight', dpi=400)
+	return 'map_difference_DWD.png'
+
+# municipality polygons simplified to the level that is still finer than a pixel of the 6 in / 400 dpi map
 datafile = "VG250_GEM.shp"
-gdf_muni = gpd.read_file(os.path.join(DATAPATH, datafile)).to_crs('epsg:4326')
+gdf_muni = load_for_figure(os.path.join(DATAPATH, datafile), figsize=(4,6), dpi=400, crs='EPSG:4326', columns=['AGS'])
 gdf_muni['AGS'] = gdf_muni['AGS'].astype(int)
 
-datafile = "stations.shp"
+datafile = STATIONS_FILE
 gdf_stations = gpd.read_file(os.path.join(DATAPATH, datafile))
 
 gdf = gdf_muni.merge(df, on='AGS', how='outer')
 
-cmap = plt.cm.seismic
-bounds = np.arange(-3., 3.5, 0.5)
-norm = mpl.colors.BoundaryNorm(bounds, cmap.N)
-formatcode = '%.1f'
+## ============================ ##
 
-fig, ax = plt.subplots(figsize=(4,6))
-ax2 = fig.add_axes([0.94, 0.16, 0.03, 0.68])
-cb = mpl.colorbar.ColorbarBase(ax2, cmap=cmap, norm=norm,
-				spacing='uniform', ticks=bounds, boundaries=bounds, format=formatcode,
-				extend='both', orientation='vertical')
-cb.ax.tick_params(labelsize='medium')
-cb.set_label(label="Temperature at 2 metres (degree C)\nDWD grid minus DWD stations", size='medium')
-gdf_muni.plot(ax=ax, alpha=1., facecolor='none', lw=0.5, edgecolor='k')
-gdf.plot(ax=ax, alpha=1., column='diff_temperature_dwd', lw=0.2, cmap=cmap, norm=norm, edgecolor='none', markersize=1.)
-gdf_stations.plot(ax=ax, markersize=1., marker='o', color='m')
-#ax.set_xlim(-130., 180.)
-#ax.set_ylim(-60., 75.)
-ax.set_xlabel(None)
-ax.set_ylabel(None)
-ax.set_xticks([])
-ax.set_yticks([])
-fig.savefig(os.path.join(FIGUREPATH, 'map_difference_DWD.png'), bbox_inches='tight', dpi=400)
+# the histogram and the map are independent and rendered in parallel worker processes
+render_figures([\
+	(plot_map_difference_dwd, (gdf_muni, gdf, gdf_stations)),
+	(plot_histogram_difference_dwd, (df,)),
+	])
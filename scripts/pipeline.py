@@ -0,0 +1,289 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import ast
+import sys
+import json
+import time
+import datetime
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from manifest import file_hash
+from matrix_cache import content_hash
+from settings import environment
+
+## ============================================================================================= ##
+
+SCRIPTPATH = os.path.dirname(os.path.abspath(__file__))
+
+## stage keys, output names and hashes of all previous runs, in the working directory of the pipeline
+STATEFILE = 'pipeline_state.json'
+LOGDIR = 'logs'
+
+## ============================================================================================= ##
+
+class Stage:
+	"""
+	One step of the pipeline: a script run with settings (passed as GEOCLIP_<name> environment variables, see
+	settings.setting) that reads inputs and writes outputs (files or directories, relative to the working
+	directory). Stages that read the outputs of another stage run after it; after adds further dependencies.
+	A stage is up to date if its key (hash of its code, settings and the content of its inputs) equals the key of
+	its last successful run and all its outputs exist. always marks stages whose real inputs cannot be hashed
+	(e.g. remote archives); they run every time unless the runner is told to skip them.
+	"""
+
+	def __init__(self, name, script, inputs=(), outputs=(), settings=None, after=(), always=False):
+		self.name = name
+		self.script = script
+		self.inputs = [os.path.normpath(i) for i in inputs]
+		self.outputs = [os.path.normpath(o) for o in outputs]
+		self.settings = dict(settings or {})
+		self.after = list(after)
+		self.always = always
+
+	def __repr__(self):
+		return 'Stage({0:s})'.format(self.name)
+
+## ============================================================================================= ##
+
+def local_modules(script, scriptpath=SCRIPTPATH):
+	"""
+	Paths of the script and of all modules of scriptpath it imports, directly or through other local modules.
+	"""
+	found, todo = [], [os.path.join(scriptpath, script)]
+	while len(todo) > 0:
+		path = todo.pop()
+		if path in found:
+			continue
+		found.append(path)
+		with open(path, 'r', encoding='utf-8') as f:
+			tree = ast.parse(f.read(), filename=path)
+		for node in ast.walk(tree):
+			if isinstance(node, ast.Import):
+				names = [alias.name for alias in node.names]
+			elif isinstance(node, ast.ImportFrom) and (node.level == 0) and (node.module is not None):
+				names = [node.module]
+			else:
+				continue
+			for name in names:
+				module = os.path.join(scriptpath, name.split('.')[0] + '.py')
+				if os.path.isfile(module):
+					todo.append(module)
+	return sorted(found)
+
+def _parts(path):
+	"""
+	A shapefile stands for all files with its stem (.shp, .dbf, .shx, .prj, ...), any other path for itself.
+	"""
+	if not path.endswith('.shp'):
+		return [path]
+	directory = os.path.dirname(path) or '.'
+	stem = os.path.splitext(os.path.basename(path))[0]
+	if not os.path.isdir(directory):
+		return [path]
+	return sorted(os.path.join(directory, f) for f in os.listdir(directory) if os.path.splitext(f)[0] == stem)
+
+class PipelineState:
+	"""
+	Stage records of the previous runs and a cache of file hashes by (path, size, mtime), so unchanged large
+	inputs are not read again to compute their content hash.
+	"""
+
+	def __init__(self, path):
+		self.path = path
+		self.data = {'stages': {}, 'hashes': {}}
+		if os.path.isfile(path):
+			with open(path, 'r') as f:
+				self.data.update(json.load(f))
+
+	def save(self):
+		with open(self.path + '.tmp', 'w') as f:
+			json.dump(self.data, f, indent=1, sort_keys=True)
+		os.replace(self.path + '.tmp', self.path)
+
+	def file_signature(self, path):
+		stat = os.stat(path)
+		cached = self.data['hashes'].get(path)
+		if (cached is not None) and (cached[0] == stat.st_size) and (cached[1] == stat.st_mtime_ns):
+			return cached[2]
+		sha256 = file_hash(path)
+		self.data['hashes'][path] = [stat.st_size, stat.st_mtime_ns, sha256]
+		return sha256
+
+	def signature(self, path):
+		"""
+		Content hash of a file, listing hash (relative names, sizes, modification times) of a directory such as
+		the station store or a partitioned Parquet dataset, None for a missing path.
+		"""
+		signatures = []
+		for part in _parts(path):
+			if os.path.isfile(part):
+				signatures.append((os.path.basename(part), self.file_signature(part)))
+			elif os.path.isdir(part):
+				listing = []
+				for root, dirs, files in os.walk(part):
+					dirs.sort()
+					for f in sorted(files):
+						stat = os.stat(os.path.join(root, f))
+						listing.append((os.path.relpath(os.path.join(root, f), part), stat.st_size, stat.st_mtime_ns))
+				signatures.append((os.path.basename(part), content_hash(listing)))
+		return content_hash(signatures) if len(signatures) > 0 else None
+
+## ============================================================================================= ##
+
+class Pipeline:
+	"""
+	DAG of stages run in a working directory (the data directory the scripts' relative paths refer to). run()
+	executes the stages that are out of date in dependency order, independent stages concurrently in up to jobs
+	subprocesses, each with its output in LOGDIR/<stage>.log.
+	"""
+
+	def __init__(self, stages, workdir='./', scriptpath=SCRIPTPATH):
+		self.stages = {s.name: s for s in stages}
+		self.workdir = os.path.abspath(workdir)
+		self.scriptpath = scriptpath
+		self.state = PipelineState(os.path.join(self.workdir, STATEFILE))
+
+		writers = {}
+		for stage in stages:
+			for output in stage.outputs:
+				if output in writers:
+					raise ValueError('Output {0:s} is written by both {1:s} and {2:s}'.format(output, writers[output], stage.name))
+				writers[output] = stage.name
+		self.dependencies = {s.name: sorted(set(s.after) | {writers[i] for i in s.inputs if (i in writers) and (writers[i] != s.name)}) for s in stages}
+		self.order = self._sorted()
+
+	def _sorted(self):
+		"""
+		Stages in topological order; raises ValueError on a cycle.
+		"""
+		order, marks = [], {}
+		def visit(name, path):
+			if marks.get(name) == 'done':
+				return
+			if marks.get(name) == 'active':
+				raise ValueError('Cycle in pipeline: {0:s}'.format(' -> '.join(path + [name])))
+			marks[name] = 'active'
+			for dependency in self.dependencies[name]:
+				if dependency not in self.stages:
+					raise ValueError('Stage {0:s} depends on unknown stage {1:s}'.format(name, dependency))
+				visit(dependency, path + [name])
+			marks[name] = 'done'
+			order.append(name)
+		for name in self.stages:
+			visit(name, [])
+		return order
+
+	def upstream(self, targets):
+		"""
+		The targets and all stages they depend on, in topological order.
+		"""
+		needed, todo = set(), list(targets)
+		while len(todo) > 0:
+			name = todo.pop()
+			if name not in self.stages:
+				raise ValueError('Unknown stage {0:s}'.format(name))
+			if name not in needed:
+				needed.add(name)
+				todo.extend(self.dependencies[name])
+		return [name for name in self.order if name in needed]
+
+	## =============================== ##
+
+	def key(self, stage):
+		code = [(os.path.basename(p), file_hash(p)) for p in local_modules(stage.script, self.scriptpath)]
+		inputs = [(i, self.state.signature(os.path.join(self.workdir, i))) for i in stage.inputs]
+		return content_hash(code, sorted(stage.settings.items()), inputs)
+
+	def up_to_date(self, stage, key):
+		record = self.state.data['stages'].get(stage.name)
+		if (record is None) or (record.get('key') != key):
+			return False
+		return all(len(_parts(os.path.join(self.workdir, o))) > 0 and all(os.path.exists(p) for p in _parts(os.path.join(self.workdir, o))) for o in stage.outputs)
+
+	def _execute(self, stage):
+		logdir = os.path.join(self.workdir, LOGDIR)
+		os.makedirs(logdir, exist_ok=True)
+		env = dict(os.environ, **environment(stage.settings))
+		start_time = time.perf_counter()
+		with open(os.path.join(logdir, stage.name + '.log'), 'w') as log:
+			returncode = subprocess.run([sys.executable, os.path.join(self.scriptpath, stage.script)],
+				cwd=self.workdir, env=env, stdout=log, stderr=subprocess.STDOUT).returncode
+		return returncode, time.perf_counter() - start_time
+
+	def run(self, targets=None, force=(), skip=(), jobs=1, dry_run=False):
+		"""
+		Bring targets (default: all stages) up to date. force lists stages run regardless of their key, skip stages
+		that are not run (e.g. the download when offline) as long as their outputs exist. Returns {stage: status}
+		with status 'skipped' (up to date), 'ran', 'failed', 'blocked' (a dependency failed) or, with dry_run,
+		'would run'.
+		"""
+		names = self.upstream(targets) if targets is not None else list(self.order)
+		status = {}
+		pending = list(names)
+		running = {}
+
+		def ready(name):
+			return all(status.get(d) in ('skipped', 'ran', 'would run') for d in self.dependencies[name] if d in names)
+
+		with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+			while (len(pending) > 0) or (len(running) > 0):
+
+				for name in list(pending):
+					if any(status.get(d) in ('failed', 'blocked') for d in self.dependencies[name]):
+						status[name] = 'blocked'
+						pending.remove(name)
+						print('{0:32s} blocked'.format(name))
+						continue
+					if not ready(name):
+						continue
+					pending.remove(name)
+					stage = self.stages[name]
+
+					## keys are computed once the dependencies have finished, on the content they wrote; in a dry run the
+					## key is unknown downstream of a stage that would run (always-stages usually change nothing)
+					upstream_runs = any((status.get(d) == 'would run') and not self.stages[d].always for d in self.dependencies[name])
+					key = None if upstream_runs else self.key(stage)
+					outputs_exist = all(os.path.exists(p) for o in stage.outputs for p in _parts(os.path.join(self.workdir, o)))
+					if (name in skip) and outputs_exist:
+						status[name] = 'skipped'
+					elif (name not in force) and (not stage.always) and (key is not None) and self.up_to_date(stage, key):
+						status[name] = 'skipped'
+					elif dry_run:
+						status[name] = 'would run'
+					else:
+						print('{0:32s} running'.format(name))
+						running[executor.submit(self._execute, stage)] = (name, key)
+						continue
+					print('{0:32s} {1:s}'.format(name, status[name]))
+
+				if len(running) == 0:
+					if any(ready(name) for name in pending):
+						continue
+					break
+
+				done, _ = wait(list(running.keys()), return_when=FIRST_COMPLETED)
+				for future in done:
+					name, key = running.pop(future)
+					returncode, seconds = future.result()
+					stage = self.stages[name]
+					if returncode == 0:
+						status[name] = 'ran'
+						self.state.data['stages'][name] = {\
+							'key': self.key(stage) if key is None else key,
+							'script': stage.script,
+							'settings': {k: repr(v) for k, v in stage.settings.items()},
+							'outputs': {o: self.state.signature(os.path.join(self.workdir, o)) for o in stage.outputs},
+							'finished': datetime.datetime.now().isoformat(timespec='seconds'),
+							'seconds': seconds,
+							}
+						self.state.save()
+					else:
+						status[name] = 'failed'
+					print('{0:32s} {1:s} ({2:.1f} s){3:s}'.format(name, status[name], seconds,
+						'' if returncode == 0 else ', see ' + os.path.join(LOGDIR, name + '.log')))
+
+		self.state.save()
+		return status
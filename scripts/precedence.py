@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import warnings
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+## ============================================================================================= ##
+
+## first year of units without the item
+MISSING_YEAR = -1
+
+## ============================================================================================= ##
+
+def first_year_matrix(df, unit_column='district_code', item_column='project_type', year_column='year_start', items=None):
+	"""
+	(units, items, years) with years an int32 array (n_units, n_items) of the first year every unit adopted every
+	item, MISSING_YEAR where it never did. With items given, only these are kept, in this order.
+	"""
+	if items is not None:
+		df = df.loc[df[item_column].isin(items), :]
+	units, i = np.unique(df[unit_column].values, return_inverse=True)
+	if items is None:
+		items, j = np.unique(df[item_column].values, return_inverse=True)
+	else:
+		items = np.asarray(items, dtype=object)
+		j = pd.Index(items).get_indexer(df[item_column].values)
+
+	years = np.full((units.size, items.size), np.iinfo(np.int32).max, dtype=np.int32)
+	np.minimum.at(years, (i, j), df[year_column].values.astype(np.int32))
+	years[years == np.iinfo(np.int32).max] = MISSING_YEAR
+	return units, items, years
+
+def precedence_frequencies(years):
+	"""
+	Array (n_items, n_items) with the share of units having item a that adopted a strictly before b (b adopted
+	later or never counts as not before), i.e. #units(year_a < year_b) / #units(a); NaN on the diagonal.
+	All pairs come from one matrix product over units and years: the one-hot first year of a against the
+	indicator of b starting after that year.
+	"""
+	present = years != MISSING_YEAR
+	calendar = np.unique(years[present])
+	position = np.searchsorted(calendar, np.where(present, years, calendar[0]))
+
+	## (n_units, n_items, n_years): a adopted in year y / b adopted after year y
+	steps = np.arange(calendar.size)
+	adopted = present[:, :, None] & (position[:, :, None] == steps)
+	later = present[:, :, None] & (position[:, :, None] > steps)
+
+	n_units, n_items = years.shape
+	A = adopted.transpose(1, 0, 2).reshape(n_items, -1).astype(np.float64)
+	B = later.transpose(0, 2, 1).reshape(-1, n_items).astype(np.float64)
+	before = A @ B
+
+	with np.errstate(invalid='ignore', divide='ignore'):
+		freq = before / present.sum(axis=0)[:, None]
+	np.fill_diagonal(freq, np.nan)
+	return freq
+
+def precedence_order(freq, items):
+	"""
+	Item order by the number of items each one precedes more often than the reverse (freq[a, b] > freq[b, a]),
+	descending, ties broken by name descending.
+	"""
+	with np.errstate(invalid='ignore'):
+		wins = (freq > freq.T).sum(axis=1)
+	names = np.argsort(np.argsort(np.asarray(items), kind='stable'), kind='stable')
+	return np.lexsort((-names, -wins))
+
+def precedence_table(df_first, items=None, unit_column='district_code', item_column='project_type', year_column='year_start'):
+	"""
+	Precedence frequencies in % (share of units with the row item that adopted it before the column item), rows
+	and columns in precedence order.
+	"""
+	_, items, years = first_year_matrix(df_first, unit_column=unit_column, item_column=item_column, year_column=year_column, items=items)
+	freq = precedence_frequencies(years)
+	order = precedence_order(freq, items)
+	return pd.DataFrame(freq[np.ix_(order, order)] * 100., index=items[order],
+		columns=pd.Index(items[order], name='policy_second'))
+
+## ============================================================================================= ##
+
+## bootstrap replicates drawn and evaluated together in one worker task
+BOOTSTRAP_BATCH = 100
+
+MP_CONTEXT = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else None
+
+_pairs = None
+_present = None
+
+def pair_indicators(years):
+	"""
+	(pairs, present): pairs is a float32 array (n_units, n_items * n_items), 1 where the unit adopted a strictly
+	before b; present (n_units, n_items) marks adopted items. Any weighting of units (e.g. bootstrap counts)
+	then gives all pairwise counts as one matrix product.
+	"""
+	present = years != MISSING_YEAR
+	pairs = present[:, :, None] & present[:, None, :] & (years[:, :, None] < years[:, None, :])
+	return pairs.reshape(years.shape[0], -1).astype(np.float32), present.astype(np.float32)
+
+def _init_bootstrap(pairs, present):
+	global _pairs, _present
+	_pairs, _present = pairs, present
+
+def _bootstrap_batch(args):
+	"""
+	Frequencies and item positions of a batch of bootstrap replicates: units are resampled with replacement as
+	multinomial counts, and the counts times the pair indicators give every replicate's matrix at once.
+	"""
+	seed, size, names = args
+	n_units = _present.shape[0]
+	n_items = _present.shape[1]
+	counts = np.random.default_rng(seed).multinomial(n_units, np.full(n_units, 1. / n_units), size=size).astype(np.float32)
+
+	with np.errstate(invalid='ignore', divide='ignore'):
+		freq = (counts @ _pairs).reshape(size, n_items, n_items) / (counts @ _present)[:, :, None]
+	idx = np.arange(n_items)
+	freq[:, idx, idx] = np.nan
+
+	## precedence order per replicate as in precedence_order: wins descending, ties by name descending
+	with np.errstate(invalid='ignore'):
+		wins = (freq > freq.transpose(0, 2, 1)).sum(axis=2)
+	key = wins * n_items + names
+	positions = np.argsort(np.argsort(-key, axis=1, kind='stable'), axis=1, kind='stable')
+	return freq.astype(np.float32), positions.astype(np.int16)
+
+def bootstrap_precedence(years, items, n_boot=2000, seed=0, batch_size=BOOTSTRAP_BATCH, processes=None):
+	"""
+	Bootstrap of the precedence frequencies over units (districts): (freq, positions) with freq an array
+	(n_boot, n_items, n_items) and positions (n_boot, n_items) the place of every item in each replicate's
+	precedence order. Batches are seeded from one SeedSequence, so results depend on seed only, not on the
+	number of processes.
+	"""
+	pairs, present = pair_indicators(years)
+	names = np.argsort(np.argsort(np.asarray(items), kind='stable'), kind='stable')
+
+	sizes = [min(batch_size, n_boot - start) for start in range(0, n_boot, batch_size)]
+	seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+	tasks = [(s, size, names) for s, size in zip(seeds, sizes)]
+
+	processes = processes or os.cpu_count()
+	if (processes == 1) or (len(tasks) <= 1):
+		_init_bootstrap(pairs, present)
+		results = list(map(_bootstrap_batch, tasks))
+	else:
+		with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context(MP_CONTEXT),
+			initializer=_init_bootstrap, initargs=(pairs, present)) as executor:
+			results = list(executor.map(_bootstrap_batch, tasks))
+
+	return np.concatenate([r[0] for r in results]), np.concatenate([r[1] for r in results])
+
+def bootstrap_table(df_first, items=None, n_boot=2000, alpha=0.05, seed=0, processes=None,
+	unit_column='district_code', item_column='project_type', year_column='year_start'):
+	"""
+	Bootstrap confidence intervals of precedence_table. Returns (df_ci, df_stability): df_ci holds per pair
+	(policy_first, policy_second) the estimate and the (alpha/2, 1-alpha/2) percentile interval in %, df_stability
+	per policy its position in the precedence order with the bootstrap mean, interval and the share of replicates
+	that put it in the same position.
+	"""
+	_, items, years = first_year_matrix(df_first, unit_column=unit_column, item_column=item_column, year_column=year_column, items=items)
+	freq = precedence_frequencies(years)
+	order = precedence_order(freq, items)
+	position = np.empty(items.size, dtype=np.int64)
+	position[order] = np.arange(items.size)
+
+	freq_boot, positions = bootstrap_precedence(years, items, n_boot=n_boot, seed=seed, processes=processes)
+	with warnings.catch_warnings():
+		warnings.simplefilter('ignore', category=RuntimeWarning)
+		lower, upper = np.nanquantile(freq_boot, [alpha / 2., 1. - alpha / 2.], axis=0)
+
+	a, b = np.meshgrid(np.arange(items.size), np.arange(items.size), indexing='ij')
+	offdiagonal = (a != b).ravel()
+	df_ci = pd.DataFrame({\
+		'policy_first': items[a.ravel()],
+		'policy_second': items[b.ravel()],
+		'freq': freq.ravel() * 100.,
+		'freq_lower': lower.ravel() * 100.,
+		'freq_upper': upper.ravel() * 100.,
+		}).loc[offdiagonal, :].reset_index(drop=True)
+
+	df_stability = pd.DataFrame({\
+		'policy': items,
+		'position': position,
+		'position_mean': positions.mean(axis=0),
+		'position_lower': np.quantile(positions, alpha / 2., axis=0),
+		'position_upper': np.quantile(positions, 1. - alpha / 2., axis=0),
+		'share_same_position': (positions == position).mean(axis=0),
+		}).sort_values('position').reset_index(drop=True)
+
+	return df_ci, df_stability
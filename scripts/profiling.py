@@ -0,0 +1,371 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import gc
+import sys
+import json
+import time
+import ctypes
+import ctypes.util
+import socket
+import platform
+import datetime
+import threading
+import contextlib
+import collections
+
+import numpy as np
+
+try:
+	import resource
+except ImportError:
+	resource = None
+
+## ============================================================================================= ##
+
+## per-item timings (e.g. stations) further than OUTLIER_THRESHOLD robust z-scores above the median are outliers
+OUTLIER_THRESHOLD = 3.5
+## at most this many outliers are listed per stage
+MAX_OUTLIERS = 20
+
+## interval (s) of the sampling profiler
+SAMPLING_INTERVAL = 0.005
+
+## ============================================================================================= ##
+
+def _status_kb(field):
+	try:
+		with open('/proc/self/status', 'r') as f:
+			for line in f:
+				if line.startswith(field + ':'):
+					return int(line.split()[1])
+	except OSError:
+		pass
+	return None
+
+def current_rss():
+	"""
+	Resident set size of this process in bytes, None where /proc is not available.
+	"""
+	kb = _status_kb('VmRSS')
+	return None if kb is None else kb * 1024
+
+def peak_rss():
+	"""
+	Peak resident set size of this process in bytes since start or the last reset_peak_rss.
+	"""
+	kb = _status_kb('VmHWM')
+	if (kb is None) and (resource is not None):
+		kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+		kb = kb // 1024 if sys.platform == 'darwin' else kb
+	return None if kb is None else kb * 1024
+
+def release_memory():
+	"""
+	Collect garbage and return freed heap memory to the system (glibc malloc_trim), so that memory reused by the
+	next stage shows up in its peak instead of being hidden in the heap of an earlier one.
+	"""
+	gc.collect()
+	try:
+		ctypes.CDLL(ctypes.util.find_library('c')).malloc_trim(0)
+	except (OSError, AttributeError, TypeError):
+		pass
+
+def reset_peak_rss():
+	"""
+	Reset the peak resident set size to the current size (Linux >= 4.0, /proc/self/clear_refs), so the peak of
+	the next stage is measured on its own. Returns False where this is not possible; peaks are then process-wide.
+	"""
+	try:
+		with open('/proc/self/clear_refs', 'w') as f:
+			f.write('5')
+		return True
+	except OSError:
+		return False
+
+def children_cpu():
+	"""
+	CPU time (s) of terminated and waited-for child processes, e.g. of a finished ProcessPoolExecutor.
+	"""
+	if resource is None:
+		return 0.
+	usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+	return usage.ru_utime + usage.ru_stime
+
+def outliers(items, threshold=OUTLIER_THRESHOLD):
+	"""
+	Summary of per-item timings {key: {'seconds': s, ...}}: count, median, p95, max and the items whose robust
+	z-score (deviation from the median in units of 1.4826 median absolute deviations) exceeds threshold,
+	slowest first.
+	"""
+	keys = list(items.keys())
+	seconds = np.array([items[k]['seconds'] for k in keys], dtype=np.float64)
+	if seconds.size == 0:
+		return {'count': 0}
+
+	median = float(np.median(seconds))
+	mad = 1.4826 * float(np.median(np.abs(seconds - median)))
+	z = (seconds - median) / mad if mad > 0. else np.where(seconds > median, np.inf, 0.)
+	slow = [i for i in np.argsort(-seconds, kind='stable') if z[i] > threshold][:MAX_OUTLIERS]
+	return {\
+		'count': int(seconds.size),
+		'total_s': float(seconds.sum()),
+		'median_s': median,
+		'p95_s': float(np.quantile(seconds, 0.95)),
+		'max_s': float(seconds.max()),
+		'outliers': [dict(items[keys[i]], key=_jsonable(keys[i]), z=float(min(z[i], 1.e9))) for i in slow],
+		}
+
+def _jsonable(value):
+	if isinstance(value, np.generic):
+		return value.item()
+	return value if isinstance(value, (str, int, float, bool)) or value is None else str(value)
+
+## ============================================================================================= ##
+
+class Stage:
+	"""
+	Measurements of one pipeline stage or sub-step. rows and bytes are set (or increased) by the code inside the
+	stage; item() records per-item timings, e.g. one per station, for the outlier summary.
+	"""
+
+	def __init__(self, name):
+		self.name = name
+		self.rows = None
+		self.bytes = None
+		self.items = collections.OrderedDict()
+		self.info = {}
+		self.wall = 0.
+		self.cpu = 0.
+		self.cpu_children = 0.
+		self.peak = None
+		self.rss_start = None
+		self.rss_end = None
+
+	def add(self, rows=None, bytes=None):
+		if rows is not None:
+			self.rows = (self.rows or 0) + int(rows)
+		if bytes is not None:
+			self.bytes = (self.bytes or 0) + int(bytes)
+
+	def item(self, key, seconds, rows=None, bytes=None, step='item'):
+		"""
+		Record the time (and rows, bytes) of one item, e.g. a station; step separates items of different sub-steps
+		of the same loop (e.g. 'parse' and 'write' of every archive).
+		"""
+		entry = self.items.setdefault(step, collections.OrderedDict()).setdefault(key, {'seconds': 0.})
+		entry['seconds'] += float(seconds)
+		if rows is not None:
+			entry['rows'] = entry.get('rows', 0) + int(rows)
+		if bytes is not None:
+			entry['bytes'] = entry.get('bytes', 0) + int(bytes)
+
+	def add_items(self, timings, step='item'):
+		"""
+		Record {key: {'seconds', 'rows', 'bytes'}} timings measured elsewhere, e.g. in worker processes.
+		"""
+		for key, timing in timings.items():
+			self.item(key, timing['seconds'], rows=timing.get('rows'), bytes=timing.get('bytes'), step=step)
+
+	@contextlib.contextmanager
+	def timed(self, key, rows=None, bytes=None, step='item'):
+		"""
+		Time the enclosed block as one item of this stage.
+		"""
+		start_time = time.perf_counter()
+		try:
+			yield
+		finally:
+			self.item(key, time.perf_counter() - start_time, rows=rows, bytes=bytes, step=step)
+
+	def to_dict(self):
+		mb = lambda b: None if b is None else b / 1024. ** 2
+		d = {\
+			'name': self.name,
+			'wall_s': self.wall,
+			'cpu_s': self.cpu,
+			'cpu_children_s': self.cpu_children,
+			'peak_rss_mb': mb(self.peak),
+			'rss_start_mb': mb(self.rss_start),
+			'rss_end_mb': mb(self.rss_end),
+			'rows': self.rows,
+			'bytes': self.bytes,
+			}
+		if self.rows and self.wall > 0.:
+			d['rows_per_s'] = self.rows / self.wall
+		if self.bytes and self.wall > 0.:
+			d['mb_per_s'] = self.bytes / 1024. ** 2 / self.wall
+		if len(self.items) > 0:
+			d['items'] = {step: outliers(items) for step, items in self.items.items()}
+		if len(self.info) > 0:
+			d['info'] = {k: _jsonable(v) for k, v in self.info.items()}
+		return d
+
+class RunReport:
+	"""
+	Structured report of one script run: every stage() records wall time, CPU time (own and of finished worker
+	processes), peak RSS, rows and bytes processed and per-item timings; save() writes everything as JSON. Stage
+	names use '/' for sub-steps (e.g. 'merge/daily_means'); the totals of every top-level stage are added on save.
+	With sampling=True a SamplingProfiler records stacks of the main thread for the whole run.
+	"""
+
+	def __init__(self, script, outdir='./', sampling=False, enabled=True, label=None):
+		self.script = os.path.splitext(os.path.basename(script))[0]
+		self.label = label
+		self.outdir = outdir
+		self.enabled = enabled
+		self.started = datetime.datetime.now()
+		self.start_wall = time.perf_counter()
+		self.start_cpu = time.process_time()
+		self.start_children = children_cpu()
+		self.stages = []
+		self._stack = []
+		self.profiler = SamplingProfiler().start() if (enabled and sampling) else None
+
+	@contextlib.contextmanager
+	def stage(self, name, rows=None, bytes=None):
+		stage = Stage(name)
+		stage.add(rows=rows, bytes=bytes)
+		if not self.enabled:
+			yield stage
+			return
+
+		## the peak of an enclosing stage so far is kept before it is reset for this one
+		for parent in self._stack:
+			parent.peak = max(filter(None, [parent.peak, peak_rss()]), default=None)
+		release_memory()
+		reset_peak_rss()
+		stage.rss_start = current_rss()
+		start_wall, start_cpu, start_children = time.perf_counter(), time.process_time(), children_cpu()
+		self._stack.append(stage)
+		try:
+			yield stage
+		finally:
+			self._stack.pop()
+			stage.wall = time.perf_counter() - start_wall
+			stage.cpu = time.process_time() - start_cpu
+			stage.cpu_children = children_cpu() - start_children
+			stage.peak = max(filter(None, [stage.peak, peak_rss()]), default=None)
+			stage.rss_end = current_rss()
+			for parent in self._stack:
+				parent.peak = max(filter(None, [parent.peak, stage.peak]), default=None)
+			self.stages.append(stage)
+
+	def summary(self):
+		"""
+		Totals per top-level stage: summed times, rows and bytes and the maximum peak RSS of its sub-steps.
+		"""
+		totals = collections.OrderedDict()
+		for stage in self.stages:
+			top = stage.name.split('/')[0]
+			if (top != stage.name) and any(s.name == top for s in self.stages):
+				continue
+			t = totals.setdefault(top, {'wall_s': 0., 'cpu_s': 0., 'cpu_children_s': 0., 'peak_rss_mb': None, 'rows': None, 'bytes': None})
+			d = stage.to_dict()
+			for key in ['wall_s', 'cpu_s', 'cpu_children_s']:
+				t[key] += d[key]
+			for key in ['rows', 'bytes']:
+				if d[key] is not None:
+					t[key] = (t[key] or 0) + d[key]
+			t['peak_rss_mb'] = max(filter(None, [t['peak_rss_mb'], d['peak_rss_mb']]), default=None)
+		return totals
+
+	def save(self, path=None):
+		"""
+		Write the run report (run_report_<script>_<YYYYmmdd-HHMMSS>.json in outdir unless path is given) and, with
+		sampling, the folded stacks next to it. Returns the path of the report.
+		"""
+		if not self.enabled:
+			return None
+
+		stamp = self.started.strftime('%Y%m%d-%H%M%S')
+		name = self.script if self.label is None else '{0:s}_{1:s}'.format(self.script, self.label)
+		path = path or os.path.join(self.outdir, 'run_report_{0:s}_{1:s}.json'.format(name, stamp))
+		report = {\
+			'script': self.script,
+			'label': self.label,
+			'started': self.started.isoformat(timespec='seconds'),
+			'finished': datetime.datetime.now().isoformat(timespec='seconds'),
+			'host': socket.gethostname(),
+			'cpus': os.cpu_count(),
+			'python': platform.python_version(),
+			'pid': os.getpid(),
+			'wall_s': time.perf_counter() - self.start_wall,
+			'cpu_s': time.process_time() - self.start_cpu,
+			'cpu_children_s': children_cpu() - self.start_children,
+			'peak_rss_mb': None,
+			'totals': self.summary(),
+			'stages': [s.to_dict() for s in self.stages],
+			}
+		peaks = [s['peak_rss_mb'] for s in report['stages'] if s['peak_rss_mb'] is not None]
+		report['peak_rss_mb'] = max(peaks) if len(peaks) > 0 else (None if peak_rss() is None else peak_rss() / 1024. ** 2)
+
+		if self.profiler is not None:
+			self.profiler.stop()
+			report['profile'] = self.profiler.write(path.replace('.json', '.folded'))
+
+		os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+		with open(path + '.tmp', 'w') as f:
+			json.dump(report, f, indent=1)
+		os.replace(path + '.tmp', path)
+
+		for name, t in report['totals'].items():
+			print('{0:20s} {1:9.1f} s wall {2:9.1f} s cpu {3:>9s} MB peak'.format(name, t['wall_s'], t['cpu_s'] + t['cpu_children_s'],
+				'-' if t['peak_rss_mb'] is None else '{0:.0f}'.format(t['peak_rss_mb'])))
+		print('Run report: ', path)
+		return path
+
+## ============================================================================================= ##
+
+class SamplingProfiler:
+	"""
+	Statistical profiler in a background thread: every interval seconds the stack of the profiled thread is
+	sampled and counted. write() stores the counts as folded stacks ('frame;frame;frame count' per line), the
+	input of flamegraph.pl, speedscope or inferno. Only Python frames are seen; time in C extensions is
+	attributed to the calling Python function.
+	"""
+
+	def __init__(self, interval=SAMPLING_INTERVAL, thread_id=None):
+		self.interval = interval
+		self.thread_id = threading.main_thread().ident if thread_id is None else thread_id
+		self.counts = collections.Counter()
+		self.samples = 0
+		self._stop = threading.Event()
+		self._thread = None
+
+	@staticmethod
+	def _frame_name(frame):
+		code = frame.f_code
+		return '{0:s} ({1:s}:{2:d})'.format(code.co_name, os.path.basename(code.co_filename), code.co_firstlineno)
+
+	def _run(self):
+		while not self._stop.wait(self.interval):
+			frame = sys._current_frames().get(self.thread_id)
+			stack = []
+			while frame is not None:
+				stack.append(self._frame_name(frame))
+				frame = frame.f_back
+			if len(stack) > 0:
+				self.counts[';'.join(reversed(stack))] += 1
+				self.samples += 1
+
+	def start(self):
+		self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+		self._thread.start()
+		return self
+
+	def stop(self):
+		self._stop.set()
+		if self._thread is not None:
+			self._thread.join()
+		return self
+
+	def write(self, path):
+		"""
+		Write folded stacks to path. Returns {'path', 'samples', 'interval_s'} for the run report.
+		"""
+		with open(path, 'w') as f:
+			for stack, count in self.counts.most_common():
+				f.write('{0:s} {1:d}\n'.format(stack, count))
+		return {'path': path, 'samples': self.samples, 'interval_s': self.interval}
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from boundaries import BOUNDARY_CRS, cache_path, load_boundaries
+
+## ============================================================================================= ##
+
+## simplification tolerances (m, in BOUNDARY_CRS) of the cached geometry levels, 0 is the full resolution
+TOLERANCES = [0., 25., 100., 250., 1000.]
+
+## a level is usable while its tolerance stays below this fraction of the size of an output pixel
+PIXEL_FRACTION = 0.5
+
+MP_CONTEXT = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else None
+
+## ============================================================================================= ##
+
+def simplify_coverage(geometries, tolerance):
+	"""
+	Simplify polygons that tile an area, shared edges are simplified once so neighbours stay gap- and
+	overlap-free (shapely.coverage_simplify, shapely >= 2.1). Older shapely falls back to a per-polygon
+	topology-preserving simplification.
+	"""
+	import shapely
+
+	if hasattr(shapely, 'coverage_simplify'):
+		try:
+			return shapely.coverage_simplify(np.asarray(geometries), tolerance)
+		except shapely.errors.GEOSException:
+			pass
+	return shapely.simplify(np.asarray(geometries), tolerance, preserve_topology=True)
+
+def load_simplified(path, tolerance, crs=BOUNDARY_CRS, columns=None, cachedir=None):
+	"""
+	Boundary layer at one simplification level, cached as GeoParquet next to the full-resolution conversion
+	of load_boundaries. Simplification always happens in BOUNDARY_CRS, the result is then transformed to crs.
+	"""
+	import geopandas as gpd
+
+	if tolerance <= 0.:
+		return load_boundaries(path, crs=crs, columns=columns, cachedir=cachedir)
+
+	cachefile = cache_path(path, crs=crs, columns=columns, cachedir=cachedir).replace('.parquet', '-s{0:d}.parquet'.format(int(tolerance)))
+	if not os.path.isfile(cachefile):
+		gdf = load_boundaries(path, crs=BOUNDARY_CRS, columns=columns, cachedir=cachedir)
+		gdf = gdf.set_geometry(simplify_coverage(gdf.geometry.values, tolerance), crs=BOUNDARY_CRS).to_crs(crs)
+		gdf.to_parquet(cachefile + '.tmp', write_covering_bbox=True)
+		os.replace(cachefile + '.tmp', cachefile)
+	return gpd.read_parquet(cachefile).drop(columns=['bbox'], errors='ignore')
+
+def pick_tolerance(extent, figsize, dpi, tolerances=TOLERANCES):
+	"""
+	Coarsest tolerance below PIXEL_FRACTION of a pixel when a map of extent (m, longer side) fills the longer
+	side of a figure of figsize (in) at dpi.
+	"""
+	pixel = extent / (max(figsize) * dpi)
+	usable = [t for t in tolerances if t <= PIXEL_FRACTION * pixel]
+	return max(usable) if len(usable) > 0 else 0.
+
+def layer_extent(path):
+	"""
+	(bounds in BOUNDARY_CRS, native crs) of a layer from its header (pyogrio.read_info), no geometry is read.
+	"""
+	import pyogrio
+	import geopandas as gpd
+	from shapely.geometry import box
+
+	info = pyogrio.read_info(path, force_total_bounds=True)
+	bounds = gpd.GeoSeries([box(*info['total_bounds'])], crs=info['crs']).to_crs(BOUNDARY_CRS).total_bounds
+	return bounds, info['crs']
+
+def load_for_figure(path, figsize, dpi, crs=None, columns=None, cachedir=None):
+	"""
+	Boundary layer at the simplification level that matches the output size and resolution of a map, in crs
+	(default: the native crs of the layer, as gpd.read_file).
+	"""
+	(minx, miny, maxx, maxy), native = layer_extent(path)
+	tolerance = pick_tolerance(max(maxx - minx, maxy - miny), figsize, dpi)
+	return load_simplified(path, tolerance, crs=native if crs is None else crs, columns=columns, cachedir=cachedir)
+
+## ============================================================================================= ##
+
+def _render(task):
+	import matplotlib
+	matplotlib.use('Agg')
+	import matplotlib.pyplot as plt
+
+	function, args = task
+	start_time = time.time()
+	filename = function(*args)
+	plt.close('all')
+	return filename, time.time() - start_time
+
+def render_figures(tasks, processes=None):
+	"""
+	Render independent figures in worker processes. tasks is a list of (function, args); every function draws
+	and saves one figure and returns its file name. Returns {file name: seconds}.
+	"""
+	processes = min(processes or os.cpu_count(), len(tasks))
+	if processes <= 1:
+		results = list(map(_render, tasks))
+	else:
+		with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context(MP_CONTEXT)) as executor:
+			results = list(executor.map(_render, tasks))
+	for filename, seconds in results:
+		print('{0:s} ({1:.1f} s)'.format(filename, seconds))
+	return dict(results)
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+
+from pipeline import Pipeline, Stage
+from hierarchy import LEVEL_NAMES
+
+## ============================================================================================= ##
+
+WORKDIR = './' # data directory, all paths below are relative to it
+
+DATAPATH_DWD_STATIONS = './'
+DATAPATH_DWD_ARCHIVES = './archives/'
+DATAPATH_DWD_STORE = './dwd_cdc_hourly/'
+DATAPATH_MODELS = './models/'
+DATAPATH_AGGREGATED_MUNICIPALITY = './'
+DATAPATH_SHAPES = './'
+
+## ============================================================================================= ##
+
+VARIABLES = ['air_temperature'] # independent chains p01 -> p02 per variable
+IMPUTATION = 'lasso' # 'lasso', 'neighbours' or None (masked aggregation of the non-imputed daily means)
+
+AGGREGATION = {\
+	'DISTANCE_CUTOFF': 100,
+	'DISTANCE_METHOD': 'geodesic',
+	'WEIGHTING': 'idw',
+	'IDW_POWER': 2.,
+	'N_NEAREST': None,
+	'ROLLUP': True,
+	'ROLLUP_LEVELS': ['VWG', 'KRS', 'RBZ', 'LAN'],
+	'ROLLUP_WEIGHTING': 'area',
+	'POPULATION_FILE': './population_gemeinde.csv',
+	}
+
+VALIDATE = True # compare the aggregated air temperature with the DWD grid (needs municipality_shape_era5_dwd.csv)
+
+TARGETS = None # stages to bring up to date (with everything they depend on), None: all; or names as arguments
+FORCE = [] # stages to run even if they are up to date
+OFFLINE = False # do not run the download as long as the station store exists
+JOBS = 2 # stages run at the same time
+DRY_RUN = False # only list the stages that would run
+
+## ============================================================================================= ##
+
+paths = {\
+	'DATAPATH_DWD_STATIONS': DATAPATH_DWD_STATIONS,
+	'DATAPATH_DWD_ARCHIVES': DATAPATH_DWD_ARCHIVES,
+	'DATAPATH_DWD_STORE': DATAPATH_DWD_STORE,
+	'DATAPATH_MODELS': DATAPATH_MODELS,
+	'DATAPATH_AGGREGATED_MUNICIPALITY': DATAPATH_AGGREGATED_MUNICIPALITY,
+	'DATAPATH_SHAPES': DATAPATH_SHAPES,
+	}
+
+stationsfile = os.path.join(DATAPATH_DWD_STATIONS, 'stations.csv')
+shapefile = os.path.join(DATAPATH_SHAPES, 'VG250_GEM.shp')
+
+## download the archives and update the station store; the archives' ETags are checked on every run
+stages = [\
+	Stage('p00_download', 'p00_download_stationdata_dwd.py',
+		outputs=[DATAPATH_DWD_STORE, stationsfile],
+		settings={k: v for k, v in paths.items() if k in ['DATAPATH_DWD_STATIONS', 'DATAPATH_DWD_ARCHIVES', 'DATAPATH_DWD_STORE']},
+		always=True),
+	]
+
+for variable in VARIABLES:
+
+	daymeanfile = os.path.join(DATAPATH_DWD_STATIONS, 'dwd_cdc_hourly_2008-2023_{0:s}_daymean.csv'.format(variable))
+	cubefile = os.path.join(DATAPATH_DWD_STATIONS, 'dwd_cdc_hourly_2008-2023_{0:s}_daymean_cube'.format(variable))
+	imputedfile = os.path.join(DATAPATH_DWD_STATIONS, 'dwd_cdc_hourly_2008-2023_{0:s}_daymean_imputed_{1:s}.csv'.format(variable, str(IMPUTATION)))
+
+	## daily means of the station store and their imputation
+	stages.append(Stage('p01_{0:s}'.format(variable), 'p01_impute_stationdata.py',
+		inputs=[DATAPATH_DWD_STORE, stationsfile],
+		outputs=[daymeanfile, cubefile + '.npy', cubefile + '.json'] + ([imputedfile] if IMPUTATION is not None else []),
+		settings=dict({k: v for k, v in paths.items() if k in ['DATAPATH_DWD_STATIONS', 'DATAPATH_DWD_STORE', 'DATAPATH_MODELS']},
+			MERGE=True, IMPUTATION_LASSO=(IMPUTATION == 'lasso'), IMPUTATION_NEIGHBOURS=(IMPUTATION == 'neighbours'),
+			VARIABLES=[variable])))
+
+	## inverse distance aggregation to municipalities and the administrative levels above; p02 keeps its incremental
+	## mode, it rewrites the years whose input changed (keys stored with the panel) when it reruns for a new input
+	panelfile = os.path.join(DATAPATH_AGGREGATED_MUNICIPALITY, 'data_gemeinde_2008-2023_{0:s}_daymean_invdistances_{1:g}km.parquet'.format(variable, AGGREGATION['DISTANCE_CUTOFF']))
+	meanfile = os.path.join(DATAPATH_AGGREGATED_MUNICIPALITY, 'data_gemeinde_2008-2023_{0:s}_daymean_invdistances_{1:g}km.csv'.format(variable, AGGREGATION['DISTANCE_CUTOFF']))
+	rollupfiles = [panelfile.replace('gemeinde', LEVEL_NAMES[level]) for level in AGGREGATION['ROLLUP_LEVELS']] if AGGREGATION['ROLLUP'] else []
+	populationfile = [AGGREGATION['POPULATION_FILE']] if (AGGREGATION['ROLLUP'] and AGGREGATION['ROLLUP_WEIGHTING'] == 'population') else []
+	stationsshape = os.path.join(DATAPATH_AGGREGATED_MUNICIPALITY, 'stations_{0:s}.shp'.format(variable)) if len(VARIABLES) > 1 else os.path.join(DATAPATH_AGGREGATED_MUNICIPALITY, 'stations.shp')
+
+	stages.append(Stage('p02_{0:s}'.format(variable), 'p02_aggregate_invdist_stationdata.py',
+		inputs=[imputedfile if IMPUTATION is not None else cubefile + '.npy', stationsfile, shapefile] + populationfile,
+		outputs=[meanfile, panelfile, stationsshape] + rollupfiles,
+		settings=dict({k: v for k, v in paths.items() if k in ['DATAPATH_DWD_STATIONS', 'DATAPATH_AGGREGATED_MUNICIPALITY', 'DATAPATH_SHAPES']},
+			AGGREGATE=True, IMPUTATION=IMPUTATION, VARIABLE=variable, STATIONS_FILE=os.path.basename(stationsshape), **AGGREGATION)))
+
+	if (VALIDATE == True) and (variable == 'air_temperature'):
+		stages.append(Stage('validate_dwd', 'p_validate_DWD.py',
+			inputs=[os.path.join(DATAPATH_AGGREGATED_MUNICIPALITY, 'municipality_shape_era5_dwd.csv'), meanfile, stationsshape,
+				os.path.join(DATAPATH_AGGREGATED_MUNICIPALITY, 'VG250_GEM.shp')],
+			outputs=[os.path.join(DATAPATH_AGGREGATED_MUNICIPALITY, 'histogram_difference_temperature_dwd.pdf'),
+				os.path.join(DATAPATH_AGGREGATED_MUNICIPALITY, 'map_difference_DWD.png')],
+			settings={'DATAPATH': DATAPATH_AGGREGATED_MUNICIPALITY, 'FIGUREPATH': DATAPATH_AGGREGATED_MUNICIPALITY,
+				'DISTANCE_CUTOFF': AGGREGATION['DISTANCE_CUTOFF'], 'STATIONS_FILE': os.path.basename(stationsshape)}))
+
+## ============================================================================================= ##
+
+pipeline = Pipeline(stages, workdir=WORKDIR)
+
+targets = sys.argv[1:] if len(sys.argv) > 1 else TARGETS
+status = pipeline.run(targets=targets, force=FORCE, skip=['p00_download'] if OFFLINE else [], jobs=JOBS, dry_run=DRY_RUN)
+
+if any(s in ('failed', 'blocked') for s in status.values()):
+	sys.exit(1)
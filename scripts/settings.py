@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import ast
+
+## ============================================================================================= ##
+
+## environment variables GEOCLIP_<NAME> override the module-level settings of the pipeline scripts
+PREFIX = 'GEOCLIP_'
+
+## ============================================================================================= ##
+
+def setting(name, default):
+	"""
+	Value of the script setting name: the Python literal in the environment variable GEOCLIP_<name> if it is set
+	(e.g. GEOCLIP_MERGE=True, GEOCLIP_DISTANCE_CUTOFF=50, GEOCLIP_VARIABLES="['air_temperature']"), otherwise
+	default. Strings that are not literals (e.g. paths) are taken as they are. Scripts run by hand keep their
+	defaults; the pipeline runner passes its stage parameters this way.
+	"""
+	value = os.environ.get(PREFIX + name)
+	if value is None:
+		return default
+	try:
+		return ast.literal_eval(value)
+	except (ValueError, SyntaxError):
+		return value
+
+def environment(settings):
+	"""
+	{GEOCLIP_<name>: repr(value)} for settings {name: value}, to be added to the environment of a script run.
+	"""
+	return {PREFIX + name: repr(value) for name, value in settings.items()}
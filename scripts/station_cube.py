@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+
+import numpy as np
+import pandas as pd
+
+## ============================================================================================= ##
+
+class StationCube:
+	"""
+	Dense daily panel of shape (variables, stations, days) in float32, missing values are NaN. Stations and days
+	(YYYYMMDD) are sorted integer axes. With a path the values live in a memory-mapped .npy file next to a
+	small .json with the axes, so imputation and aggregation can work on views of the file without copying.
+	"""
+
+	def __init__(self, data, variables, stations, days, path=None):
+		self.data = data
+		self.variables = list(variables)
+		self.stations = np.asarray(stations, dtype=np.int64)
+		self.days = np.asarray(days, dtype=np.int64)
+		self.path = path
+
+	@property
+	def shape(self):
+		return self.data.shape
+
+	## =============================== ##
+
+	@staticmethod
+	def _files(path):
+		return path + '.npy', path + '.json'
+
+	@classmethod
+	def create(cls, variables, stations, days, path=None):
+		"""
+		New cube filled with NaN, memory-mapped if a path is given.
+		"""
+		shape = (len(variables), len(stations), len(days))
+		if path is None:
+			data = np.full(shape, np.nan, dtype=np.float32)
+		else:
+			datafile, axesfile = cls._files(path)
+			data = np.lib.format.open_memmap(datafile, mode='w+', dtype=np.float32, shape=shape)
+			data[:] = np.nan
+			with open(axesfile, 'w') as f:
+				json.dump({'variables': list(variables), 'stations': [int(s) for s in stations], 'days': [int(d) for d in days]}, f)
+		return cls(data, variables, stations, days, path=path)
+
+	@classmethod
+	def open(cls, path, mode='r'):
+		"""
+		Memory-mapped cube stored at path, mode 'r' (read-only) or 'r+' (in-place updates).
+		"""
+		datafile, axesfile = cls._files(path)
+		with open(axesfile, 'r') as f:
+			axes = json.load(f)
+		data = np.load(datafile, mmap_mode=mode)
+		return cls(data, axes['variables'], axes['stations'], axes['days'], path=path)
+
+	def flush(self):
+		if isinstance(self.data, np.memmap):
+			self.data.flush()
+
+	## =============================== ##
+
+	@classmethod
+	def from_long(cls, df, variables, dims=('station', 'datetime'), path=None):
+		"""
+		Cube from a long table with one row per station and day. Missing station-days stay NaN; values are placed
+		by integer position instead of reindexing a MultiIndex.
+		"""
+		station_col, day_col = dims
+		stations = np.sort(df[station_col].unique())
+		days = np.sort(df[day_col].unique())
+		cube = cls.create(variables, stations, days, path=path)
+
+		i = np.searchsorted(stations, df[station_col].values)
+		j = np.searchsorted(days, df[day_col].values)
+		for v, variable in enumerate(variables):
+			cube.data[v, i, j] = df[variable].values
+		cube.flush()
+		return cube
+
+	def to_long(self, variables=None, dims=('station', 'datetime'), dropna=False):
+		"""
+		Long table sorted by station and day with one column per variable (the layout of the former expand_df).
+		"""
+		variables = self.variables if variables is None else list(variables)
+		nstations, ndays = self.stations.size, self.days.size
+		df = pd.DataFrame({\
+			dims[0]: np.repeat(self.stations, ndays),
+			dims[1]: np.tile(self.days, nstations),
+			})
+		for variable in variables:
+			df[variable] = np.asarray(self.variable(variable)).ravel()
+		if dropna:
+			df = df.dropna(subset=variables, how='all').reset_index(drop=True)
+		return df
+
+	## =============================== ##
+
+	def variable(self, variable):
+		"""
+		View (stations, days) of one variable, as used by the aggregation.
+		"""
+		return self.data[self.variables.index(variable)]
+
+	def day_matrix(self, variable):
+		"""
+		View (days, stations) of one variable as DataFrame, as used by the imputation.
+		"""
+		return pd.DataFrame(self.variable(variable).T, index=pd.Index(self.days, name='datetime'),
+			columns=pd.Index(self.stations, name='station'), copy=False)
+
+	def select(self, stations=None, days=None):
+		"""
+		Positions (station index, day slice) for a station list and a (first, last) YYYYMMDD day range. Raises
+		KeyError for stations not in the cube.
+		"""
+		if stations is None:
+			i = slice(None)
+		else:
+			stations = np.asarray(stations)
+			i = np.minimum(np.searchsorted(self.stations, stations), self.stations.size - 1)
+			missing = self.stations[i] != stations
+			if missing.any():
+				raise KeyError('Stations not in cube: {0:s}'.format(', '.join(str(s) for s in stations[missing][:10])))
+		j = slice(None) if days is None else slice(np.searchsorted(self.days, days[0]), np.searchsorted(self.days, days[1], side='right'))
+		return i, j
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pyarrow.dataset as ds
+
+## ============================================================================================= ##
+
+## hourly DWD station data, one Parquet file per root/variable=<v>/station=<id>/year=<yyyy>/
+PARTITIONING = ds.partitioning(pa.schema([\
+	('variable', pa.string()),
+	('station', pa.int32()),
+	('year', pa.int16()),
+	]), flavor='hive')
+
+## rows per row group, one month of hourly values; keeps datetime min/max statistics selective
+ROW_GROUP_SIZE = 24 * 31
+
+## ============================================================================================= ##
+
+def _partition(root, variable, station, year=None):
+	path = os.path.join(root, 'variable={0:s}'.format(variable), 'station={0:d}'.format(int(station)))
+	if year is not None:
+		path = os.path.join(path, 'year={0:d}'.format(int(year)))
+	return path
+
+def write_station(root, variable, station, df, replace=True):
+	"""
+	Store the hourly table of one station (datetime as int32 YYYYMMDDHH plus value columns), split into
+	yearly partitions and sorted by time. With replace=True existing partitions of the station are removed.
+	"""
+	if replace:
+		shutil.rmtree(_partition(root, variable, station), ignore_errors=True)
+
+	df = df.sort_values('datetime')
+	years = (df['datetime'].values // 1000000).astype(np.int16)
+	bounds = np.flatnonzero(np.diff(years)) + 1
+	for chunk in np.split(np.arange(len(df)), bounds):
+		if chunk.size == 0:
+			continue
+		path = _partition(root, variable, station, years[chunk[0]])
+		os.makedirs(path, exist_ok=True)
+		table = pa.Table.from_pandas(df.iloc[chunk], preserve_index=False)
+		pq.write_table(table, os.path.join(path, 'part-0.parquet'), row_group_size=ROW_GROUP_SIZE)
+
+def append_station(root, variable, station, df, after=None):
+	"""
+	Add the rows of df with datetime > after to a stored station, only the yearly partitions that receive new
+	rows are rewritten. Returns the first appended timestamp, or None if nothing was new.
+	"""
+	if after is not None:
+		df = df.loc[df['datetime'] > after, :]
+	if len(df) == 0:
+		return None
+	first = int(df['datetime'].min())
+
+	years = np.unique(df['datetime'].values // 1000000)
+	if os.path.isdir(_partition(root, variable, station)):
+		existing = read(root, variable, stations=[station], years=years, columns=list(df.columns))
+		df = pd.concat([existing.loc[:, df.columns].astype(df.dtypes.to_dict()), df], axis=0, ignore_index=True)
+		df = df.drop_duplicates(subset='datetime', keep='last')
+
+	for year in years:
+		shutil.rmtree(_partition(root, variable, station, year), ignore_errors=True)
+	write_station(root, variable, station, df, replace=False)
+	return first
+
+## ============================================================================================= ##
+
+def station_years(root, variable):
+	"""
+	Stations with their first and last year of data, answered from the partition directories alone.
+	"""
+	path = os.path.join(root, 'variable={0:s}'.format(variable))
+	rows = []
+	if os.path.isdir(path):
+		for s in os.listdir(path):
+			if not s.startswith('station='):
+				continue
+			years = [int(y.split('=')[1]) for y in os.listdir(os.path.join(path, s)) if y.startswith('year=')]
+			if len(years) > 0:
+				rows.append((int(s.split('=')[1]), min(years), max(years)))
+	df = pd.DataFrame(rows, columns=['station', 'year_first', 'year_last'])
+	return df.sort_values('station').reset_index(drop=True)
+
+def active_stations(root, variable, first_year=None, last_year=None):
+	"""
+	Stations whose record starts in or before first_year and reaches last_year.
+	"""
+	df = station_years(root, variable)
+	if first_year is not None:
+		df = df.loc[df['year_first'] <= first_year, :]
+	if last_year is not None:
+		df = df.loc[df['year_last'] >= last_year, :]
+	return df['station'].values
+
+def dataset(root):
+	return ds.dataset(root, format='parquet', partitioning=PARTITIONING)
+
+def read(root, variable, stations=None, years=None, columns=None, datetime_range=None):
+	"""
+	Read from the store with predicate pushdown. variable, stations and years prune partition directories,
+	datetime_range (YYYYMMDDHH bounds, inclusive) skips row groups by their statistics.
+	"""
+	expression = ds.field('variable') == variable
+	if stations is not None:
+		expression = expression & ds.field('station').isin([int(s) for s in stations])
+	if years is not None:
+		expression = expression & ds.field('year').isin([int(y) for y in years])
+	if datetime_range is not None:
+		expression = expression & (ds.field('datetime') >= datetime_range[0]) & (ds.field('datetime') <= datetime_range[1])
+	if columns is not None:
+		columns = list(dict.fromkeys(['station', 'datetime'] + list(columns)))
+	table = dataset(root).to_table(columns=columns, filter=expression)
+	return table.to_pandas().drop(columns=['variable', 'year'], errors='ignore')
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import scipy.sparse as sparse
+from scipy.spatial import cKDTree
+
+from distances import EARTH_RADIUS_KM, METHODS
+
+## ============================================================================================= ##
+
+## stations closer than this are treated as lying at this distance, avoids division by zero in idw
+MIN_DISTANCE_KM = 0.01
+
+SCHEMES = ['idw', 'nearest', 'cutoff']
+
+## bound of the relative difference between great-circle (EARTH_RADIUS_KM) and ellipsoidal distances
+SPHERE_DEVIATION = 0.01
+
+## part of the cache keys of stored weight matrices, raised whenever the selection of the weights changes
+VERSION = 2
+
+## ============================================================================================= ##
+
+def unit_vectors(lat, lon):
+	"""
+	3-D cartesian coordinates on the unit sphere for points given in degrees, shape (n, 3).
+	"""
+	lat, lon = np.radians(np.asarray(lat, dtype=np.float64)), np.radians(np.asarray(lon, dtype=np.float64))
+	return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+def km_to_chord(km):
+	return 2. * np.sin(np.asarray(km, dtype=np.float64) / (2. * EARTH_RADIUS_KM))
+
+def chord_to_km(chord):
+	return 2. * EARTH_RADIUS_KM * np.arcsin(np.clip(np.asarray(chord, dtype=np.float64) / 2., 0., 1.))
+
+## ============================================================================================= ##
+
+class StationIndex:
+	"""
+	KD-tree over station coordinates on the unit sphere. Queries return only the neighbours within a cutoff
+	and/or the k nearest stations as flat (row, column, distance in km) arrays, never a dense matrix.
+	"""
+
+	def __init__(self, lat, lon):
+		self.lat = np.asarray(lat, dtype=np.float64)
+		self.lon = np.asarray(lon, dtype=np.float64)
+		self.tree = cKDTree(unit_vectors(self.lat, self.lon))
+
+	def __len__(self):
+		return self.lat.size
+
+	def _spherical(self, xyz, radius=None, k=None):
+		"""
+		(rows, cols, chord) of the stations within radius (chord length, scalar or one per query point) and/or
+		the k nearest stations on the unit sphere.
+		"""
+		if k is not None:
+			k = min(int(k), len(self))
+			upper = np.inf if radius is None else radius
+			if np.ndim(upper) > 0:
+				upper = np.max(upper)
+			chord, cols = self.tree.query(xyz, k=k, distance_upper_bound=upper)
+			chord, cols = chord.reshape(len(xyz), k), cols.reshape(len(xyz), k)
+			rows = np.repeat(np.arange(len(xyz)), k)
+			chord, cols = chord.ravel(), cols.ravel()
+			valid = np.isfinite(chord)
+			return rows[valid], cols[valid].astype(np.int64), chord[valid]
+
+		neighbours = self.tree.query_ball_point(xyz, r=radius, return_sorted=True)
+		counts = np.fromiter((len(n) for n in neighbours), dtype=np.int64, count=len(neighbours))
+		rows = np.repeat(np.arange(len(xyz)), counts)
+		cols = np.fromiter((j for n in neighbours for j in n), dtype=np.int64, count=counts.sum())
+		chord = np.linalg.norm(xyz[rows] - self.tree.data[cols], axis=1)
+		return rows, cols, chord
+
+	def query(self, lat, lon, cutoff=None, k=None, method='haversine'):
+		"""
+		Neighbours of the query points (lat, lon) among the stations. cutoff in km limits the search radius,
+		k keeps only the k nearest stations (both may be combined). Cutoff and nearest stations refer to the
+		distances of method: for 'geodesic' the candidates come from a great-circle search widened by
+		SPHERE_DEVIATION and are selected by their ellipsoidal distance.
+		"""
+		if (cutoff is None) and (k is None):
+			raise ValueError('Either cutoff or k has to be given')
+
+		xyz = unit_vectors(lat, lon)
+
+		if method == 'haversine':
+			rows, cols, chord = self._spherical(xyz, radius=km_to_chord(cutoff) if cutoff is not None else None, k=k)
+			return rows, cols, chord_to_km(chord)
+
+		## great-circle radius per query point that contains every station within cutoff and all k nearest stations
+		radius = np.full(len(xyz), np.inf if cutoff is None else cutoff / (1. - SPHERE_DEVIATION))
+		if k is not None:
+			rows, _, chord = self._spherical(xyz, k=k)
+			kth = np.where(np.bincount(rows, minlength=len(xyz)) >= min(int(k), len(self)), 0., np.inf)
+			np.maximum.at(kth, rows, chord_to_km(chord))
+			radius = np.minimum(radius, kth * (1. + SPHERE_DEVIATION) / (1. - SPHERE_DEVIATION))
+		radius = km_to_chord(np.minimum(radius, np.pi * EARTH_RADIUS_KM))
+
+		rows, cols, _ = self._spherical(xyz, radius=radius)
+		lat, lon = np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64)
+		distances = METHODS[method](lat[rows], lon[rows], self.lat[cols], self.lon[cols])
+
+		keep = np.isfinite(distances)
+		if cutoff is not None:
+			keep &= distances <= cutoff
+		rows, cols, distances = rows[keep], cols[keep], distances[keep]
+		if k is not None:
+			order = np.lexsort((cols, distances, rows))
+			rows, cols, distances = rows[order], cols[order], distances[order]
+			rank = np.arange(rows.size) - np.searchsorted(rows, rows)
+			keep = rank < int(k)
+			rows, cols, distances = rows[keep], cols[keep], distances[keep]
+		return rows, cols, distances
+
+## ============================================================================================= ##
+
+def weight_matrix(lat, lon, station_lat, station_lon, scheme='idw', cutoff=100., k=None, power=2., method='haversine'):
+	"""
+	Row-normalized sparse CSR weight matrix of shape (n_targets, n_stations).
+
+	scheme
+		'idw'      inverse distance weights d^-power of all stations within cutoff km
+		'nearest'  inverse distance weights of the k nearest stations (optionally also limited to cutoff km)
+		'cutoff'   equal weights for all stations within cutoff km
+
+	Targets without any station in reach get an empty row.
+	"""
+	if scheme not in SCHEMES:
+		raise ValueError('Unknown weighting scheme {0:s}, choose from {1:s}'.format(scheme, ', '.join(SCHEMES)))
+	if (scheme == 'nearest') and (k is None):
+		raise ValueError("Weighting scheme 'nearest' requires k")
+
+	index = StationIndex(station_lat, station_lon)
+	rows, cols, distances = index.query(lat, lon,
+		cutoff=cutoff, k=k if scheme == 'nearest' else None, method=method)
+
+	if scheme == 'cutoff':
+		values = np.ones(distances.size)
+	else:
+		values = np.maximum(distances, MIN_DISTANCE_KM) ** -float(power)
+
+	shape = (len(np.atleast_1d(lat)), len(index))
+	weights = sparse.csr_matrix((values, (rows, cols)), shape=shape)
+	return normalize_rows(weights)
+
+def normalize_rows(weights):
+	"""
+	Scale every non-empty row of a sparse matrix to sum to one.
+	"""
+	weights = sparse.csr_matrix(weights, dtype=np.float64, copy=True)
+	row_sums = np.asarray(weights.sum(axis=1)).ravel()
+	scale = np.zeros_like(row_sums)
+	scale[row_sums > 0] = 1. / row_sums[row_sums > 0]
+	return (sparse.diags(scale) @ weights).tocsr()
+
+def apply_weights(weights, values):
+	"""
+	Weighted averages for all targets, values has shape (n_stations,) or (n_stations, n_timesteps).
+	Targets with an empty weight row are NaN.
+	"""
+	result = weights @ values
+	empty = np.diff(weights.indptr) == 0
+	if empty.any():
+		result = np.asarray(result, dtype=np.float64)
+		result[empty] = np.nan
+	return result
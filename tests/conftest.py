@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import subprocess
+
+import pytest
+
+TESTPATH = os.path.dirname(os.path.abspath(__file__))
+SCRIPTPATH = os.path.join(TESTPATH, '..', 'scripts')
+
+sys.path.insert(0, SCRIPTPATH)
+sys.path.insert(0, os.path.join(TESTPATH, '..', 'benchmarks'))
+
+import synthetic
+
+## ============================================================================================= ##
+
+YEARS = (2022, 2023)
+N_STATIONS = 12
+N_MUNICIPALITIES = 40
+
+def run_script(script, workdir, **settings):
+	"""
+	Run a pipeline script in workdir with settings as GEOCLIP_<name> overrides, as the pipeline runner does.
+	Returns the output; fails the test with the output if the script fails.
+	"""
+	from settings import environment
+
+	result = subprocess.run([sys.executable, os.path.join(SCRIPTPATH, script)], cwd=str(workdir),
+		env=dict(os.environ, **environment(settings)), capture_output=True, text=True)
+	if result.returncode != 0:
+		pytest.fail('{0:s} failed:\n{1:s}{2:s}'.format(script, result.stdout, result.stderr))
+	return result.stdout
+
+def write_imputed(workdir, stations, imputation, seed, variable='air_temperature'):
+	"""
+	Complete daily means of stations as p01 writes them for one imputation mode.
+	"""
+	df = synthetic.make_daily_panel(stations, YEARS, seed=seed)
+	path = os.path.join(str(workdir), 'dwd_cdc_hourly_2008-2023_{0:s}_daymean_imputed_{1:s}.csv'.format(variable, imputation))
+	df.to_csv(path, index=False)
+	return path
+
+@pytest.fixture
+def aggregation_dir(tmp_path):
+	"""
+	Working directory with everything p02 reads: stations.csv, imputed daily means for 'lasso' and
+	'neighbours' (different values) and a VG250_GEM layer.
+	"""
+	df_stations = synthetic.make_stations(N_STATIONS)
+	df_stations.to_csv(os.path.join(str(tmp_path), 'stations.csv'), index=False)
+	write_imputed(tmp_path, df_stations['station'].values, 'lasso', seed=1)
+	write_imputed(tmp_path, df_stations['station'].values, 'neighbours', seed=2)
+	synthetic.write_municipalities(str(tmp_path), N_MUNICIPALITIES)
+	return tmp_path
+
+## settings of p02 for the tests: no rollup (needs the upper level layers), no run reports
+P02_SETTINGS = {'ROLLUP': False, 'REPORT': False}
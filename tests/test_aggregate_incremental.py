@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from conftest import run_script, write_imputed, P02_SETTINGS, YEARS
+from aggregate import read_daily, input_keys, stale_years, write_input_keys
+
+## ============================================================================================= ##
+
+PANEL = 'data_gemeinde_2008-2023_air_temperature_daymean_invdistances_100km.parquet'
+
+def read_panel(workdir):
+	return read_daily(os.path.join(str(workdir), PANEL)).sort_values(['AGS', 'datetime']).reset_index(drop=True)
+
+## ============================================================================================= ##
+
+def test_stale_years():
+	days = np.array([20220101, 20220102, 20230101])
+	arrays = {'TT_TU': np.array([[1., 2., 3.], [4., 5., 6.]])}
+	keys = input_keys(arrays, days, setup='lasso')
+	assert sorted(keys['years']) == ['2022', '2023']
+	changed = {'TT_TU': arrays['TT_TU'].copy()}
+	changed['TT_TU'][1, 2] = 7.
+	assert input_keys(changed, days, setup='lasso')['years']['2022'] == keys['years']['2022']
+	assert input_keys(changed, days, setup='lasso')['years']['2023'] != keys['years']['2023']
+	assert input_keys(arrays, days, setup='neighbours')['setup'] != keys['setup']
+
+def test_stale_years_against_stored_keys(tmp_path):
+	outpath = os.path.join(str(tmp_path), 'panel.parquet')
+	days = np.array([20220101, 20230101])
+	keys = input_keys({'v': np.array([[1., 2.]])}, days, setup='lasso')
+	assert stale_years(outpath, keys) is None
+	os.makedirs(outpath)
+	write_input_keys(outpath, keys)
+	assert stale_years(outpath, keys) == []
+	assert stale_years(outpath, input_keys({'v': np.array([[1., 3.]])}, days, setup='lasso')) == [2023]
+	assert stale_years(outpath, input_keys({'v': np.array([[1., 2.]])}, days, setup=None)) is None
+
+def test_switching_imputation_rebuilds_panel(aggregation_dir):
+	run_script('p02_aggregate_invdist_stationdata.py', aggregation_dir, IMPUTATION='lasso', **P02_SETTINGS)
+	lasso = read_panel(aggregation_dir)
+
+	## incremental run (the default) with another imputation and a clean manifest
+	output = run_script('p02_aggregate_invdist_stationdata.py', aggregation_dir, IMPUTATION='neighbours', **P02_SETTINGS)
+	neighbours = read_panel(aggregation_dir)
+	assert 'Municipality-days written:  0' not in output
+	assert not np.allclose(lasso['TT_TU'].values, neighbours['TT_TU'].values, equal_nan=True)
+
+	run_script('p02_aggregate_invdist_stationdata.py', aggregation_dir, IMPUTATION='neighbours', INCREMENTAL=False, **P02_SETTINGS)
+	pd.testing.assert_frame_equal(neighbours, read_panel(aggregation_dir))
+
+def test_changed_input_year_is_rewritten(aggregation_dir):
+	run_script('p02_aggregate_invdist_stationdata.py', aggregation_dir, IMPUTATION='lasso', **P02_SETTINGS)
+	output = run_script('p02_aggregate_invdist_stationdata.py', aggregation_dir, IMPUTATION='lasso', **P02_SETTINGS)
+	assert 'Years updated:  []' in output
+
+	## a refit changes the imputed values of the last year only
+	path = os.path.join(str(aggregation_dir), 'dwd_cdc_hourly_2008-2023_air_temperature_daymean_imputed_lasso.csv')
+	df = pd.read_csv(path)
+	df.loc[df['datetime'] // 10000 == YEARS[-1], 'TT_TU'] += 1.
+	df.to_csv(path, index=False)
+	before = read_panel(aggregation_dir)
+
+	output = run_script('p02_aggregate_invdist_stationdata.py', aggregation_dir, IMPUTATION='lasso', **P02_SETTINGS)
+	assert 'Years updated:  [{0:d}]'.format(YEARS[-1]) in output
+	after = read_panel(aggregation_dir)
+	first = (after['datetime'] // 10000 == YEARS[0]).values
+	pd.testing.assert_frame_equal(before.loc[first], after.loc[first])
+	assert np.allclose(after.loc[~first, 'TT_TU'].values, before.loc[~first, 'TT_TU'].values + 1., atol=1e-4, equal_nan=True)
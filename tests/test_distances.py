@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+
+from distances import distance_matrix, haversine, vincenty
+
+## ============================================================================================= ##
+
+## municipality centroids and stations within and around Germany, plus a few long and degenerate pairs
+LAT_A = np.array([47.27, 54.91, 50.11, 52.52, 48.14, 51.0, 53.55])
+LON_A = np.array([5.87, 15.04, 8.68, 13.40, 11.58, 10.0, 9.99])
+LAT_B = np.array([47.27, 50.0, 49.0, 53.0, 36.5, -33.9, 51.0])
+LON_B = np.array([5.87, 9.0, 12.5, 7.5, 6.0, 151.2, 10.0001])
+
+def test_geodesic_matches_geopy():
+	from geopy.distance import geodesic
+
+	matrix = distance_matrix(LAT_A, LON_A, LAT_B, LON_B, method='geodesic', chunk_size=3)
+	expected = np.array([[geodesic((a, b), (c, d)).km for c, d in zip(LAT_B, LON_B)] for a, b in zip(LAT_A, LON_A)])
+	## within 1 mm
+	np.testing.assert_allclose(matrix, expected, rtol=0., atol=1.e-6)
+	assert matrix[0, 0] == 0.
+
+def test_haversine_close_to_geodesic():
+	geodesic = vincenty(LAT_A[:, None], LON_A[:, None], LAT_B[None, :], LON_B[None, :])
+	spherical = haversine(LAT_A[:, None], LON_A[:, None], LAT_B[None, :], LON_B[None, :])
+	nonzero = geodesic > 0.
+	assert np.all(np.abs(spherical[nonzero] / geodesic[nonzero] - 1.) < 0.005)
+
+def test_chunks_and_dtype():
+	full = distance_matrix(LAT_A, LON_A, LAT_B, LON_B, method='haversine')
+	chunked = distance_matrix(LAT_A, LON_A, LAT_B, LON_B, method='haversine', chunk_size=2, dtype=np.float32)
+	assert chunked.dtype == np.float32
+	np.testing.assert_allclose(chunked, full, rtol=1.e-6)
@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import io
+import os
+import sys
+import zipfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+import dwd_download
+from dwd_download import list_archives, download_file, download_all, read_meta
+
+## ============================================================================================= ##
+
+def make_zip(station, nrows=2000):
+	"""
+	Small stand-in for a DWD hourly archive: one product file of semicolon-separated rows.
+	"""
+	lines = ['STATIONS_ID;MESS_DATUM;QN_9;TT_TU;RF_TU;eor']
+	lines += ['{0:d};{1:d};3;{2:.1f};{3:.1f};eor'.format(station, 2020010100 + i % 24, 10. + i % 7, 80. + i % 5) for i in range(nrows)]
+	buffer = io.BytesIO()
+	with zipfile.ZipFile(buffer, 'w') as archive:
+		archive.writestr('produkt_tu_stunde_{0:05d}.txt'.format(station), '\n'.join(lines))
+	return buffer.getvalue()
+
+class ArchiveServer(ThreadingHTTPServer):
+	"""
+	Local stand-in for the DWD open data server: a directory listing at /, archives with Content-Length, ETag
+	and Range support. faults[name] is a list of failures applied to the next GET requests of a file, either an
+	HTTP status or 'truncate' (the connection is closed after half of the body).
+	"""
+
+	def __init__(self, files):
+		super().__init__(('127.0.0.1', 0), ArchiveHandler)
+		self.files = dict(files)
+		self.etags = {name: '"1"' for name in files}
+		self.faults = {}
+		self.requests = []
+
+	@property
+	def url(self):
+		return 'http://127.0.0.1:{0:d}/'.format(self.server_address[1])
+
+	def count(self, method, name):
+		return sum((m == method) and (n == name) for m, n, _ in self.requests)
+
+class ArchiveHandler(BaseHTTPRequestHandler):
+
+	def log_message(self, *args):
+		pass
+
+	def _send(self, head):
+		name = self.path.lstrip('/')
+		self.server.requests.append((self.command, name, self.headers.get('Range')))
+
+		if name == '':
+			body = ''.join('<a href="{0:s}">{0:s}</a>\n'.format(n) for n in sorted(self.server.files)).encode()
+			body += b'<a href="BESCHREIBUNG_obsgermany_climate_hourly_tu_de.pdf">x</a>\n'
+			self.send_response(200)
+			self.send_header('Content-Type', 'text/html')
+			self.send_header('Content-Length', str(len(body)))
+			self.end_headers()
+			self.wfile.write(body)
+			return
+
+		if name not in self.server.files:
+			self.send_error(404)
+			return
+
+		faults = self.server.faults.get(name, [])
+		fault = faults.pop(0) if (not head) and (len(faults) > 0) else None
+		if isinstance(fault, int):
+			self.send_error(fault)
+			return
+
+		data = self.server.files[name]
+		offset = 0
+		if (self.headers.get('Range') is not None) and (not head):
+			offset = int(self.headers.get('Range').split('=')[1].rstrip('-'))
+			self.send_response(206)
+			self.send_header('Content-Range', 'bytes {0:d}-{1:d}/{2:d}'.format(offset, len(data) - 1, len(data)))
+		else:
+			self.send_response(200)
+		self.send_header('Content-Length', str(len(data) - offset))
+		self.send_header('ETag', self.server.etags[name])
+		self.end_headers()
+		if head:
+			return
+		if fault == 'truncate':
+			self.wfile.write(data[offset:offset + (len(data) - offset) // 2])
+			self.wfile.flush()
+			self.close_connection = True
+			return
+		self.wfile.write(data[offset:])
+
+	def do_HEAD(self):
+		self._send(head=True)
+
+	def do_GET(self):
+		self._send(head=False)
+
+## ============================================================================================= ##
+
+NAMES = ['stundenwerte_TU_00003_19500401_20110331_hist.zip', 'stundenwerte_TU_00044_20070401_20231231_hist.zip']
+
+@pytest.fixture
+def server():
+	server = ArchiveServer({name: make_zip(i + 1) for i, name in enumerate(NAMES)})
+	thread = threading.Thread(target=server.serve_forever, daemon=True)
+	thread.start()
+	yield server
+	server.shutdown()
+	server.server_close()
+
+@pytest.fixture(autouse=True)
+def fresh_session():
+	## sessions are kept per thread, every test talks to its own server
+	dwd_download._local.session = None
+
+## ============================================================================================= ##
+
+def test_list_archives(server):
+	assert list_archives(server.url, pattern='stundenwerte') == NAMES
+
+def test_download_and_skip(server, tmp_path):
+	path = str(tmp_path / NAMES[0])
+	assert download_file(server.url + NAMES[0], path) == (path, True)
+	with open(path, 'rb') as f:
+		assert f.read() == server.files[NAMES[0]]
+	assert read_meta(path)['etag'] == '"1"'
+	assert not os.path.exists(path + '.part')
+
+	## an identical copy is only checked with a HEAD request
+	assert download_file(server.url + NAMES[0], path) == (path, False)
+	assert server.count('GET', NAMES[0]) == 1
+
+	## a new remote version (ETag) is downloaded again
+	server.files[NAMES[0]] = make_zip(1, nrows=3000)
+	server.etags[NAMES[0]] = '"2"'
+	assert download_file(server.url + NAMES[0], path) == (path, True)
+	with open(path, 'rb') as f:
+		assert f.read() == server.files[NAMES[0]]
+
+def test_resume_partial_file(server, tmp_path):
+	path = str(tmp_path / NAMES[0])
+	data = server.files[NAMES[0]]
+	with open(path + '.part', 'wb') as f:
+		f.write(data[:1000])
+	with open(path + '.part.meta', 'w') as f:
+		f.write('{"etag": "\\"1\\"", "size": %d}' % len(data))
+
+	assert download_file(server.url + NAMES[0], path, backoff=0.) == (path, True)
+	assert ('GET', NAMES[0], 'bytes=1000-') in server.requests
+	with open(path, 'rb') as f:
+		assert f.read() == data
+
+def test_partial_file_of_other_version_restarts(server, tmp_path):
+	path = str(tmp_path / NAMES[0])
+	with open(path + '.part', 'wb') as f:
+		f.write(b'x' * 1000)
+	with open(path + '.part.meta', 'w') as f:
+		f.write('{"etag": "\\"0\\""}')
+
+	assert download_file(server.url + NAMES[0], path, backoff=0.) == (path, True)
+	assert ('GET', NAMES[0], None) in server.requests
+	with open(path, 'rb') as f:
+		assert f.read() == server.files[NAMES[0]]
+
+def test_truncated_transfer_is_retried(server, tmp_path):
+	path = str(tmp_path / NAMES[1])
+	server.faults[NAMES[1]] = ['truncate']
+	assert download_file(server.url + NAMES[1], path, backoff=0.) == (path, True)
+	assert server.count('GET', NAMES[1]) == 2
+	with open(path, 'rb') as f:
+		assert f.read() == server.files[NAMES[1]]
+
+def test_server_error_is_retried(server, tmp_path):
+	path = str(tmp_path / NAMES[1])
+	server.faults[NAMES[1]] = [503, 429]
+	assert download_file(server.url + NAMES[1], path, backoff=0.) == (path, True)
+	assert server.count('GET', NAMES[1]) == 3
+
+def test_missing_archive_is_not_retried(server, tmp_path):
+	name = 'stundenwerte_TU_99999_20070401_20231231_hist.zip'
+	with pytest.raises(requests.HTTPError):
+		download_file(server.url + name, str(tmp_path / name), retries=5, backoff=10.)
+	assert server.count('HEAD', name) == 1
+
+def test_download_all_leaves_out_failures(server, tmp_path):
+	missing = 'stundenwerte_TU_99999_20070401_20231231_hist.zip'
+	results = download_all(server.url, NAMES + [missing], str(tmp_path), max_workers=2, backoff=0.)
+	assert sorted(results) == NAMES
+	assert all(downloaded for _, downloaded in results.values())
+	assert sorted(os.listdir(tmp_path)) == sorted(NAMES + [n + '.meta' for n in NAMES])
@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+
+from sklearn.linear_model import Lasso
+from sklearn.experimental import enable_iterative_imputer
+from sklearn.impute import IterativeImputer
+
+from imputation import transform_blocked
+
+## ============================================================================================= ##
+
+def correlated_days(ndays, nstations, seed=0):
+	rng = np.random.default_rng(seed)
+	values = rng.normal(0., 5., (ndays, 1)) + rng.normal(0., 1., (ndays, nstations))
+	values[rng.random(values.shape) < 0.2] = np.nan
+	return values
+
+@pytest.mark.filterwarnings('ignore::sklearn.exceptions.ConvergenceWarning')
+def test_blocked_equals_row_by_row():
+	imputer = IterativeImputer(estimator=Lasso(alpha=0.1), max_iter=5, random_state=0)
+	imputer.fit(correlated_days(200, 6))
+
+	values = correlated_days(40, 6, seed=1)
+	values[3] = np.nan
+	values[17] = np.nan
+	values[5, :5] = np.nan
+
+	blocked = transform_blocked(imputer, values, block_size=16, progress=False)
+	rowwise = np.vstack([imputer.transform(values[i:i + 1]) for i in range(values.shape[0])])
+	assert not np.isnan(blocked).any()
+	np.testing.assert_allclose(blocked, rowwise, rtol=0., atol=1e-10)
+	np.testing.assert_allclose(blocked[3], imputer.initial_imputer_.statistics_)
@@ -0,0 +1,29 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import scipy.sparse as sparse
+
+from matrix_cache import MatrixCache, content_hash
+
+## ============================================================================================= ##
+
+def test_sparse_entry_is_memory_mapped(tmp_path):
+	cache = MatrixCache(str(tmp_path))
+	matrix = sparse.random(50, 30, density=0.2, format='csr', random_state=0)
+	key = content_hash('weights', 1)
+	loaded = cache.get('weights', key, lambda: matrix)
+	assert sparse.issparse(loaded) and (loaded.shape == matrix.shape)
+	for a in ['data', 'indices', 'indptr']:
+		assert isinstance(getattr(loaded, a), np.memmap)
+	assert abs(loaded - matrix).max() == 0.
+	assert np.allclose(loaded @ np.arange(30.), matrix @ np.arange(30.))
+
+def test_dense_entry_and_stale_key(tmp_path):
+	cache = MatrixCache(str(tmp_path))
+	matrix = np.arange(12.).reshape(3, 4)
+	loaded = cache.get('dense', content_hash(1), lambda: matrix)
+	assert isinstance(loaded, np.memmap) and np.array_equal(loaded, matrix)
+	assert cache.contains('dense', content_hash(1))
+	cache.get('dense', content_hash(2), lambda: matrix + 1.)
+	assert not cache.contains('dense', content_hash(1))
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import P02_SETTINGS
+from pipeline import Pipeline, Stage
+from aggregate import read_daily
+
+## ============================================================================================= ##
+
+IMPUTED = 'dwd_cdc_hourly_2008-2023_air_temperature_daymean_imputed_lasso.csv'
+PANEL = 'data_gemeinde_2008-2023_air_temperature_daymean_invdistances_100km.parquet'
+
+def p02_stage():
+	return Stage('p02', 'p02_aggregate_invdist_stationdata.py',
+		inputs=[IMPUTED, 'stations.csv', 'VG250_GEM.shp'],
+		outputs=[PANEL, 'data_gemeinde_2008-2023_air_temperature_daymean_invdistances_100km.csv', 'stations.shp'],
+		settings=dict(IMPUTATION='lasso', **P02_SETTINGS))
+
+def read_panel(workdir):
+	return read_daily(os.path.join(str(workdir), PANEL)).sort_values(['AGS', 'datetime']).reset_index(drop=True)
+
+## ============================================================================================= ##
+
+def test_changed_input_reruns_and_rewrites(aggregation_dir):
+	pipeline = Pipeline([p02_stage()], workdir=str(aggregation_dir))
+	assert pipeline.run() == {'p02': 'ran'}
+	assert Pipeline([p02_stage()], workdir=str(aggregation_dir)).run() == {'p02': 'skipped'}
+	before = read_panel(aggregation_dir)
+
+	## new imputed values (e.g. a refit) reach the panel although the manifest marks nothing as changed
+	path = os.path.join(str(aggregation_dir), IMPUTED)
+	df = pd.read_csv(path)
+	df['TT_TU'] += 1.
+	df.to_csv(path, index=False)
+
+	assert Pipeline([p02_stage()], workdir=str(aggregation_dir)).run() == {'p02': 'ran'}
+	after = read_panel(aggregation_dir)
+	assert np.allclose(after['TT_TU'].values, before['TT_TU'].values + 1., atol=1e-4, equal_nan=True)
+
+def test_dependencies_and_cycles():
+	stages = [Stage('a', 'a.py', outputs=['x']), Stage('b', 'b.py', inputs=['x'], outputs=['y']), Stage('c', 'c.py', inputs=['y'])]
+	pipeline = Pipeline(stages, workdir='./')
+	assert pipeline.order == ['a', 'b', 'c']
+	assert pipeline.upstream(['b']) == ['a', 'b']
+	with pytest.raises(ValueError):
+		Pipeline([Stage('a', 'a.py', inputs=['y'], outputs=['x']), Stage('b', 'b.py', inputs=['x'], outputs=['y'])], workdir='./')
+	with pytest.raises(ValueError):
+		Pipeline([Stage('a', 'a.py', outputs=['x']), Stage('b', 'b.py', outputs=['x'])], workdir='./')
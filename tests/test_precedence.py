@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from precedence import precedence_table, precedence_frequencies, precedence_order, first_year_matrix
+
+## ============================================================================================= ##
+## the loops p_plot_sequences_NKI.py used before precedence.py, as reference
+## ============================================================================================= ##
+
+def sequence(df_prob):
+	cols = list(df_prob.columns)
+	rows = list(df_prob.index)
+	order = []
+	for n in range(df_prob.shape[0]):
+		counters = [0] * len(rows)
+		for i, dim1 in enumerate(rows):
+			for j, dim2 in enumerate([c for c in cols if c != dim1]):
+				if ((dim1 in df_prob.index) and (dim2 in df_prob.columns) and
+					(dim1 in df_prob.columns) and (dim2 in df_prob.index)):
+					if df_prob.loc[dim1, dim2] > df_prob.loc[dim2, dim1]:
+						counters[i] += 1
+		first = list(reversed([x for _, x in sorted(zip(counters, rows))]))[0]
+		order.append(first)
+		rows.remove(first)
+	return order
+
+def baseline_table(df_first, policies):
+	results = []
+	for policy in policies:
+		df1 = df_first.loc[df_first['project_type'] == policy, :]
+		for other_policy in [p for p in policies if p != policy]:
+			df2 = df_first.loc[df_first['project_type'] == other_policy, :]
+			df_both = df1.merge(df2, on='district_code', how='outer')
+			df_both['sequence'] = df_both['year_start_x'] < df_both['year_start_y']
+			results.append({'policy_first': policy, 'policy_second': other_policy, 'freq': df_both['sequence'].sum() / df1.shape[0]})
+	df_prob = pd.DataFrame(results).pivot_table(index=['policy_second'], columns=['policy_first'], values=['freq'])
+	df_prob = df_prob.T
+	df_prob.index = [s[1] for s in df_prob.index.values]
+	df_prob = df_prob * 100.
+	seq = sequence(df_prob)
+	return df_prob.loc[seq, seq]
+
+## ============================================================================================= ##
+
+def first_years(n_districts=30, n_policies=7, seed=0):
+	rng = np.random.default_rng(seed)
+	rows = []
+	for district in range(n_districts):
+		for policy in rng.choice(n_policies, size=rng.integers(1, n_policies + 1), replace=False):
+			rows.append({'district_code': 1000 + district, 'project_type': 'policy_{0:d}'.format(policy),
+				'year_start': int(rng.integers(2008, 2016))})
+	return pd.DataFrame(rows)
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_table_equals_baseline(seed):
+	df_first = first_years(seed=seed)
+	expected = baseline_table(df_first, df_first['project_type'].unique())
+	table = precedence_table(df_first)
+	assert list(table.index) == list(expected.index)
+	assert list(table.columns) == list(expected.columns)
+	np.testing.assert_allclose(table.values, expected.values.astype(np.float64), rtol=0., atol=1.e-12)
+
+def test_subset_equals_baseline():
+	df_first = first_years(seed=3)
+	items = ['policy_5', 'policy_0', 'policy_3']
+	expected = baseline_table(df_first.loc[df_first['project_type'].isin(items), :], items)
+	table = precedence_table(df_first, items=items)
+	assert list(table.index) == list(expected.index)
+	np.testing.assert_allclose(table.values, expected.values.astype(np.float64), rtol=0., atol=1.e-12)
+
+def test_order_equals_sequence_with_ties():
+	## a and b precede each other equally often, the tie is broken by name as sequence() does
+	df_first = pd.DataFrame({'district_code': [1, 1, 2, 2, 3], 'project_type': ['a', 'b', 'a', 'b', 'c'], 'year_start': [2010, 2011, 2012, 2011, 2009]})
+	_, items, years = first_year_matrix(df_first)
+	freq = precedence_frequencies(years)
+	expected = sequence(pd.DataFrame(freq * 100., index=items, columns=items))
+	assert list(items[precedence_order(freq, items)]) == expected
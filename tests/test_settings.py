@@ -0,0 +1,23 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+
+from conftest import run_script, P02_SETTINGS
+from settings import setting, environment, PREFIX
+
+## ============================================================================================= ##
+
+def test_setting_literals_and_strings(monkeypatch):
+	assert setting('TEST_UNSET', 100) == 100
+	for value in [True, None, 50, 75.5, ['VWG', 'KRS'], './data/']:
+		monkeypatch.setenv(*list(environment({'TEST_VALUE': value}).items())[0])
+		assert setting('TEST_VALUE', 0) == value
+	monkeypatch.setenv(PREFIX + 'TEST_VALUE', './data/')
+	assert setting('TEST_VALUE', None) == './data/'
+
+def test_float_distance_cutoff(aggregation_dir):
+	output = run_script('p02_aggregate_invdist_stationdata.py', aggregation_dir, IMPUTATION='lasso', DISTANCE_CUTOFF=75.5, **P02_SETTINGS)
+	assert 'within 75.5 km' in output
+	assert os.path.isfile(os.path.join(str(aggregation_dir), 'data_gemeinde_2008-2023_air_temperature_daymean_invdistances_75.5km.csv'))
+	assert os.path.isdir(os.path.join(str(aggregation_dir), 'data_gemeinde_2008-2023_air_temperature_daymean_invdistances_75.5km.parquet'))
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+
+from distances import distance_matrix
+from weights import weight_matrix, apply_weights, MIN_DISTANCE_KM
+
+## ============================================================================================= ##
+
+def points(n, seed):
+	rng = np.random.default_rng(seed)
+	return rng.uniform(47.3, 55., n), rng.uniform(5.9, 15., n)
+
+LAT, LON = points(60, 0)
+STATION_LAT, STATION_LON = points(25, 1)
+## a target on a station and one far from all stations
+LAT, LON = np.append(LAT, [STATION_LAT[3], 30.]), np.append(LON, [STATION_LON[3], 0.])
+
+def dense_weights(scheme, cutoff, k=None, power=2., method='haversine'):
+	"""
+	Reference: weights from the full distance matrix, as p02 computed them before the station index.
+	"""
+	distances = distance_matrix(LAT, LON, STATION_LAT, STATION_LON, method=method)
+	reach = distances <= (cutoff if cutoff is not None else np.inf)
+	if k is not None:
+		rank = np.argsort(np.argsort(distances, axis=1, kind='stable'), axis=1)
+		reach &= rank < k
+	if scheme == 'cutoff':
+		weights = reach.astype(np.float64)
+	else:
+		weights = np.where(reach, np.maximum(distances, MIN_DISTANCE_KM) ** -power, 0.)
+	sums = weights.sum(axis=1, keepdims=True)
+	return np.divide(weights, sums, out=np.zeros_like(weights), where=sums > 0)
+
+@pytest.mark.parametrize('scheme, cutoff, k, method', [\
+	('idw', 100., None, 'haversine'),
+	('idw', 150., None, 'geodesic'),
+	('cutoff', 100., None, 'haversine'),
+	('nearest', None, 4, 'haversine'),
+	('nearest', 120., 4, 'geodesic'),
+	])
+def test_sparse_equals_dense(scheme, cutoff, k, method):
+	sparse_weights = weight_matrix(LAT, LON, STATION_LAT, STATION_LON, scheme=scheme, cutoff=cutoff, k=k, method=method)
+	assert sparse_weights.shape == (LAT.size, STATION_LAT.size)
+	np.testing.assert_allclose(sparse_weights.toarray(), dense_weights(scheme, cutoff, k=k, method=method), rtol=1.e-9, atol=1.e-12)
+
+def test_empty_rows_are_nan():
+	weights = weight_matrix(LAT, LON, STATION_LAT, STATION_LON, scheme='idw', cutoff=100.)
+	values = np.arange(STATION_LAT.size, dtype=np.float64)
+	result = apply_weights(weights, values)
+	assert np.isnan(result[-1])
+	assert result[-2] == pytest.approx(values[3])
+
+def test_unknown_scheme():
+	with pytest.raises(ValueError):
+		weight_matrix(LAT, LON, STATION_LAT, STATION_LON, scheme='kriging')
+	with pytest.raises(ValueError):
+		weight_matrix(LAT, LON, STATION_LAT, STATION_LON, scheme='nearest', k=None)